@@ -0,0 +1,163 @@
+import os
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from models import Alumno, Asignatura, Docente, Nota, Promedio, matriculas
+
+load_dotenv()
+
+# Resúmenes académicos por usuario usados como contexto del chatbot.
+# Se invalidan al escribir notas/promedios/matrículas; el TTL solo acota datos cambiados por otras vías.
+ACADEMIC_SUMMARY_TTL = float(os.getenv("ACADEMIC_SUMMARY_TTL", "900"))
+# Máximo de asignaturas listadas en un resumen (mantiene el prompt acotado)
+_MAX_ASIGNATURAS = 25
+
+_summaries = TTLCache(4096, ACADEMIC_SUMMARY_TTL)
+
+
+def _fmt(valor: Optional[float]) -> str:
+    return f"{valor:.2f}" if valor is not None else "sin nota"
+
+
+def _build_alumno_summary(db: Session, alumno: Alumno) -> str:
+    from routers.alumno import get_base_ciclo
+
+    filas = (
+        db.query(
+            Asignatura.nombre,
+            Asignatura.ciclo,
+            Docente.nombre_completo,
+            func.count(Nota.id),
+            func.avg(Nota.calificacion),
+            func.max(Promedio.promedio_final),
+        )
+        .join(matriculas, matriculas.c.asignatura_id == Asignatura.id)
+        .join(Docente, Docente.id == Asignatura.docente_id)
+        .outerjoin(Nota, and_(
+            Nota.asignatura_id == Asignatura.id,
+            Nota.alumno_id == alumno.id,
+            Nota.publicada == True,
+        ))
+        .outerjoin(Promedio, and_(
+            Promedio.asignatura_id == Asignatura.id,
+            Promedio.alumno_id == alumno.id,
+        ))
+        .filter(
+            matriculas.c.alumno_id == alumno.id,
+            Asignatura.ciclo == get_base_ciclo(alumno.ciclo),
+        )
+        .group_by(Asignatura.id, Asignatura.nombre, Asignatura.ciclo, Docente.nombre_completo)
+        .order_by(Asignatura.nombre)
+        .limit(_MAX_ASIGNATURAS)
+        .all()
+    )
+
+    lineas = [f"Alumno: {alumno.nombre_completo}. Ciclo actual: {alumno.ciclo}."]
+    if not filas:
+        lineas.append("No tiene asignaturas matriculadas en el ciclo actual.")
+        return "\n".join(lineas)
+
+    lineas.append("Asignaturas del ciclo actual (solo notas publicadas, escala 0-20):")
+    pendientes = []
+    for nombre, _ciclo, docente, total, promedio_notas, promedio_final in filas:
+        promedio = promedio_final if promedio_final is not None else promedio_notas
+        lineas.append(f"- {nombre} (docente {docente}): {total} notas publicadas, promedio {_fmt(promedio)}")
+        if not total:
+            pendientes.append(nombre)
+    if pendientes:
+        lineas.append("Sin notas publicadas aún: " + ", ".join(pendientes) + ".")
+    return "\n".join(lineas)
+
+
+def _build_docente_summary(db: Session, docente: Docente) -> str:
+    asignaturas = (
+        db.query(Asignatura.id, Asignatura.nombre, Asignatura.ciclo)
+        .filter(Asignatura.docente_id == docente.id)
+        .order_by(Asignatura.ciclo, Asignatura.nombre)
+        .limit(_MAX_ASIGNATURAS)
+        .all()
+    )
+
+    lineas = [f"Docente: {docente.nombre_completo}."]
+    if not asignaturas:
+        lineas.append("No tiene asignaturas asignadas.")
+        return "\n".join(lineas)
+
+    ids = [a.id for a in asignaturas]
+    matriculados = dict(
+        db.query(matriculas.c.asignatura_id, func.count(matriculas.c.alumno_id))
+        .filter(matriculas.c.asignatura_id.in_(ids))
+        .group_by(matriculas.c.asignatura_id)
+        .all()
+    )
+    notas = {
+        fila[0]: fila[1:]
+        for fila in db.query(
+            Nota.asignatura_id,
+            func.count(Nota.id),
+            func.avg(Nota.calificacion),
+            func.sum(case((Nota.publicada == False, 1), else_=0)),
+            func.count(func.distinct(Nota.alumno_id)),
+        )
+        .filter(Nota.asignatura_id.in_(ids))
+        .group_by(Nota.asignatura_id)
+        .all()
+    }
+
+    lineas.append("Asignaturas a cargo (escala 0-20):")
+    for asignatura_id, nombre, ciclo in asignaturas:
+        total_alumnos = matriculados.get(asignatura_id, 0)
+        total_notas, promedio, sin_publicar, alumnos_con_nota = notas.get(asignatura_id, (0, None, 0, 0))
+        lineas.append(
+            f"- {nombre} (ciclo {ciclo}): {total_alumnos} alumnos, {total_notas} notas registradas, "
+            f"promedio general {_fmt(promedio)}, {sin_publicar or 0} notas sin publicar, "
+            f"{max(total_alumnos - alumnos_con_nota, 0)} alumnos sin ninguna nota"
+        )
+    return "\n".join(lineas)
+
+
+def get_alumno_summary(db: Session, alumno: Alumno) -> str:
+    """Resumen compacto de asignaturas, promedios y pendientes del alumno (cacheado)"""
+    key = ("alumno", alumno.id)
+    resumen = _summaries.get(key)
+    if resumen is None:
+        resumen = _build_alumno_summary(db, alumno)
+        _summaries.set(key, resumen)
+    return resumen
+
+
+def get_docente_summary(db: Session, docente: Docente) -> str:
+    """Resumen compacto de las asignaturas del docente y sus notas (cacheado)"""
+    key = ("docente", docente.id)
+    resumen = _summaries.get(key)
+    if resumen is None:
+        resumen = _build_docente_summary(db, docente)
+        _summaries.set(key, resumen)
+    return resumen
+
+
+def invalidate_summaries(alumno_ids: Iterable[int] = (), docente_ids: Iterable[int] = ()) -> None:
+    """Descartar los resúmenes afectados por una escritura de notas, promedios o matrículas"""
+    for alumno_id in alumno_ids:
+        _summaries.pop(("alumno", alumno_id))
+    for docente_id in docente_ids:
+        _summaries.pop(("docente", docente_id))
+
+
+def invalidate_asignatura_summaries(db: Session, asignatura_id: int) -> None:
+    """Descartar los resúmenes del docente y de todos los alumnos matriculados en una asignatura"""
+    alumno_ids = [
+        fila[0] for fila in db.query(matriculas.c.alumno_id)
+        .filter(matriculas.c.asignatura_id == asignatura_id)
+        .all()
+    ]
+    docente_ids = [fila[0] for fila in db.query(Asignatura.docente_id).filter(Asignatura.id == asignatura_id).all()]
+    invalidate_summaries(alumno_ids, docente_ids)
+
+
+def academic_summary_stats() -> dict:
+    return _summaries.stats()
@@ -0,0 +1,211 @@
+import json
+import os
+from typing import Dict, Iterable, List
+
+from dotenv import load_dotenv
+from sqlalchemy import Integer, case, cast, func, select
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from models import Alumno, AnaliticaAsignatura, Asignatura, Docente, Nota, matriculas
+
+load_dotenv()
+
+PASSING_GRADE = int(os.getenv("PASSING_GRADE", "11"))
+# La respuesta agregada se descarta en cada recálculo; el TTL solo acota lo que otro worker haya cambiado
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+# Un punto por casillero: 0, 1, ..., 20
+_BINS = 21
+_BATCH = 500
+
+_analytics_cache = TTLCache(1, ANALYTICS_CACHE_TTL)
+
+
+def _chunks(items: List[int], size: int = _BATCH):
+    for inicio in range(0, len(items), size):
+        yield items[inicio:inicio + size]
+
+
+def _calcular(db: Session, asignatura_ids: List[int]) -> Dict[int, dict]:
+    """Agregados de las asignaturas indicadas (consultas agrupadas, sin recorrer filas en Python)"""
+    filas = {
+        a: {"matriculados": 0, "alumnos_evaluados": 0, "aprobados": 0, "notas_registradas": 0,
+            "notas_publicadas": 0, "suma_publicadas": 0.0, "histograma": [0] * _BINS}
+        for a in asignatura_ids
+    }
+
+    for asignatura_id, total in (
+        db.query(matriculas.c.asignatura_id, func.count())
+        .filter(matriculas.c.asignatura_id.in_(asignatura_ids))
+        .group_by(matriculas.c.asignatura_id)
+    ):
+        filas[asignatura_id]["matriculados"] = total
+
+    for asignatura_id, registradas, publicadas, suma in (
+        db.query(
+            Nota.asignatura_id,
+            func.count(Nota.id),
+            func.sum(case((Nota.publicada == True, 1), else_=0)),
+            func.sum(case((Nota.publicada == True, Nota.calificacion), else_=0.0)),
+        )
+        .filter(Nota.asignatura_id.in_(asignatura_ids))
+        .group_by(Nota.asignatura_id)
+    ):
+        filas[asignatura_id].update(notas_registradas=registradas, notas_publicadas=publicadas or 0, suma_publicadas=suma or 0.0)
+
+    # Aprobado: nota publicada máxima >= PASSING_GRADE (mismo criterio que el avance de ciclo)
+    maximas = (
+        select(Nota.asignatura_id, func.max(Nota.calificacion).label("maxima"))
+        .where(Nota.asignatura_id.in_(asignatura_ids), Nota.publicada == True)
+        .group_by(Nota.asignatura_id, Nota.alumno_id)
+        .subquery()
+    )
+    for asignatura_id, evaluados, aprobados in db.execute(
+        select(
+            maximas.c.asignatura_id,
+            func.count(),
+            func.sum(case((maximas.c.maxima >= PASSING_GRADE, 1), else_=0)),
+        ).group_by(maximas.c.asignatura_id)
+    ):
+        filas[asignatura_id].update(alumnos_evaluados=evaluados, aprobados=aprobados or 0)
+
+    casillero = cast(Nota.calificacion, Integer)
+    for asignatura_id, punto, total in (
+        db.query(Nota.asignatura_id, casillero, func.count())
+        .filter(Nota.asignatura_id.in_(asignatura_ids), Nota.publicada == True)
+        .group_by(Nota.asignatura_id, casillero)
+    ):
+        filas[asignatura_id]["histograma"][min(max(punto, 0), _BINS - 1)] += total
+    return filas
+
+
+def refresh_subject_stats(db: Session, asignatura_ids: Iterable[int]) -> None:
+    """Recalcular los agregados de las asignaturas afectadas por una escritura ya confirmada"""
+    ids = sorted({a for a in asignatura_ids if a is not None})
+    for lote in _chunks(ids):
+        existentes = [a for (a,) in db.query(Asignatura.id).filter(Asignatura.id.in_(lote))]
+        db.query(AnaliticaAsignatura).filter(AnaliticaAsignatura.asignatura_id.in_(lote)).delete(synchronize_session=False)
+        if existentes:
+            db.bulk_insert_mappings(AnaliticaAsignatura, [
+                {"asignatura_id": a, **{k: (json.dumps(v) if k == "histograma" else v) for k, v in fila.items()}}
+                for a, fila in _calcular(db, existentes).items()
+            ])
+    db.commit()
+    invalidate_analytics()
+
+
+def student_subject_ids(db: Session, alumno_id: int) -> List[int]:
+    """Asignaturas cuyos agregados cambian si se elimina el alumno (matrículas o notas)"""
+    matriculadas = db.query(matriculas.c.asignatura_id).filter(matriculas.c.alumno_id == alumno_id)
+    con_notas = db.query(Nota.asignatura_id).filter(Nota.alumno_id == alumno_id)
+    return [a for (a,) in matriculadas.union(con_notas)]
+
+
+def rebuild_analytics(db: Session) -> int:
+    ids = [a for (a,) in db.query(Asignatura.id)]
+    db.query(AnaliticaAsignatura).delete(synchronize_session=False)
+    refresh_subject_stats(db, ids)
+    return len(ids)
+
+
+def ensure_analytics() -> None:
+    """Poblar la tabla de agregados si está vacía (p. ej. la primera vez tras crearla)"""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if db.query(AnaliticaAsignatura.asignatura_id).first() is None and db.query(Asignatura.id).first() is not None:
+            rebuild_analytics(db)
+    finally:
+        db.close()
+
+
+def invalidate_analytics() -> None:
+    """Descartar la respuesta agregada (p. ej. tras reasignar el docente o el ciclo de una asignatura)"""
+    _analytics_cache.clear()
+
+
+def get_totals(db: Session) -> dict:
+    """Conteos generales del sistema en una sola consulta"""
+    total_alumnos, total_docentes, total_asignaturas, total_notas = db.execute(select(
+        select(func.count(Alumno.id)).scalar_subquery(),
+        select(func.count(Docente.id)).scalar_subquery(),
+        select(func.count(Asignatura.id)).scalar_subquery(),
+        select(func.count(Nota.id)).scalar_subquery(),
+    )).one()
+    return {
+        "total_alumnos": total_alumnos,
+        "total_docentes": total_docentes,
+        "total_asignaturas": total_asignaturas,
+        "total_notas": total_notas,
+    }
+
+
+def _acumular(destino: dict, fila: dict) -> None:
+    for clave in ("matriculados", "alumnos_evaluados", "aprobados", "notas_registradas", "notas_publicadas", "suma_publicadas"):
+        destino[clave] = destino.get(clave, 0) + fila[clave]
+    destino["histograma"] = [a + b for a, b in zip(destino.get("histograma", [0] * _BINS), fila["histograma"])]
+    destino["asignaturas"] = destino.get("asignaturas", 0) + 1
+
+
+def _indicadores(fila: dict) -> dict:
+    fila = dict(fila)
+    suma = fila.pop("suma_publicadas")
+    evaluados = fila["alumnos_evaluados"]
+    fila["desaprobados"] = evaluados - fila["aprobados"]
+    fila["tasa_aprobacion"] = round(fila["aprobados"] / evaluados, 4) if evaluados else None
+    fila["promedio"] = round(suma / fila["notas_publicadas"], 2) if fila["notas_publicadas"] else None
+    fila["notas_sin_publicar"] = fila["notas_registradas"] - fila["notas_publicadas"]
+    return fila
+
+
+def _build_analytics(db: Session) -> dict:
+    filas = (
+        db.query(AnaliticaAsignatura, Asignatura.nombre, Asignatura.ciclo, Docente.id, Docente.nombre_completo)
+        .join(Asignatura, Asignatura.id == AnaliticaAsignatura.asignatura_id)
+        .outerjoin(Docente, Docente.id == Asignatura.docente_id)
+        .order_by(Asignatura.ciclo, Asignatura.nombre)
+        .all()
+    )
+    asignaturas, ciclos, docentes = [], {}, {}
+    for agregado, nombre, ciclo, docente_id, docente in filas:
+        fila = {
+            "matriculados": agregado.matriculados,
+            "alumnos_evaluados": agregado.alumnos_evaluados,
+            "aprobados": agregado.aprobados,
+            "notas_registradas": agregado.notas_registradas,
+            "notas_publicadas": agregado.notas_publicadas,
+            "suma_publicadas": agregado.suma_publicadas,
+            "histograma": json.loads(agregado.histograma),
+        }
+        asignaturas.append({
+            "asignatura_id": agregado.asignatura_id,
+            "nombre": nombre,
+            "ciclo": ciclo,
+            "docente_id": docente_id,
+            "docente": docente,
+            **_indicadores(fila),
+        })
+        _acumular(ciclos.setdefault(ciclo, {"ciclo": ciclo}), fila)
+        _acumular(docentes.setdefault(docente_id, {"docente_id": docente_id, "docente": docente}), fila)
+
+    return {
+        "umbral_aprobacion": PASSING_GRADE,
+        "totales": get_totals(db),
+        "asignaturas": asignaturas,
+        "ciclos": [_indicadores(c) for c in ciclos.values()],
+        "docentes": sorted((_indicadores(d) for d in docentes.values()), key=lambda d: d["docente"] or ""),
+    }
+
+
+def get_analytics(db: Session) -> dict:
+    """Analítica por asignatura, ciclo y docente leída de los agregados precalculados (cacheada)"""
+    analitica = _analytics_cache.get("admin")
+    if analitica is None:
+        analitica = _build_analytics(db)
+        _analytics_cache.set("admin", analitica)
+    return analitica
+
+
+def analytics_cache_stats() -> dict:
+    return _analytics_cache.stats()
@@ -1,13 +1,17 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
 from database import get_db
-from models import Usuario
+from models import Usuario, Alumno, Docente, RefreshToken
+from cache import TTLCache
+from hashing import pwd_context
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,13 +20,23 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "tu-clave-secreta-muy-segura-aqui")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-# Configuración de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Vigencia del refresh token; se renueva en cada rotación (sesión deslizante)
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
 
 # Configuración de autenticación
 security = HTTPBearer()
 
+# Caché por proceso de la identidad (usuario + perfil de alumno/docente).
+# TTL corto: con varios workers cada uno mantiene su copia y la invalidación es local.
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "30"))
+_identity_cache = TTLCache(maxsize=2048, ttl=IDENTITY_CACHE_TTL)
+
+# Caché acotada de tokens ya validados (token -> claims)
+CLAIMS_CACHE_TTL = float(os.getenv("CLAIMS_CACHE_TTL", "300"))
+_claims_cache = TTLCache(maxsize=4096, ttl=CLAIMS_CACHE_TTL)
+
+# Versiones síncronas para scripts (init_db, create_admin...). En los endpoints usar
+# hashing.verify_password_async / get_password_hash_async para no bloquear el event loop.
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verificar contraseña"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -43,39 +57,172 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[str]:
-    """Verificar token JWT y devolver email"""
+def create_refresh_token(db: Session, user: Usuario, family: Optional[str] = None) -> str:
+    """Crear un refresh token y registrarlo en la BD (el llamador hace commit).
+    `family` agrupa los tokens rotados a partir de un mismo login."""
+    jti = uuid.uuid4().hex
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    db.add(RefreshToken(
+        jti=jti,
+        family=family or uuid.uuid4().hex,
+        usuario_id=user.id,
+        expires_at=expires_at
+    ))
+    to_encode = {"sub": user.email, "uid": user.id, "type": "refresh", "jti": jti, "exp": expires_at}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def rotate_refresh_token(db: Session, refresh_token: str):
+    """Validar un refresh token, revocarlo y emitir uno nuevo de la misma familia.
+    Devuelve (usuario, nuevo_refresh_token). Si se presenta un token ya rotado
+    se revoca toda la familia, pues indica que el token fue reutilizado."""
+    try:
+        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise _credentials_exception()
+    if payload.get("type") != "refresh" or not payload.get("jti"):
+        raise _credentials_exception()
+
+    record = db.query(RefreshToken).filter(RefreshToken.jti == payload["jti"]).first()
+    if record is None:
+        raise _credentials_exception()
+    if record.revoked:
+        db.query(RefreshToken).filter(RefreshToken.family == record.family).update(
+            {RefreshToken.revoked: True}, synchronize_session=False
+        )
+        db.commit()
+        raise _credentials_exception()
+    if record.expires_at < datetime.utcnow():
+        raise _credentials_exception()
+
+    user = db.query(Usuario).filter(Usuario.id == record.usuario_id).first()
+    if user is None or not user.activo:
+        raise _credentials_exception()
+
+    record.revoked = True
+    new_token = create_refresh_token(db, user, family=record.family)
+    db.commit()
+    return user, new_token
+
+def revoke_refresh_tokens(db: Session, usuario_id: int, family: Optional[str] = None) -> int:
+    """Revocar los refresh tokens de un usuario (o solo los de una familia). El llamador hace commit."""
+    query = db.query(RefreshToken).filter(
+        RefreshToken.usuario_id == usuario_id,
+        RefreshToken.revoked == False
+    )
+    if family:
+        query = query.filter(RefreshToken.family == family)
+    return query.update({RefreshToken.revoked: True}, synchronize_session=False)
+
+def token_claims(user: Usuario) -> dict:
+    """Claims que viajan en el token: permiten autorizar por rol sin consultar la BD"""
+    return {"sub": user.email, "uid": user.id, "rol": user.rol, "activo": bool(user.activo)}
+
+def decode_token(token: str) -> Optional[dict]:
+    """Decodificar y validar el token JWT. Los claims ya validados se guardan en caché
+    hasta su expiración (como máximo CLAIMS_CACHE_TTL segundos)."""
+    payload = _claims_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        return email
     except JWTError:
         return None
+    if payload.get("sub") is None:
+        return None
+    exp = payload.get("exp")
+    ttl = CLAIMS_CACHE_TTL
+    if exp is not None:
+        ttl = min(ttl, exp - time.time())
+    if ttl > 0:
+        _claims_cache.set(token, payload, ttl=ttl)
+    return payload
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> Usuario:
-    """Obtener usuario actual desde token"""
-    credentials_exception = HTTPException(
+def verify_token(token: str) -> Optional[str]:
+    """Verificar token JWT y devolver email"""
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    return payload.get("sub")
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Obtener los claims del token actual (sin acceder a la base de datos)"""
+    payload = decode_token(credentials.credentials)
+    # Un refresh token no sirve como token de acceso
+    if payload is None or payload.get("type") == "refresh":
+        raise _credentials_exception()
+    return payload
+
+def _resolve_user(db: Session, claims: dict) -> Usuario:
+    """Obtener el usuario (con su perfil de rol) desde la caché de identidad o la BD"""
+    email = claims["sub"]
+    uid = claims.get("uid")
+    key = uid if uid is not None else email
+
+    snapshot = _identity_cache.get(key)
+    if snapshot is not None:
+        return _attach_identity(db, snapshot)
+
+    # Usuario y perfil de rol en una sola consulta
+    query = db.query(Usuario).options(
+        joinedload(Usuario.alumno),
+        joinedload(Usuario.docente)
+    )
+    if uid is not None:
+        user = query.filter(Usuario.id == uid).first()
+    else:
+        user = query.filter(Usuario.email == email).first()
+    # Un cambio de email invalida los tokens emitidos con el email anterior
+    if user is None or user.email != email:
+        raise _credentials_exception()
     
-    token = credentials.credentials
-    email = verify_token(token)
-    if email is None:
-        raise credentials_exception
-    
-    user = db.query(Usuario).filter(Usuario.email == email).first()
-    if user is None:
-        raise credentials_exception
-    
+    _identity_cache.set(key, _snapshot_identity(user))
     return user
 
+def get_current_user(
+    claims: dict = Depends(get_token_claims),
+    db: Session = Depends(get_db)
+) -> Usuario:
+    """Obtener usuario actual desde token"""
+    return _resolve_user(db, claims)
+
+def _column_values(obj) -> dict:
+    return {attr.key: getattr(obj, attr.key) for attr in sa_inspect(obj).mapper.column_attrs}
+
+def _snapshot_identity(user: Usuario) -> dict:
+    """Copia plana (sin estado de sesión) del usuario y su perfil para guardar en caché"""
+    return {
+        "usuario": _column_values(user),
+        "alumno": _column_values(user.alumno) if user.alumno else None,
+        "docente": _column_values(user.docente) if user.docente else None,
+    }
+
+def _attach_identity(db: Session, snapshot: dict) -> Usuario:
+    """Reconstruir la identidad cacheada y asociarla a la sesión sin consultar la BD"""
+    user = Usuario(**snapshot["usuario"])
+    user.alumno = Alumno(**snapshot["alumno"]) if snapshot["alumno"] else None
+    user.docente = Docente(**snapshot["docente"]) if snapshot["docente"] else None
+    for obj in (user, user.alumno, user.docente):
+        if obj is not None:
+            make_transient_to_detached(obj)
+    return db.merge(user, load=False)
+
+def invalidate_identity(usuario_id: int) -> None:
+    """Descartar la identidad y los claims cacheados de un usuario.
+    Llamar tras cambios de perfil, rol, contraseña o al desactivarlo."""
+    _identity_cache.discard_if(lambda _key, snap: snap["usuario"]["id"] == usuario_id)
+    _claims_cache.discard_if(lambda _token, claims: claims.get("uid") == usuario_id)
+
+def auth_cache_stats() -> dict:
+    """Estadísticas de las cachés de autenticación"""
+    return {"claims": _claims_cache.stats(), "identity": _identity_cache.stats()}
+
 def get_current_active_user(current_user: Usuario = Depends(get_current_user)) -> Usuario:
     """Obtener usuario activo actual"""
     if not current_user.activo:
@@ -85,21 +232,53 @@ def get_current_active_user(current_user: Usuario = Depends(get_current_user)) -
 def require_role(required_role):
     """Decorador para requerir uno o varios roles.
     Acepta un `str` ("admin") o una lista/tupla (["admin", "docente"]).
+    El rol y el estado del token se comprueban antes de cargar el usuario,
+    así las peticiones sin permiso se rechazan sin acceder a la BD.
     """
-    def role_checker(current_user: Usuario = Depends(get_current_active_user)) -> Usuario:
-        # Normalizar a conjunto de roles permitidos
-        if isinstance(required_role, (list, tuple, set)):
-            allowed = set(required_role)
-            if current_user.rol not in allowed:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="No tienes permisos suficientes"
-                )
-        else:
-            if current_user.rol != required_role:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="No tienes permisos suficientes"
-                )
+    # Normalizar a conjunto de roles permitidos
+    if isinstance(required_role, (list, tuple, set)):
+        allowed = set(required_role)
+    else:
+        allowed = {required_role}
+
+    def forbidden() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos suficientes"
+        )
+
+    def role_checker(
+        claims: dict = Depends(get_token_claims),
+        db: Session = Depends(get_db)
+    ) -> Usuario:
+        # Tokens antiguos sin "rol"/"activo" se validan solo contra el usuario
+        if "rol" in claims and claims["rol"] not in allowed:
+            raise forbidden()
+        if claims.get("activo") is False:
+            raise HTTPException(status_code=400, detail="Usuario inactivo")
+
+        current_user = _resolve_user(db, claims)
+        if not current_user.activo:
+            raise HTTPException(status_code=400, detail="Usuario inactivo")
+        if current_user.rol not in allowed:
+            raise forbidden()
         return current_user
     return role_checker
+
+def get_current_docente(current_user: Usuario = Depends(require_role("docente"))) -> Docente:
+    """Obtener el perfil de docente del usuario actual (cargado junto con el usuario)"""
+    if current_user.docente is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Docente no encontrado"
+        )
+    return current_user.docente
+
+def get_current_alumno(current_user: Usuario = Depends(require_role("alumno"))) -> Alumno:
+    """Obtener el perfil de alumno del usuario actual (cargado junto con el usuario)"""
+    if current_user.alumno is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Alumno no encontrado"
+        )
+    return current_user.alumno
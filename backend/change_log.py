@@ -0,0 +1,188 @@
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import func, text, tuple_
+from sqlalchemy.orm import Session
+
+from models import CambioRegistro, Nota, Promedio, matriculas
+
+load_dotenv()
+
+# Días que se conservan las entradas del registro; un cursor más antiguo obliga a recargar todo
+CAMBIOS_RETENCION_DIAS = int(os.getenv("CAMBIOS_RETENCION_DIAS", "30"))
+# Entradas del registro leídas por respuesta; con más pendientes el cliente vuelve a pedir con el cursor
+CAMBIOS_LIMITE = int(os.getenv("CAMBIOS_LIMITE", "1000"))
+_BATCH = 500
+
+# tabla -> expresión de fila_id en el trigger (matriculas no tiene id propio)
+_TABLAS = {"notas": "{ref}.id", "promedios": "{ref}.id", "matriculas": "NULL"}
+_TRIGGERS = (("insert", "INSERT", "NEW", "I"), ("update", "UPDATE", "NEW", "U"), ("delete", "DELETE", "OLD", "D"))
+
+
+def _chunks(items: Sequence, size: int = _BATCH):
+    for inicio in range(0, len(items), size):
+        yield items[inicio:inicio + size]
+
+
+def _registrar(tabla: str, ref: str, operacion: str) -> str:
+    return (
+        "INSERT INTO cambios (tabla, fila_id, alumno_id, asignatura_id, operacion) VALUES "
+        f"('{tabla}', {_TABLAS[tabla].format(ref=ref)}, {ref}.alumno_id, {ref}.asignatura_id, '{operacion}');"
+    )
+
+
+def ensure_change_log() -> None:
+    """Crear los triggers del registro de cambios y descartar las entradas vencidas.
+
+    Se ejecuta en cada arranque: ensure_foreign_keys reconstruye tablas y con ellas se pierden sus triggers.
+    """
+    from database import engine
+
+    with engine.begin() as conn:
+        for tabla in _TABLAS:
+            for nombre, evento, ref, operacion in _TRIGGERS:
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS cambios_{tabla}_{nombre} AFTER {evento} ON {tabla} "
+                    f"BEGIN {_registrar(tabla, ref, operacion)} END"
+                ))
+            # Si una fila cambia de alumno o asignatura, quien la veía antes también debe enterarse
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS cambios_{tabla}_update_origen AFTER UPDATE ON {tabla} "
+                "WHEN OLD.alumno_id IS NOT NEW.alumno_id OR OLD.asignatura_id IS NOT NEW.asignatura_id "
+                f"BEGIN {_registrar(tabla, 'OLD', 'D')} END"
+            ))
+        conn.execute(
+            text("DELETE FROM cambios WHERE fecha < datetime('now', :antiguedad)"),
+            {"antiguedad": f"-{CAMBIOS_RETENCION_DIAS} days"},
+        )
+
+
+def current_cursor(db: Session) -> int:
+    """Último id asignado del registro (también si las entradas ya se descartaron)"""
+    ultimo = db.query(func.max(CambioRegistro.id)).scalar()
+    if ultimo is None:
+        ultimo = db.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'cambios'")).scalar()
+    return ultimo or 0
+
+
+def _nota(nota: Nota) -> dict:
+    return {
+        "id": nota.id,
+        "alumno_id": nota.alumno_id,
+        "asignatura_id": nota.asignatura_id,
+        "calificacion": nota.calificacion,
+        "tipo_nota": nota.tipo_nota,
+        "fecha_registro": nota.fecha_registro,
+        "publicada": nota.publicada,
+    }
+
+
+def _promedio(promedio: Promedio) -> dict:
+    return {
+        "id": promedio.id,
+        "alumno_id": promedio.alumno_id,
+        "asignatura_id": promedio.asignatura_id,
+        "actividades": promedio.actividades,
+        "practicas": promedio.practicas,
+        "parciales": promedio.parciales,
+        "examen_final": promedio.examen_final,
+        "promedio_final": promedio.promedio_final,
+        "fecha_actualizacion": promedio.fecha_actualizacion or promedio.fecha_registro,
+    }
+
+
+def _visible(fila, alumno_id: Optional[int], asignatura_ids: Optional[set]) -> bool:
+    if alumno_id is not None and fila.alumno_id != alumno_id:
+        return False
+    return asignatura_ids is None or fila.asignatura_id in asignatura_ids
+
+
+def changes_since(db: Session, since: Optional[int], alumno_id: Optional[int] = None,
+                  asignatura_ids: Optional[Iterable[int]] = None, solo_publicadas: bool = False,
+                  limite: int = CAMBIOS_LIMITE) -> dict:
+    """Notas, promedios y matrículas modificados después del cursor `since`, dentro del alcance indicado.
+
+    Se devuelve el estado actual de cada fila tocada (varias escrituras sobre la misma fila llegan una
+    sola vez); las que ya no existen o dejaron de ser visibles (p. ej. una nota despublicada) van como
+    eliminadas. Sin `since` solo se devuelve el cursor actual, para usar tras la carga completa.
+    Si el cursor es anterior a lo que conserva el registro (o no es válido), `reiniciar` indica que hay que recargar todo.
+    """
+    # El cursor se lee antes que las entradas: lo que se escriba entre ambas lecturas queda incluido
+    ultimo = current_cursor(db)
+    respuesta = {
+        "cursor": ultimo,
+        "completo": True,
+        "reiniciar": False,
+        "notas": {"actualizadas": [], "eliminadas": []},
+        "promedios": {"actualizados": [], "eliminados": []},
+        "matriculas": {"agregadas": [], "eliminadas": []},
+    }
+    if since is None or since == ultimo:
+        return respuesta
+    primero = db.query(func.min(CambioRegistro.id)).scalar()
+    # Cursor ya descartado por la retención, o de otra base de datos
+    if since < 0 or since > ultimo or primero is None or since < primero - 1:
+        respuesta["reiniciar"] = True
+        return respuesta
+
+    asignaturas = None if asignatura_ids is None else set(asignatura_ids)
+    consulta = db.query(
+        CambioRegistro.id, CambioRegistro.tabla, CambioRegistro.fila_id,
+        CambioRegistro.alumno_id, CambioRegistro.asignatura_id,
+    ).filter(CambioRegistro.id > since)
+    if alumno_id is not None:
+        consulta = consulta.filter(CambioRegistro.alumno_id == alumno_id)
+    if asignaturas is not None:
+        consulta = consulta.filter(CambioRegistro.asignatura_id.in_(sorted(asignaturas)))
+    entradas = consulta.order_by(CambioRegistro.id).limit(limite + 1).all()
+
+    if len(entradas) > limite:
+        entradas = entradas[:limite]
+        respuesta["cursor"] = entradas[-1].id
+        respuesta["completo"] = False
+    elif entradas:
+        respuesta["cursor"] = max(ultimo, entradas[-1].id)
+
+    tocadas: Dict[str, set] = {"notas": set(), "promedios": set()}
+    pares: set = set()
+    for entrada in entradas:
+        if entrada.tabla == "matriculas":
+            pares.add((entrada.alumno_id, entrada.asignatura_id))
+        else:
+            tocadas[entrada.tabla].add(entrada.fila_id)
+
+    notas_ids = sorted(tocadas["notas"])
+    vigentes = set()
+    for lote in _chunks(notas_ids):
+        consulta = db.query(Nota).filter(Nota.id.in_(lote))
+        if solo_publicadas:
+            consulta = consulta.filter(Nota.publicada == True)
+        for nota in consulta:
+            if _visible(nota, alumno_id, asignaturas):
+                vigentes.add(nota.id)
+                respuesta["notas"]["actualizadas"].append(_nota(nota))
+    respuesta["notas"]["eliminadas"] = [i for i in notas_ids if i not in vigentes]
+
+    promedios_ids = sorted(tocadas["promedios"])
+    vigentes = set()
+    for lote in _chunks(promedios_ids):
+        for promedio in db.query(Promedio).filter(Promedio.id.in_(lote)):
+            if _visible(promedio, alumno_id, asignaturas):
+                vigentes.add(promedio.id)
+                respuesta["promedios"]["actualizados"].append(_promedio(promedio))
+    respuesta["promedios"]["eliminados"] = [i for i in promedios_ids if i not in vigentes]
+
+    pares_ordenados: List[Tuple[int, int]] = sorted(pares)
+    existentes = set()
+    # Dos variables por par: lotes de la mitad para no pasar el límite de SQLite
+    for lote in _chunks(pares_ordenados, _BATCH // 2):
+        existentes.update(
+            (a, s) for a, s in db.query(matriculas.c.alumno_id, matriculas.c.asignatura_id).filter(
+                tuple_(matriculas.c.alumno_id, matriculas.c.asignatura_id).in_(lote)
+            )
+        )
+    for alumno, asignatura in pares_ordenados:
+        destino = "agregadas" if (alumno, asignatura) in existentes else "eliminadas"
+        respuesta["matriculas"][destino].append({"alumno_id": alumno, "asignatura_id": asignatura})
+    return respuesta
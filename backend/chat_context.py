@@ -0,0 +1,118 @@
+import hashlib
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from cache import TTLCache
+
+load_dotenv()
+
+# Respuestas cacheadas por (rol, prompt de sistema, pregunta normalizada)
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "512"))
+# Presupuesto aproximado de tokens para el historial enviado al proveedor
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+# Tope por mensaje individual (tokens aproximados)
+CHAT_MESSAGE_TOKEN_LIMIT = int(os.getenv("CHAT_MESSAGE_TOKEN_LIMIT", "800"))
+
+_response_cache = TTLCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL)
+_stats = {"tokens_ahorrados_cache": 0, "tokens_recortados": 0, "historiales_recortados": 0}
+
+# Palabras que no cambian el sentido de la pregunta
+_STOPWORDS = {
+    "a", "al", "como", "con", "cual", "cuales", "de", "del", "donde", "el", "en", "es", "esta",
+    "estan", "la", "las", "lo", "los", "me", "mi", "mis", "para", "por", "puedo", "que", "se",
+    "su", "sus", "un", "una", "y", "yo", "hola", "favor", "porfavor", "gracias", "quiero",
+    "saber", "ver", "tengo",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token)"""
+    return max(1, len(text) // 4)
+
+
+def normalize_prompt(text: str) -> str:
+    """Reducir una pregunta a sus palabras significativas (sin tildes, signos, mayúsculas ni orden)"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    palabras = re.findall(r"[a-z0-9]+", text)
+    return " ".join(sorted({p for p in palabras if p not in _STOPWORDS}))
+
+
+def cache_key(role: str, system_prompt: str, messages: List[Dict[str, str]], model: str, temperature: Optional[float]) -> Optional[str]:
+    """Clave de caché, o None si la respuesta depende de la conversación previa"""
+    preguntas = [m for m in messages if m["role"] != "system"]
+    if len(preguntas) != 1 or preguntas[0]["role"] != "user":
+        return None
+    normalizada = normalize_prompt(preguntas[0]["content"])
+    if not normalizada:
+        return None
+    prompt_hash = hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()
+    return f"{role}:{prompt_hash}:{model}:{temperature}:{normalizada}"
+
+
+def get_cached_reply(key: Optional[str], messages: List[Dict[str, str]]) -> Optional[str]:
+    if key is None:
+        return None
+    reply = _response_cache.get(key)
+    if reply is not None:
+        _stats["tokens_ahorrados_cache"] += sum(estimate_tokens(m["content"]) for m in messages) + estimate_tokens(reply)
+    return reply
+
+
+def store_reply(key: Optional[str], reply: str) -> None:
+    if key is not None and reply:
+        _response_cache.set(key, reply)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + " [...]"
+
+
+def trim_history(messages: List[Dict[str, str]], budget: int = CHAT_HISTORY_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    """Ajustar el historial al presupuesto de tokens.
+
+    Se conservan el prompt de sistema y los mensajes más recientes; los más antiguos
+    se reemplazan por un resumen breve con el inicio de cada pregunta del usuario.
+    """
+    system = [m for m in messages if m["role"] == "system"]
+    conversacion = [
+        {"role": m["role"], "content": _truncate(m["content"], CHAT_MESSAGE_TOKEN_LIMIT)}
+        for m in messages if m["role"] != "system"
+    ]
+    original = sum(estimate_tokens(m["content"]) for m in messages)
+
+    disponible = budget - sum(estimate_tokens(m["content"]) for m in system)
+    recientes: List[Dict[str, str]] = []
+    for m in reversed(conversacion):
+        costo = estimate_tokens(m["content"])
+        if recientes and costo > disponible:
+            break
+        recientes.insert(0, m)
+        disponible -= costo
+
+    descartados = conversacion[:len(conversacion) - len(recientes)]
+    resultado = list(system)
+    if descartados:
+        temas = [m["content"][:80] for m in descartados if m["role"] == "user"]
+        resumen = "Resumen de la conversación previa: el usuario preguntó por " + "; ".join(temas) if temas else ""
+        if resumen:
+            resultado.append({"role": "system", "content": _truncate(resumen, max(disponible, 50))})
+        _stats["historiales_recortados"] += 1
+    resultado.extend(recientes)
+
+    recortados = original - sum(estimate_tokens(m["content"]) for m in resultado)
+    if recortados > 0:
+        _stats["tokens_recortados"] += recortados
+    return resultado
+
+
+def chat_cache_stats() -> dict:
+    return {"cache": _response_cache.stats(), **_stats}
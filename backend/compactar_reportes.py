@@ -0,0 +1,51 @@
+"""Compactar el almacenamiento de reportes.
+
+Migra al almacén en disco el contenido de reportes que aún vive en la base de datos,
+elimina blobs sin referencias y ejecuta VACUUM para devolver el espacio de sistema_notas.db.
+
+Uso: python compactar_reportes.py
+"""
+import os
+
+from sqlalchemy import func, text
+
+from database import engine, SessionLocal, Base, DB_PATH, ensure_columns
+from models import ReporteArchivoDocente
+from report_store import ensure_blob, collect_garbage, report_store_stats
+
+
+def _mb(path: str) -> str:
+    return f"{os.path.getsize(path) / (1024 * 1024):.2f} MB"
+
+
+def compactar():
+    Base.metadata.create_all(bind=engine)
+    ensure_columns("reportes_docentes_archivos", {"sha256": "VARCHAR(64)", "size": "INTEGER"})
+    antes = _mb(DB_PATH)
+    db = SessionLocal()
+    try:
+        pendientes = db.query(ReporteArchivoDocente).filter(func.length(ReporteArchivoDocente.content) > 0).all()
+        migrados = 0
+        for archivo in pendientes:
+            if ensure_blob(db, archivo) is not None:
+                migrados += 1
+        print(f"Archivos migrados al almacén: {migrados}")
+
+        resultado = collect_garbage(db)
+        print(f"Blobs sin referencias eliminados: {resultado['blobs_eliminados']}")
+        print(f"Archivos huérfanos eliminados: {resultado['archivos_huerfanos_eliminados']}")
+        stats = report_store_stats(db)
+    finally:
+        db.close()
+
+    # VACUUM no puede ejecutarse dentro de una transacción
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM"))
+
+    print(f"Blobs: {stats['blobs']} ({stats['referencias']} referencias), "
+          f"{stats['bytes_originales']} bytes originales, {stats['bytes_en_disco']} en disco")
+    print(f"Base de datos: {antes} -> {_mb(DB_PATH)}")
+
+
+if __name__ == "__main__":
+    compactar()
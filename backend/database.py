@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -22,6 +22,24 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
 )
 
+
+def enable_sqlite_foreign_keys(target_engine):
+    """Activar en cada conexión la verificación de claves foráneas (SQLite la trae desactivada).
+
+    Sin esto los ON DELETE CASCADE / SET NULL de los modelos no se aplican.
+    """
+    if target_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(target_engine, "connect")
+    def _foreign_keys_on(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+enable_sqlite_foreign_keys(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -32,3 +50,93 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def ensure_columns(table: str, columns: dict):
+    """Agregar columnas nuevas a una tabla existente (create_all no altera tablas ya creadas).
+
+    `columns` es {nombre: definición SQL}, p. ej. {"version": "INTEGER NOT NULL DEFAULT 1"}.
+    """
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(engine)
+    if not inspector.has_table(table):
+        return
+    existentes = {c["name"] for c in inspector.get_columns(table)}
+    with engine.begin() as conn:
+        for nombre, definicion in columns.items():
+            if nombre not in existentes:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {nombre} {definicion}"))
+
+
+def ensure_indexes():
+    """Crear los índices declarados en los modelos que falten en tablas ya existentes"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _foreign_keys_desactualizadas(inspector, table) -> bool:
+    actuales = {
+        (tuple(fk["constrained_columns"]), fk["referred_table"], (fk.get("options", {}).get("ondelete") or "").upper())
+        for fk in inspector.get_foreign_keys(table.name)
+    }
+    esperadas = {
+        (tuple(c.name for c in fk.columns), fk.referred_table.name, (fk.ondelete or "").upper())
+        for fk in table.foreign_key_constraints
+    }
+    if actuales != esperadas:
+        return True
+    nulabilidad = {c["name"]: c["nullable"] for c in inspector.get_columns(table.name)}
+    return any(
+        c.name in nulabilidad and nulabilidad[c.name] != c.nullable
+        for c in table.columns if c.foreign_keys and not c.primary_key
+    )
+
+
+def ensure_foreign_keys():
+    """Recrear las tablas cuyas claves foráneas no coinciden con los modelos (ON DELETE, nulabilidad).
+
+    SQLite no permite alterar restricciones: se copia cada tabla a una nueva con el esquema actual
+    (procedimiento recomendado por SQLite), todo en una transacción y con las claves foráneas desactivadas.
+    """
+    import re
+    from sqlalchemy import inspect
+    from sqlalchemy.schema import CreateIndex, CreateTable
+
+    if engine.dialect.name != "sqlite":
+        return
+    inspector = inspect(engine)
+    pendientes = [
+        table for table in Base.metadata.sorted_tables
+        if inspector.has_table(table.name) and _foreign_keys_desactualizadas(inspector, table)
+    ]
+    if not pendientes:
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Debe ejecutarse fuera de la transacción para tener efecto
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            conn.exec_driver_sql("BEGIN")
+            for table in pendientes:
+                existentes = {c["name"] for c in inspector.get_columns(table.name)}
+                columnas = ", ".join(c.name for c in table.columns if c.name in existentes)
+                temporal = f"_{table.name}_nueva"
+                ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+                ddl = re.sub(rf"CREATE TABLE {table.name} \(", f"CREATE TABLE {temporal} (", ddl, count=1)
+                conn.exec_driver_sql(ddl)
+                conn.exec_driver_sql(f"INSERT INTO {temporal} ({columnas}) SELECT {columnas} FROM {table.name}")
+                conn.exec_driver_sql(f"DROP TABLE {table.name}")
+                conn.exec_driver_sql(f"ALTER TABLE {temporal} RENAME TO {table.name}")
+                for index in table.indexes:
+                    conn.exec_driver_sql(str(CreateIndex(index).compile(dialect=engine.dialect)))
+            huerfanas = conn.exec_driver_sql("PRAGMA foreign_key_check").fetchall()
+            if huerfanas:
+                print(f"[DB] Advertencia: {len(huerfanas)} filas con referencias inexistentes: {huerfanas[:10]}")
+            conn.exec_driver_sql("COMMIT")
+            print(f"[DB] Claves foráneas actualizadas en: {', '.join(t.name for t in pendientes)}")
+        except Exception:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
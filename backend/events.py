@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+# Broker compartido opcional (varios workers/instancias). Sin él los eventos solo llegan a las
+# conexiones abiertas en el mismo proceso que hizo la publicación.
+EVENTOS_REDIS_URL = os.getenv("EVENTOS_REDIS_URL", "")
+# Eventos pendientes por conexión; si un cliente no los consume a tiempo se le pide recargar
+EVENTOS_COLA = int(os.getenv("EVENTOS_COLA", "100"))
+# Segundos entre comentarios de keep-alive (mantienen abierta la conexión detrás de proxies)
+EVENTOS_HEARTBEAT = float(os.getenv("EVENTOS_HEARTBEAT", "15"))
+_CANAL = "eventos:notas"
+
+_stats = {"publicados": 0, "entregados": 0, "descartados": 0}
+
+
+class Suscripcion:
+    """Conexión abierta de un cliente. `alumno_id` None recibe todos los eventos (administrador)."""
+
+    def __init__(self, alumno_id: Optional[int] = None):
+        self.alumno_id = alumno_id
+        self.loop = asyncio.get_running_loop()
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=EVENTOS_COLA)
+        self.desbordada = False
+
+    def _entregar(self, evento: dict) -> None:
+        # Un alumno solo ve su propio id, no el del resto de la asignatura
+        if self.alumno_id is not None:
+            evento = {**evento, "alumno_ids": [self.alumno_id]}
+        try:
+            self.cola.put_nowait(evento)
+            _stats["entregados"] += 1
+        except asyncio.QueueFull:
+            self.desbordada = True
+            _stats["descartados"] += 1
+
+
+class LocalBroker:
+    """Pub/sub en memoria del proceso (suplente local del broker compartido)."""
+
+    def __init__(self):
+        # Conexiones por alumno_id; la clave None agrupa a las que reciben todo
+        self._suscripciones: Dict[Optional[int], Set[Suscripcion]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, suscripcion: Suscripcion) -> None:
+        with self._lock:
+            self._suscripciones.setdefault(suscripcion.alumno_id, set()).add(suscripcion)
+
+    def unsubscribe(self, suscripcion: Suscripcion) -> None:
+        with self._lock:
+            grupo = self._suscripciones.get(suscripcion.alumno_id)
+            if grupo is not None:
+                grupo.discard(suscripcion)
+                if not grupo:
+                    del self._suscripciones[suscripcion.alumno_id]
+
+    def publish(self, evento: dict) -> None:
+        self.deliver(evento)
+
+    def deliver(self, evento: dict) -> None:
+        """Entregar a las conexiones de este proceso; seguro desde cualquier hilo"""
+        with self._lock:
+            suscripciones = list(self._suscripciones.get(None, ()))
+            for alumno_id in evento.get("alumno_ids", ()):
+                suscripciones.extend(self._suscripciones.get(alumno_id, ()))
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion._entregar, evento)
+            except RuntimeError:
+                # El loop de esa conexión ya se cerró
+                self.unsubscribe(suscripcion)
+
+    def subscribers(self) -> int:
+        with self._lock:
+            return sum(len(grupo) for grupo in self._suscripciones.values())
+
+    def close(self) -> None:
+        pass
+
+
+class RedisBroker(LocalBroker):
+    """Publica en un canal de Redis; cada worker entrega lo recibido a sus propias conexiones."""
+
+    def __init__(self, url: str):
+        super().__init__()
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{_CANAL: self._recibir})
+        self._hilo = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _recibir(self, mensaje) -> None:
+        try:
+            self.deliver(json.loads(mensaje["data"]))
+        except Exception as e:
+            print(f"[Eventos] Mensaje descartado: {e}")
+
+    def publish(self, evento: dict) -> None:
+        try:
+            self._client.publish(_CANAL, json.dumps(evento, default=str))
+        except Exception as e:
+            # Sin Redis al menos se avisa a las conexiones de este worker
+            print(f"[Eventos] Redis no disponible ({e}), entrega solo local")
+            self.deliver(evento)
+
+    def close(self) -> None:
+        self._hilo.stop()
+        self._pubsub.close()
+
+
+def build_broker():
+    if EVENTOS_REDIS_URL and redis is not None:
+        try:
+            broker = RedisBroker(EVENTOS_REDIS_URL)
+            broker._client.ping()
+            return broker
+        except Exception as e:
+            print(f"Eventos: Redis no disponible ({e}), usando memoria local")
+    return LocalBroker()
+
+
+_broker_state = {"broker": None}
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    with _broker_lock:
+        if _broker_state["broker"] is None:
+            _broker_state["broker"] = build_broker()
+        return _broker_state["broker"]
+
+
+def close_broker() -> None:
+    with _broker_lock:
+        broker, _broker_state["broker"] = _broker_state["broker"], None
+    if broker is not None:
+        broker.close()
+
+
+def publish_grades_event(tipo: str, asignatura_id: int, asignatura: str, alumno_ids: Iterable[int], notas: int) -> None:
+    """Avisar que se publicaron o despublicaron notas (llamar después del commit).
+
+    El evento solo avisa: el cliente vuelve a pedir sus notas (o los cambios desde su cursor).
+    """
+    alumno_ids = sorted(set(alumno_ids))
+    if not alumno_ids:
+        return
+    _stats["publicados"] += 1
+    get_broker().publish({
+        "tipo": tipo,
+        "asignatura_id": asignatura_id,
+        "asignatura": asignatura,
+        "alumno_ids": alumno_ids,
+        "notas": notas,
+    })
+
+
+def events_stats() -> dict:
+    broker = _broker_state["broker"]
+    return {
+        **_stats,
+        "broker": type(broker).__name__ if broker else None,
+        "conexiones": broker.subscribers() if broker else 0,
+    }
@@ -0,0 +1,128 @@
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Alumno, Asignatura, Nota
+
+# Casilleros del histograma: [0, 1), [1, 2), ..., [20, 21) -> un punto por casillero, igual que la analítica
+_BORDES = list(range(0, 22))
+_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+# Una fila por nota; los campos se usan como columnas (notas["calificacion"], ...)
+_DTYPE_NOTAS = [("alumno_id", "i8"), ("asignatura_id", "i8"), ("calificacion", "f8"), ("tipo_nota", "O")]
+
+
+def load_grades(db: Session, asignatura_ids: List[int], solo_publicadas: bool = False,
+                por_fecha: bool = False) -> "np.ndarray":
+    """Cargar en bloque las notas de las asignaturas indicadas en un arreglo estructurado de NumPy.
+
+    Con `por_fecha` las filas quedan en orden de registro (la última nota de un tipo es la más reciente).
+    Se lee con el cursor del driver: construir filas del ORM cuesta más que el cálculo completo.
+    """
+    consulta = select(Nota.alumno_id, Nota.asignatura_id, Nota.calificacion, Nota.tipo_nota).where(
+        Nota.asignatura_id.in_(asignatura_ids)
+    )
+    if solo_publicadas:
+        consulta = consulta.where(Nota.publicada == True)
+    if por_fecha:
+        consulta = consulta.order_by(Nota.fecha_registro, Nota.id)
+    compilada = consulta.compile(db.get_bind(), compile_kwargs={"render_postcompile": True})
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(compilada.string, [compilada.params[k] for k in compilada.positiontup])
+        return np.fromiter(cursor, dtype=_DTYPE_NOTAS)
+    finally:
+        cursor.close()
+
+
+def _resumen(valores: "np.ndarray") -> dict:
+    if valores.size == 0:
+        return {"cantidad": 0, "media": None, "desviacion": None, "minimo": None, "maximo": None,
+                "percentiles": {str(p): None for p in _PERCENTILES}}
+    return {
+        "cantidad": int(valores.size),
+        "media": round(float(valores.mean()), 2),
+        # Desviación poblacional: describe al grupo completo, no a una muestra
+        "desviacion": round(float(valores.std()), 2),
+        "minimo": round(float(valores.min()), 2),
+        "maximo": round(float(valores.max()), 2),
+        "percentiles": {str(p): round(float(v), 2) for p, v in zip(_PERCENTILES, np.percentile(valores, _PERCENTILES))},
+    }
+
+
+def _promedios_por_grupo(claves: "np.ndarray", valores: "np.ndarray"):
+    """(claves únicas, promedio y cantidad por clave) con bincount en lugar de un bucle por grupo"""
+    unicas, indice = np.unique(claves, return_inverse=True)
+    cantidades = np.bincount(indice, minlength=unicas.size)
+    sumas = np.bincount(indice, weights=valores, minlength=unicas.size)
+    return unicas, sumas / np.maximum(cantidades, 1), cantidades
+
+
+def rank_scores(puntajes: "np.ndarray"):
+    """Puesto (1 = mejor; empates comparten puesto, estilo 1-2-2-4) y percentil de cada puntaje.
+
+    El percentil es el porcentaje del grupo con puntaje menor o igual.
+    """
+    ordenados = np.sort(puntajes)
+    menores_o_iguales = np.searchsorted(ordenados, puntajes, side="right")
+    puestos = puntajes.size - menores_o_iguales + 1
+    percentiles = menores_o_iguales * 100.0 / max(puntajes.size, 1)
+    return puestos, percentiles
+
+
+def grade_statistics(notas: "np.ndarray") -> dict:
+    """Distribución, estadísticos y ranking (por promedio de cada alumno) calculados en forma vectorizada"""
+    calificaciones = notas["calificacion"]
+    conteos, _ = np.histogram(calificaciones, bins=_BORDES)
+
+    tipos, media_tipo, cantidad_tipo, desviacion_tipo = [], [], [], []
+    if notas.size:
+        tipos, indice = np.unique(notas["tipo_nota"].astype(str), return_inverse=True)
+        cantidad_tipo = np.bincount(indice)
+        media_tipo = np.bincount(indice, weights=calificaciones) / cantidad_tipo
+        varianza = np.bincount(indice, weights=calificaciones ** 2) / cantidad_tipo - media_tipo ** 2
+        desviacion_tipo = np.sqrt(np.maximum(varianza, 0))
+
+    alumnos, promedios, cantidades = _promedios_por_grupo(notas["alumno_id"], calificaciones)
+    puestos, percentiles = rank_scores(promedios)
+    orden = np.lexsort((alumnos, puestos))
+
+    return {
+        "notas": _resumen(calificaciones),
+        "promedios_alumnos": _resumen(promedios),
+        "histograma": {"bordes": _BORDES, "conteos": conteos.tolist()},
+        "por_tipo": [
+            {"tipo_nota": str(t), "cantidad": int(c), "media": round(float(m), 2), "desviacion": round(float(d), 2)}
+            for t, c, m, d in zip(tipos, cantidad_tipo, media_tipo, desviacion_tipo)
+        ] if len(tipos) else [],
+        "ranking": [
+            {
+                "alumno_id": int(alumnos[i]),
+                "promedio": round(float(promedios[i]), 2),
+                "notas": int(cantidades[i]),
+                "puesto": int(puestos[i]),
+                "percentil": round(float(percentiles[i]), 1),
+            }
+            for i in orden
+        ],
+    }
+
+
+def subject_statistics(db: Session, asignatura_ids: List[int], solo_publicadas: bool = False) -> dict:
+    """Estadísticas de una o varias asignaturas con el nombre de cada alumno en el ranking"""
+    estadisticas = grade_statistics(load_grades(db, asignatura_ids, solo_publicadas))
+    ids = [fila["alumno_id"] for fila in estadisticas["ranking"]]
+    nombres = dict(db.query(Alumno.id, Alumno.nombre_completo).filter(Alumno.id.in_(ids)).all()) if ids else {}
+    for fila in estadisticas["ranking"]:
+        fila["nombre_alumno"] = nombres.get(fila["alumno_id"])
+    return estadisticas
+
+
+def cycle_subject_ids(db: Session, ciclo: str, docente_id: Optional[int] = None) -> List[int]:
+    consulta = db.query(Asignatura.id).filter(Asignatura.ciclo == ciclo)
+    if docente_id is not None:
+        consulta = consulta.filter(Asignatura.docente_id == docente_id)
+    return [a for (a,) in consulta]
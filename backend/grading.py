@@ -0,0 +1,147 @@
+import json
+from typing import Dict, Iterable, List
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from grade_stats import load_grades
+from models import EsquemaCalificacion, Promedio
+
+# Columnas de la tabla promedios que calcula el esquema; promedio_final es la suma ponderada
+CATEGORIAS = ("actividades", "practicas", "parciales", "examen_final")
+# promedio: media de las notas; ultima: la más reciente; maxima: la mayor
+AGREGACIONES = ("promedio", "ultima", "maxima")
+
+# Pesos con los que se guardaban los promedios y tipos de nota que ya usaba el reporte
+ESQUEMA_POR_DEFECTO = {
+    "actividades": {
+        "peso": 0.2,
+        "tipos": ["participacion", "tarea", "quiz", "laboratorio", "proyecto", "trabajo_grupal", "exposicion"],
+        "agregacion": "promedio",
+    },
+    "practicas": {"peso": 0.2, "tipos": ["practica"], "agregacion": "ultima"},
+    "parciales": {"peso": 0.3, "tipos": ["examen_parcial", "parcial"], "agregacion": "ultima"},
+    "examen_final": {"peso": 0.3, "tipos": ["examen_final"], "agregacion": "ultima"},
+}
+
+
+def validate_scheme(categorias: Dict[str, dict]) -> Dict[str, dict]:
+    """Normalizar y validar un esquema. Lanza ValueError con un mensaje para el usuario."""
+    desconocidas = set(categorias) - set(CATEGORIAS)
+    if desconocidas:
+        raise ValueError(f"Categorías desconocidas: {', '.join(sorted(desconocidas))}")
+
+    esquema, asignados = {}, {}
+    for categoria in CATEGORIAS:
+        conf = categorias.get(categoria) or {}
+        peso = float(conf.get("peso", 0))
+        agregacion = conf.get("agregacion", "ultima")
+        tipos = sorted({t.strip().lower() for t in conf.get("tipos", []) if t and t.strip()})
+        if peso < 0:
+            raise ValueError(f"El peso de {categoria} no puede ser negativo")
+        if agregacion not in AGREGACIONES:
+            raise ValueError(f"Agregación no válida para {categoria}: {agregacion}")
+        for tipo in tipos:
+            if tipo in asignados:
+                raise ValueError(f"El tipo de nota '{tipo}' está en {asignados[tipo]} y en {categoria}")
+            asignados[tipo] = categoria
+        esquema[categoria] = {"peso": peso, "tipos": tipos, "agregacion": agregacion}
+
+    if abs(sum(c["peso"] for c in esquema.values()) - 1) > 1e-6:
+        raise ValueError("Los pesos de las categorías deben sumar 1")
+    return esquema
+
+
+def get_scheme(db: Session, asignatura_id: int) -> Dict[str, dict]:
+    fila = db.get(EsquemaCalificacion, asignatura_id)
+    return json.loads(fila.categorias) if fila else ESQUEMA_POR_DEFECTO
+
+
+def is_default_scheme(db: Session, asignatura_id: int) -> bool:
+    return db.get(EsquemaCalificacion, asignatura_id) is None
+
+
+def set_scheme(db: Session, asignatura_id: int, categorias: Dict[str, dict]) -> Dict[str, dict]:
+    """Guardar el esquema de la asignatura (sin commit); después llamar a recompute_subject_grades"""
+    esquema = validate_scheme(categorias)
+    fila = db.get(EsquemaCalificacion, asignatura_id)
+    if fila is None:
+        db.add(EsquemaCalificacion(asignatura_id=asignatura_id, categorias=json.dumps(esquema)))
+    else:
+        fila.categorias = json.dumps(esquema)
+    return esquema
+
+
+def compute_grades(notas: "np.ndarray", esquema: Dict[str, dict]):
+    """Promedios por categoría y final de todos los alumnos de una asignatura a la vez.
+
+    `notas` viene de load_grades(..., por_fecha=True). Devuelve (alumno_ids, {categoria: valores}, finales);
+    una categoría sin notas queda en NaN y aporta 0 al promedio final.
+    """
+    alumnos, indice = np.unique(notas["alumno_id"], return_inverse=True)
+    n = alumnos.size
+    tipos = np.char.lower(np.char.strip(notas["tipo_nota"].astype(str)))
+    calificaciones = notas["calificacion"]
+    posiciones = np.arange(notas.size)
+
+    valores, finales = {}, np.zeros(n)
+    for categoria in CATEGORIAS:
+        conf = esquema[categoria]
+        filtro = np.isin(tipos, conf["tipos"])
+        grupo, cal = indice[filtro], calificaciones[filtro]
+        cantidad = np.bincount(grupo, minlength=n)
+        if conf["agregacion"] == "promedio":
+            valor = np.bincount(grupo, weights=cal, minlength=n) / np.maximum(cantidad, 1)
+        elif conf["agregacion"] == "maxima":
+            valor = np.full(n, -np.inf)
+            np.maximum.at(valor, grupo, cal)
+        else:
+            ultima = np.zeros(n, dtype=np.int64)
+            np.maximum.at(ultima, grupo, posiciones[filtro])
+            valor = calificaciones[ultima] if notas.size else np.zeros(n)
+        valor = np.where(cantidad > 0, valor, np.nan)
+        valores[categoria] = valor
+        finales += conf["peso"] * np.nan_to_num(valor)
+    return alumnos, valores, np.round(finales, 2)
+
+
+def _redondear(valor: float):
+    return None if np.isnan(valor) else round(float(valor), 2)
+
+
+def recompute_subject_grades(db: Session, asignatura_ids: Iterable[int]) -> int:
+    """Recalcular los promedios de asignaturas completas según su esquema (sin commit).
+
+    Se llama tras escribir notas, en la misma transacción. Solo se escriben las filas que cambian;
+    las de alumnos sin notas se eliminan. Devuelve la cantidad de filas escritas o borradas.
+    """
+    db.flush()
+    cambios = 0
+    for asignatura_id in sorted(set(asignatura_ids)):
+        alumnos, valores, finales = compute_grades(
+            load_grades(db, [asignatura_id], por_fecha=True), get_scheme(db, asignatura_id)
+        )
+        existentes: Dict[int, List[Promedio]] = {}
+        for promedio in db.query(Promedio).filter(Promedio.asignatura_id == asignatura_id):
+            existentes.setdefault(promedio.alumno_id, []).append(promedio)
+
+        for i, alumno_id in enumerate(alumnos.tolist()):
+            fila = {categoria: _redondear(valores[categoria][i]) for categoria in CATEGORIAS}
+            fila["promedio_final"] = float(finales[i])
+            promedios = existentes.pop(alumno_id, None)
+            if promedios is None:
+                db.add(Promedio(alumno_id=alumno_id, asignatura_id=asignatura_id, **fila))
+                cambios += 1
+                continue
+            for promedio in promedios:
+                if any(getattr(promedio, k) != v for k, v in fila.items()):
+                    for k, v in fila.items():
+                        setattr(promedio, k, v)
+                    cambios += 1
+
+        for promedios in existentes.values():
+            for promedio in promedios:
+                db.delete(promedio)
+                cambios += 1
+    db.flush()
+    return cambios
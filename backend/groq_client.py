@@ -0,0 +1,204 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+load_dotenv()
+
+try:
+    import httpx
+    from groq import AsyncGroq
+except Exception:
+    AsyncGroq = None
+
+# URL base de la API (permite apuntar a un servidor de completions local o falso para pruebas)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+# Segundos máximos por petición al proveedor y reintentos del SDK
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "30"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "1"))
+# Peticiones simultáneas al proveedor por proceso y espera máxima por un turno
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_QUEUE_TIMEOUT = float(os.getenv("GROQ_QUEUE_TIMEOUT", "10"))
+
+# Cliente y semáforo van ligados al event loop en el que se crearon
+_state = {"loop": None, "client": None, "semaphore": None}
+_stats = {"requests": 0, "errors": 0, "rejected": 0, "in_flight": 0, "streams": 0, "streams_cancelled": 0}
+# Últimos tiempos hasta el primer token (s) de las respuestas en streaming
+_ttft: List[float] = []
+
+
+def _get_client():
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="GROQ_API_KEY no configurado en backend/.env")
+    if AsyncGroq is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="SDK de Groq no disponible. Ejecute 'pip install -r requirements.txt' y reinicie el servidor.")
+
+    loop = asyncio.get_running_loop()
+    if _state["client"] is None or _state["loop"] is not loop:
+        # Un único cliente HTTP por proceso reutiliza las conexiones TLS con el proveedor
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(GROQ_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=GROQ_MAX_CONCURRENCY, max_keepalive_connections=GROQ_MAX_CONCURRENCY),
+        )
+        _state["client"] = AsyncGroq(
+            api_key=api_key,
+            base_url=GROQ_BASE_URL,
+            timeout=GROQ_TIMEOUT,
+            max_retries=GROQ_MAX_RETRIES,
+            http_client=http_client,
+        )
+        _state["semaphore"] = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+        _state["loop"] = loop
+    return _state["client"], _state["semaphore"]
+
+
+async def _acquire(semaphore: asyncio.Semaphore) -> None:
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=GROQ_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El asistente está ocupado, intenta nuevamente en unos segundos",
+            headers={"Retry-After": "2"},
+        )
+
+
+def _provider_error(e: Exception) -> HTTPException:
+    _stats["errors"] += 1
+    # Registrar error para depuración y retornar HTTP 502 legible
+    print(f"[Chatbot] Error al invocar Groq: {e}")
+    return HTTPException(status_code=502, detail=f"Error al consultar el proveedor de IA: {str(e)}")
+
+
+async def chat_completion(messages: List[Dict[str, str]], model: str, temperature: Optional[float]) -> str:
+    """Pedir una respuesta al proveedor sin bloquear el event loop"""
+    client, semaphore = _get_client()
+    await _acquire(semaphore)
+
+    _stats["requests"] += 1
+    _stats["in_flight"] += 1
+    try:
+        completion = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+        )
+        return completion.choices[0].message.content
+    except Exception as e:
+        raise _provider_error(e)
+    finally:
+        _stats["in_flight"] -= 1
+        semaphore.release()
+
+
+class StreamFragments:
+    """Fragmentos de texto de una respuesta en streaming.
+
+    Retiene el turno del semáforo y la conexión con el proveedor hasta que se agota o se
+    llama a `aclose()`. `aclose()` es idempotente y libera todo aunque nunca se haya empezado
+    a iterar (p. ej. el cliente se desconectó antes de recibir la cabecera de la respuesta).
+    """
+
+    def __init__(self, stream, semaphore: asyncio.Semaphore, inicio: float):
+        self._stream = stream
+        self._semaphore = semaphore
+        self._inicio = inicio
+        self._terminado = False
+        self._liberado = False
+        self._fragmentos = self._leer()
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._fragmentos
+
+    async def _leer(self) -> AsyncIterator[str]:
+        primero = True
+        try:
+            # El siguiente fragmento solo se pide al proveedor cuando el anterior
+            # ya se entregó al cliente, así un cliente lento frena la lectura
+            async for chunk in self._stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if primero:
+                    primero = False
+                    _ttft.append(time.perf_counter() - self._inicio)
+                    del _ttft[:-100]
+                yield delta
+            self._terminado = True
+        except Exception as e:
+            _provider_error(e)
+            raise
+        finally:
+            await self._liberar()
+
+    async def _liberar(self) -> None:
+        if self._liberado:
+            return
+        self._liberado = True
+        if not self._terminado:
+            _stats["streams_cancelled"] += 1
+        try:
+            # Cerrar la conexión con el proveedor aunque el cliente se haya ido a mitad de respuesta
+            await self._stream.close()
+        finally:
+            _stats["in_flight"] -= 1
+            self._semaphore.release()
+
+    async def aclose(self) -> None:
+        # Detener la lectura si está a medias y liberar el turno (también si nunca empezó)
+        await self._fragmentos.aclose()
+        await self._liberar()
+
+
+async def open_stream(messages: List[Dict[str, str]], model: str, temperature: Optional[float]) -> StreamFragments:
+    """Abrir una respuesta en streaming y devolver sus fragmentos de texto.
+
+    Los errores de cola o de conexión se lanzan aquí como HTTPException, antes de
+    empezar a responder. El turno del semáforo se mantiene hasta que los fragmentos
+    se agotan o se cierran con `aclose()`: quien llama debe cerrarlos siempre.
+    """
+    client, semaphore = _get_client()
+    await _acquire(semaphore)
+
+    _stats["requests"] += 1
+    _stats["streams"] += 1
+    _stats["in_flight"] += 1
+    inicio = time.perf_counter()
+    try:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        )
+    except BaseException as e:
+        _stats["in_flight"] -= 1
+        semaphore.release()
+        if isinstance(e, Exception):
+            raise _provider_error(e)
+        raise
+
+    return StreamFragments(stream, semaphore, inicio)
+
+
+async def close_client() -> None:
+    """Cerrar las conexiones abiertas con el proveedor"""
+    client = _state["client"]
+    _state.update(loop=None, client=None, semaphore=None)
+    if client is not None:
+        await client.close()
+
+
+def groq_stats() -> dict:
+    return {
+        **_stats,
+        "max_concurrency": GROQ_MAX_CONCURRENCY,
+        "timeout": GROQ_TIMEOUT,
+        "ttft_ms_promedio": round(sum(_ttft) / len(_ttft) * 1000, 1) if _ttft else None,
+        "base_url": GROQ_BASE_URL or "https://api.groq.com",
+    }
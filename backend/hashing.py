@@ -0,0 +1,96 @@
+import asyncio
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+load_dotenv()
+
+# Costo de bcrypt (log2 de las iteraciones). Cada +1 duplica el tiempo de cálculo.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Procesos dedicados al hashing. Con 0 se usa el pool de hilos por defecto del event loop.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Máximo de operaciones en cola o en curso; por encima se responde 503 de inmediato.
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+_stats = {"verify_calls": 0, "hash_calls": 0, "rejected": 0}
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if HASH_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+            atexit.register(shutdown)
+        return _executor
+
+
+def shutdown() -> None:
+    """Cerrar el pool de procesos de hashing"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def _run(fn, *args):
+    global _pending
+    with _pending_lock:
+        if _pending >= HASH_QUEUE_SIZE:
+            _stats["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servidor ocupado, intenta nuevamente en unos segundos",
+                headers={"Retry-After": "1"},
+            )
+        _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verificar contraseña fuera del event loop"""
+    _stats["verify_calls"] += 1
+    return await _run(_verify, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hashear contraseña fuera del event loop"""
+    _stats["hash_calls"] += 1
+    return await _run(_hash, password)
+
+
+def hashing_stats() -> dict:
+    return {
+        **_stats,
+        "pending": _pending,
+        "queue_size": HASH_QUEUE_SIZE,
+        "workers": HASH_WORKERS,
+        "rounds": BCRYPT_ROUNDS,
+    }
@@ -0,0 +1,181 @@
+import os
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from dotenv import load_dotenv
+from pydantic import TypeAdapter
+from sqlalchemy import and_, func, insert, literal, select
+from sqlalchemy.orm import Session, selectinload
+
+from cache import TTLCache
+from models import Asignatura, AsignaturaHistorial, HistorialAcademico, Nota, NotaHistorial, matriculas
+from schemas import HistorialAcademico as HistorialAcademicoSchema
+
+load_dotenv()
+
+# Alumnos procesados por sentencia (mantiene las listas IN bajo el límite de variables de SQLite)
+_BATCH = 500
+# El historial no cambia una vez escrito: se cachea serializado hasta un nuevo snapshot o borrado
+HISTORIAL_CACHE_TTL = float(os.getenv("HISTORIAL_CACHE_TTL", "86400"))
+
+_history_cache = TTLCache(2048, HISTORIAL_CACHE_TTL)
+_history_adapter = TypeAdapter(List[HistorialAcademicoSchema])
+
+
+class CicloSnapshot(NamedTuple):
+    """Ciclo a copiar al historial de un alumno.
+
+    `ciclo` es la etiqueta guardada en el historial; `ciclo_asignaturas` el ciclo base de las
+    asignaturas matriculadas que se copian. `extras` son asignaturas fijas (nombre, promedio, tipo_nota)
+    que se agregan con una única nota.
+    """
+    alumno_id: int
+    ciclo: str
+    ciclo_asignaturas: str
+    extras: Tuple[Tuple[str, float, str], ...] = ()
+
+
+def _chunks(items: Sequence, size: int = _BATCH):
+    for inicio in range(0, len(items), size):
+        yield items[inicio:inicio + size]
+
+
+def _historiales(db: Session, snapshots: Sequence[CicloSnapshot]) -> Dict[Tuple[int, str], int]:
+    """Obtener (o crear en bloque) el HistorialAcademico de cada (alumno, ciclo)"""
+    claves = {(s.alumno_id, s.ciclo) for s in snapshots}
+    alumno_ids = sorted({s.alumno_id for s in snapshots})
+
+    def existentes() -> Dict[Tuple[int, str], int]:
+        encontrados = {}
+        for lote in _chunks(alumno_ids):
+            filas = db.query(HistorialAcademico.alumno_id, HistorialAcademico.ciclo, func.min(HistorialAcademico.id)).filter(
+                HistorialAcademico.alumno_id.in_(lote)
+            ).group_by(HistorialAcademico.alumno_id, HistorialAcademico.ciclo).all()
+            encontrados.update({(a, c): h for a, c, h in filas if (a, c) in claves})
+        return encontrados
+
+    ids = existentes()
+    nuevos = [{"alumno_id": a, "ciclo": c} for a, c in sorted(claves - ids.keys())]
+    if nuevos:
+        db.execute(insert(HistorialAcademico), nuevos)
+        ids = existentes()
+    return ids
+
+
+def _vaciar(db: Session, historial_ids: List[int]) -> None:
+    # Un snapshot repetido reemplaza el contenido anterior del mismo (alumno, ciclo)
+    for lote in _chunks(historial_ids):
+        asignaturas = select(AsignaturaHistorial.id).where(AsignaturaHistorial.historial_id.in_(lote))
+        db.query(NotaHistorial).filter(NotaHistorial.asignatura_id.in_(asignaturas)).delete(synchronize_session=False)
+        db.query(AsignaturaHistorial).filter(AsignaturaHistorial.historial_id.in_(lote)).delete(synchronize_session=False)
+
+
+def _copiar_asignaturas(db: Session, historial_ids: List[int], ciclo_asignaturas: str) -> None:
+    """INSERT ... SELECT de las asignaturas matriculadas (con su promedio) y de sus notas"""
+    promedio = (
+        select(func.avg(Nota.calificacion))
+        .where(Nota.alumno_id == HistorialAcademico.alumno_id, Nota.asignatura_id == Asignatura.id)
+        .scalar_subquery()
+    )
+    for lote in _chunks(historial_ids):
+        asignaturas = (
+            select(
+                HistorialAcademico.id,
+                Asignatura.nombre,
+                func.coalesce(promedio, 0.0),
+                Asignatura.id,
+            )
+            .join(matriculas, matriculas.c.alumno_id == HistorialAcademico.alumno_id)
+            .join(Asignatura, and_(Asignatura.id == matriculas.c.asignatura_id, Asignatura.ciclo == ciclo_asignaturas))
+            .where(HistorialAcademico.id.in_(lote))
+        )
+        db.execute(insert(AsignaturaHistorial).from_select(
+            ["historial_id", "nombre", "promedio", "asignatura_origen_id"], asignaturas
+        ))
+
+        notas = (
+            select(
+                AsignaturaHistorial.id,
+                Nota.calificacion,
+                Nota.tipo_nota,
+                func.coalesce(Nota.fecha_registro, func.current_timestamp()),
+            )
+            .join(HistorialAcademico, HistorialAcademico.id == AsignaturaHistorial.historial_id)
+            .join(Nota, and_(
+                Nota.alumno_id == HistorialAcademico.alumno_id,
+                Nota.asignatura_id == AsignaturaHistorial.asignatura_origen_id,
+            ))
+            .where(AsignaturaHistorial.historial_id.in_(lote))
+        )
+        db.execute(insert(NotaHistorial).from_select(
+            ["asignatura_id", "calificacion", "tipo_nota", "fecha_registro"], notas
+        ))
+
+
+def _agregar_extras(db: Session, historial_ids: List[int], extras: Tuple[Tuple[str, float, str], ...]) -> None:
+    for nombre, promedio, tipo_nota in extras:
+        for lote in _chunks(historial_ids):
+            db.execute(insert(AsignaturaHistorial), [
+                {"historial_id": h, "nombre": nombre, "promedio": promedio} for h in lote
+            ])
+            db.execute(insert(NotaHistorial).from_select(
+                ["asignatura_id", "calificacion", "tipo_nota", "fecha_registro"],
+                select(AsignaturaHistorial.id, literal(promedio), literal(tipo_nota), func.current_timestamp()).where(
+                    AsignaturaHistorial.historial_id.in_(lote),
+                    AsignaturaHistorial.nombre == nombre,
+                    AsignaturaHistorial.asignatura_origen_id.is_(None),
+                ),
+            ))
+
+
+def snapshot_cycles(db: Session, snapshots: Iterable[CicloSnapshot]) -> Dict[Tuple[int, str], int]:
+    """Copiar al historial académico el ciclo de uno o muchos alumnos con sentencias en bloque.
+
+    Idempotente por (alumno, ciclo): repetir el snapshot reemplaza su contenido sin duplicar.
+    No hace commit; después del commit llamar a invalidate_history. Devuelve {(alumno_id, ciclo): historial_id}.
+    """
+    # Si un (alumno, ciclo) aparece repetido vale el último
+    snapshots = list({(s.alumno_id, s.ciclo): s for s in snapshots}.values())
+    if not snapshots:
+        return {}
+    ids = _historiales(db, snapshots)
+    _vaciar(db, sorted(set(ids.values())))
+
+    # Agrupar por ciclo de asignaturas y extras: pocas sentencias aunque la cohorte sea grande
+    grupos: Dict[Tuple[str, tuple], List[int]] = {}
+    for s in snapshots:
+        grupos.setdefault((s.ciclo_asignaturas, tuple(s.extras)), []).append(ids[(s.alumno_id, s.ciclo)])
+    for (ciclo_asignaturas, extras), historial_ids in grupos.items():
+        historial_ids = sorted(set(historial_ids))
+        _copiar_asignaturas(db, historial_ids, ciclo_asignaturas)
+        _agregar_extras(db, historial_ids, extras)
+    return ids
+
+
+def load_history(db: Session, alumno_ids: Iterable[int]) -> List[HistorialAcademico]:
+    """Historiales con sus asignaturas y notas precargados (tres consultas en total)"""
+    return (
+        db.query(HistorialAcademico)
+        .options(selectinload(HistorialAcademico.asignaturas).selectinload(AsignaturaHistorial.notas))
+        .filter(HistorialAcademico.alumno_id.in_(list(alumno_ids)))
+        .order_by(HistorialAcademico.id)
+        .all()
+    )
+
+
+def get_history_json(db: Session, alumno_id: int) -> bytes:
+    """Historial completo del alumno ya serializado a JSON (cacheado)"""
+    contenido = _history_cache.get(alumno_id)
+    if contenido is None:
+        historiales = _history_adapter.validate_python(load_history(db, [alumno_id]), from_attributes=True)
+        contenido = _history_adapter.dump_json(historiales)
+        _history_cache.set(alumno_id, contenido)
+    return contenido
+
+
+def invalidate_history(alumno_ids: Iterable[int]) -> None:
+    for alumno_id in alumno_ids:
+        _history_cache.pop(alumno_id)
+
+
+def history_cache_stats() -> dict:
+    return _history_cache.stats()
@@ -1,12 +1,20 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from media import CachedStaticFiles, UploadLimitMiddleware
 from routers import auth, admin, docente, alumno, historial
 # Añadir import del nuevo router de chatbot
 from routers import chatbot
+from routers import eventos
+from routers import bootstrap
 from auth import require_role  # para dependencias de rol en rutas directas
-from database import engine, Base, get_db
-from models import Usuario
+from database import engine, Base, get_db, ensure_columns, ensure_foreign_keys, ensure_indexes, enable_sqlite_foreign_keys
+from models import Usuario, Docente
+from rate_limit import RateLimitMiddleware, rate_limit_stats
+from analytics import ensure_analytics
+from change_log import ensure_change_log
+from versioning import ensure_version_counters
+from groq_client import close_client, groq_stats
+from events import close_broker, events_stats
 from sqlalchemy.orm import Session
 import os
 
@@ -18,6 +26,15 @@ print(f"Usando la base de datos en: {os.path.join(backend_dir, 'sistema_notas.db
 
 # Crear las tablas
 Base.metadata.create_all(bind=engine)
+# Columnas agregadas después de creada la base de datos
+ensure_columns("configuracion_sistema", {"version": "INTEGER NOT NULL DEFAULT 1"})
+ensure_columns("reportes_docentes_archivos", {"sha256": "VARCHAR(64)", "size": "INTEGER"})
+ensure_columns("asignaturas_historial", {"asignatura_origen_id": "INTEGER REFERENCES asignaturas(id)"})
+ensure_foreign_keys()
+ensure_indexes()
+ensure_analytics()
+ensure_change_log()
+ensure_version_counters()
 
 app = FastAPI(
     title="Sistema de Gestión de Notas",
@@ -25,6 +42,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Límite de intentos en login y recuperación de contraseña (429 antes de llegar a bcrypt).
+# Se registra antes que CORS para quedar dentro de él: los 429 también llevan las cabeceras CORS
+app.add_middleware(RateLimitMiddleware)
+# Subidas de logo: 413 antes de recibir el cuerpo completo (también dentro de CORS)
+app.add_middleware(UploadLimitMiddleware, paths=("/admin/configuracion/logo", "/admin/configuracion/logo/cloudinary"))
+
 # Configurar CORS
 # En la configuración CORS (líneas 20-25):
 app.add_middleware(
@@ -33,12 +56,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "Content-Range", "Accept-Ranges", "Content-Disposition", "ETag"],
 )
 
 # Servir archivos estáticos para logos subidos localmente
 uploads_root = os.path.join(backend_dir, "uploads")
 os.makedirs(os.path.join(uploads_root, "logos"), exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=uploads_root), name="uploads")
+app.mount("/uploads", CachedStaticFiles(directory=uploads_root), name="uploads")
 
 # Incluir routers
 app.include_router(auth.router, prefix="/auth", tags=["autenticación"])
@@ -48,15 +72,45 @@ app.include_router(alumno.router, prefix="/alumno", tags=["alumno"])
 app.include_router(historial.router, prefix="/historial", tags=["historial académico"])
 # Incluir el router de chatbot
 app.include_router(chatbot.router, prefix="", tags=["chatbot"])
+# Eventos en vivo (SSE) de publicación de notas
+app.include_router(eventos.router, prefix="/eventos", tags=["eventos"])
 # Incluir router de configuración
 from routers import configuracion
 app.include_router(configuracion.router, prefix="", tags=["configuración"])
+# Carga inicial por rol (primera pantalla en una sola petición)
+app.include_router(bootstrap.router, prefix="", tags=["bootstrap"])
+
+@app.on_event("startup")
+async def iniciar_caches():
+    """Precargar cachés compartidas por todas las peticiones"""
+    await configuracion.start_config_cache()
+
+@app.on_event("shutdown")
+async def cerrar_clientes():
+    """Cerrar conexiones persistentes con servicios externos"""
+    await configuracion.stop_config_cache()
+    await close_client()
+    close_broker()
 
 @app.get("/")
 async def root():
     return {"message": "Sistema de Gestión de Notas API"}
 
 
+# Los benchmarks generan carga a propósito (datos sintéticos, llamadas a servicios externos):
+# solo existen con DEBUG_BENCHMARKS=true y solo para administradores
+DEBUG_BENCHMARKS = os.getenv("DEBUG_BENCHMARKS", "false").lower() == "true"
+
+def benchmarks_habilitados():
+    if not DEBUG_BENCHMARKS:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+# Se evalúan en orden: deshabilitados responden 404 sin mirar el token
+BENCHMARK = [Depends(benchmarks_habilitados), Depends(require_role("admin"))]
+# Estadísticas internas (contadores, configuración de servicios): solo administradores
+SOLO_ADMIN = [Depends(require_role("admin"))]
+
+
 @app.get("/debug/users")
 async def debug_users(db: Session = Depends(get_db)):
     """Endpoint de debug para verificar usuarios"""
@@ -134,6 +188,580 @@ async def debug_users_detailed(db: Session = Depends(get_db)):
     }
 
 
+@app.get("/debug/auth-benchmark", dependencies=BENCHMARK)
+def debug_auth_benchmark(iteraciones: int = 1000, db: Session = Depends(get_db)):
+    """Micro-benchmark del costo de autenticación por petición (con y sin caché).
+    Síncrono a propósito: se ejecuta en el threadpool y no bloquea el event loop."""
+    import time
+    import auth as auth_module
+
+    iteraciones = max(1, min(iteraciones, 20000))
+    user = db.query(Usuario).filter(Usuario.activo == True).first()
+    if not user:
+        return {"error": "No hay usuarios activos para medir"}
+    token = auth_module.create_access_token(data=auth_module.token_claims(user))
+
+    def medir(fn):
+        inicio = time.perf_counter()
+        for _ in range(iteraciones):
+            fn()
+        return round((time.perf_counter() - inicio) / iteraciones * 1e6, 2)
+
+    def sin_cache():
+        auth_module.jwt.decode(token, auth_module.SECRET_KEY, algorithms=[auth_module.ALGORITHM])
+        db.query(Usuario).filter(Usuario.email == user.email).first()
+
+    def con_cache():
+        claims = auth_module.decode_token(token)
+        auth_module._resolve_user(db, claims)
+        db.expunge_all()
+
+    return {
+        "iteraciones": iteraciones,
+        "us_por_peticion_sin_cache": medir(sin_cache),
+        "us_por_peticion_con_cache": medir(con_cache),
+        "cache": auth_module.auth_cache_stats(),
+    }
+
+@app.get("/debug/login-storm", dependencies=BENCHMARK)
+async def debug_login_storm(logins: int = 20):
+    """Simula una ráfaga de logins concurrentes y mide el bloqueo del event loop.
+    `max_lag_ms` es el mayor retraso observado por una tarea que late cada 10 ms.
+    Asíncrono a propósito: bcrypt corre en el pool de hashing y aquí se mide el event loop."""
+    import asyncio
+    import time
+    import hashing
+
+    # Sin superar la cola del pool de hashing: por encima se mediría el rechazo, no bcrypt
+    logins = max(1, min(logins, 50, hashing.HASH_QUEUE_SIZE - 1))
+    hashed = await hashing.get_password_hash_async("benchmark123")
+
+    max_lag = 0.0
+    done = False
+
+    async def heartbeat():
+        nonlocal max_lag
+        while not done:
+            inicio = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - inicio - 0.01)
+
+    latido = asyncio.create_task(heartbeat())
+    inicio = time.perf_counter()
+    await asyncio.gather(*[
+        hashing.verify_password_async("benchmark123", hashed) for _ in range(logins)
+    ])
+    total = time.perf_counter() - inicio
+    done = True
+    await latido
+
+    return {
+        "logins": logins,
+        "total_s": round(total, 3),
+        "logins_por_s": round(logins / total, 1),
+        "max_lag_ms": round(max_lag * 1000, 1),
+        "hashing": hashing.hashing_stats(),
+    }
+
+@app.get("/debug/rate-limit", dependencies=SOLO_ADMIN)
+async def debug_rate_limit():
+    """Estado del limitador de intentos de login/recuperación"""
+    return rate_limit_stats()
+
+@app.get("/debug/eventos", dependencies=SOLO_ADMIN)
+async def debug_eventos():
+    """Broker de eventos en vivo, conexiones abiertas y eventos entregados/descartados"""
+    return events_stats()
+
+@app.get("/debug/eventos-benchmark", dependencies=BENCHMARK)
+async def debug_eventos_benchmark(conexiones: int = 5000, destinatarios: int = 40):
+    """Tiempo en repartir un evento de publicación entre muchas conexiones abiertas
+    (broker local propio del benchmark, no el que atiende /eventos/stream)"""
+    import asyncio
+    import time
+    from events import LocalBroker, Suscripcion
+
+    conexiones = max(1, min(conexiones, 20000))
+    destinatarios = max(1, min(destinatarios, conexiones))
+    broker = LocalBroker()
+    suscripciones = [Suscripcion(i) for i in range(conexiones)]
+    for suscripcion in suscripciones:
+        broker.subscribe(suscripcion)
+
+    inicio = time.perf_counter()
+    broker.deliver({"tipo": "notas_publicadas", "asignatura_id": 0, "alumno_ids": list(range(destinatarios))})
+    while sum(s.cola.qsize() for s in suscripciones[:destinatarios]) < min(destinatarios, conexiones):
+        await asyncio.sleep(0)
+    reparto = time.perf_counter() - inicio
+    recibidos = sum(s.cola.qsize() for s in suscripciones)
+    return {
+        "conexiones": conexiones,
+        "destinatarios": destinatarios,
+        "recibidos": recibidos,
+        "reparto_ms": round(reparto * 1000, 3),
+    }
+
+@app.get("/debug/bootstrap-benchmark", dependencies=BENCHMARK)
+async def debug_bootstrap_benchmark(rol: str = "alumno", repeticiones: int = 20):
+    """Tiempo hasta tener los datos de la primera pantalla: peticiones separadas (como hacía el
+    frontend: /auth/me y luego configuración y dashboard) frente a una sola petición a /bootstrap"""
+    import asyncio
+    import time
+    import httpx
+    from fastapi.concurrency import run_in_threadpool
+    from auth import create_access_token, token_claims
+    from database import SessionLocal
+
+    if rol not in ("admin", "docente", "alumno"):
+        raise HTTPException(status_code=400, detail="Rol no válido")
+    repeticiones = max(1, min(repeticiones, 100))
+
+    def token_del_rol():
+        # Consulta síncrona: fuera del event loop
+        db = SessionLocal()
+        try:
+            usuario = db.query(Usuario).filter(Usuario.rol == rol, Usuario.activo == True).first()
+            return create_access_token(token_claims(usuario)) if usuario else None
+        finally:
+            db.close()
+
+    token = await run_in_threadpool(token_del_rol)
+    if token is None:
+        return {"error": f"No hay usuarios con rol {rol}"}
+    headers = {"Authorization": f"Bearer {token}"}
+
+    dashboard = {
+        "admin": ["/admin/dashboard"],
+        "docente": ["/docente/mis-asignaturas"],
+        # Dashboard.js las pedía una tras otra
+        "alumno": ["/alumno/mis-asignaturas", "/alumno/mis-notas", "/alumno/promedio"],
+    }.get(rol, [])
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", headers=headers) as client:
+        async def panel():
+            for ruta in dashboard:
+                (await client.get(ruta)).raise_for_status()
+
+        async def separadas():
+            (await client.get("/auth/me")).raise_for_status()
+            configuracion = client.get("/configuracion")
+            await asyncio.gather(configuracion, panel())
+
+        async def agrupada():
+            (await client.get("/bootstrap")).raise_for_status()
+
+        tiempos = {}
+        for nombre, flujo in (("separadas", separadas), ("bootstrap", agrupada)):
+            await flujo()  # calentar cachés
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                await flujo()
+            tiempos[nombre] = (time.perf_counter() - inicio) / repeticiones
+
+    return {
+        "rol": rol,
+        "peticiones": {"separadas": 2 + len(dashboard), "bootstrap": 1},
+        "separadas_ms": round(tiempos["separadas"] * 1000, 2),
+        "bootstrap_ms": round(tiempos["bootstrap"] * 1000, 2),
+        "mejora": round(tiempos["separadas"] / tiempos["bootstrap"], 2),
+    }
+
+@app.get("/debug/chatbot", dependencies=SOLO_ADMIN)
+async def debug_chatbot():
+    """Estado del cliente del proveedor de IA (peticiones, errores, concurrencia)"""
+    return groq_stats()
+
+@app.get("/debug/chat-stream-benchmark", dependencies=BENCHMARK)
+async def debug_chat_stream_benchmark(peticiones: int = 3):
+    """Compara el tiempo hasta el primer token (streaming) con la latencia de la respuesta completa.
+    Usar con GROQ_BASE_URL apuntando a un proveedor local de prueba."""
+    import time
+    import groq_client
+
+    peticiones = max(1, min(peticiones, 20))
+    model = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+    messages = [{"role": "user", "content": "¿Cómo se calcula mi promedio?"}]
+    completa, primer_token, total_stream = [], [], []
+
+    for _ in range(peticiones):
+        inicio = time.perf_counter()
+        await groq_client.chat_completion(messages, model, 0.2)
+        completa.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        fragments = await groq_client.open_stream(messages, model, 0.2)
+        async for _delta in fragments:
+            if len(primer_token) < len(total_stream) + 1:
+                primer_token.append(time.perf_counter() - inicio)
+        total_stream.append(time.perf_counter() - inicio)
+
+    def ms(valores):
+        return round(sum(valores) / len(valores) * 1000, 1) if valores else None
+
+    return {
+        "peticiones": peticiones,
+        "respuesta_completa_ms": ms(completa),
+        "primer_token_ms": ms(primer_token),
+        "stream_total_ms": ms(total_stream),
+        "chatbot": groq_stats(),
+    }
+
+@app.get("/debug/media", dependencies=SOLO_ADMIN)
+async def debug_media():
+    """Estado de las subidas de archivos (Cloudinary y respaldo local)"""
+    from media import media_stats
+    return media_stats()
+
+@app.get("/debug/report-store", dependencies=SOLO_ADMIN)
+async def debug_report_store(db: Session = Depends(get_db)):
+    """Estado del almacén de archivos de reportes (deduplicación y compresión)"""
+    from report_store import report_store_stats
+    return report_store_stats(db)
+
+@app.get("/debug/historial-cache", dependencies=SOLO_ADMIN)
+async def debug_historial_cache():
+    """Aciertos de la caché de historiales académicos serializados"""
+    from history_snapshot import history_cache_stats
+    return history_cache_stats()
+
+@app.get("/debug/analytics", dependencies=BENCHMARK)
+def debug_analytics(db: Session = Depends(get_db)):
+    """Aciertos de la caché de analítica y asignaturas cuyos agregados difieren de un recálculo completo.
+    Síncrono a propósito: el recálculo recorre todas las asignaturas y va al threadpool."""
+    import json
+    from analytics import _calcular, analytics_cache_stats
+    from models import AnaliticaAsignatura, Asignatura
+
+    guardados = {
+        fila.asignatura_id: {
+            "matriculados": fila.matriculados, "alumnos_evaluados": fila.alumnos_evaluados,
+            "aprobados": fila.aprobados, "notas_registradas": fila.notas_registradas,
+            "notas_publicadas": fila.notas_publicadas, "suma_publicadas": fila.suma_publicadas,
+            "histograma": json.loads(fila.histograma),
+        }
+        for fila in db.query(AnaliticaAsignatura).all()
+    }
+    recalculados = _calcular(db, [a for (a,) in db.query(Asignatura.id)])
+    desactualizadas = sorted(a for a in recalculados.keys() | guardados.keys() if recalculados.get(a) != guardados.get(a))
+    return {"cache": analytics_cache_stats(), "asignaturas": len(recalculados), "desactualizadas": desactualizadas}
+
+@app.get("/debug/historial-benchmark", dependencies=BENCHMARK)
+def debug_historial_benchmark(alumnos: int = 10000, muestra_orm: int = 300):
+    """Mide el snapshot en bloque del historial sobre una cohorte sintética en una BD en memoria
+    y lo compara con la copia fila a fila por ORM (sobre una muestra, extrapolada a la cohorte).
+    Síncrono a propósito: se ejecuta en el threadpool y no bloquea el event loop."""
+    import time
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from models import Alumno, Asignatura, AsignaturaHistorial, HistorialAcademico, Nota, NotaHistorial, matriculas
+    from history_snapshot import CicloSnapshot, snapshot_cycles
+
+    alumnos = max(1, min(alumnos, 20000))
+    muestra_orm = max(1, min(muestra_orm, alumnos, 1000))
+    bench_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    enable_sqlite_foreign_keys(bench_engine)
+    Base.metadata.create_all(bind=bench_engine)
+    db = sessionmaker(bind=bench_engine)()
+    try:
+        db.execute(insert(Usuario), [{"id": 1, "nombre": "d", "email": "d@bench", "password_hash": "x", "rol": "docente"}])
+        db.execute(insert(Docente), [{"id": 1, "nombre_completo": "Docente", "dni": "0", "usuario_id": 1}])
+        asignatura_ids = list(range(1, 7))
+        db.execute(insert(Asignatura), [{"id": i, "nombre": f"Asignatura {i}", "ciclo": "I", "docente_id": 1} for i in asignatura_ids])
+        db.execute(insert(Alumno), [
+            {"id": i, "nombre_completo": f"Alumno {i}", "dni": str(i), "ciclo": "I", "usuario_id": 1}
+            for i in range(1, alumnos + 1)
+        ])
+        db.execute(insert(matriculas), [{"alumno_id": i, "asignatura_id": a} for i in range(1, alumnos + 1) for a in asignatura_ids])
+        tipos = ["practica", "examen_parcial", "tarea", "examen_final"]
+        db.execute(insert(Nota), [
+            {"alumno_id": i, "asignatura_id": a, "calificacion": (i + a * 3 + k) % 21, "tipo_nota": t, "publicada": True}
+            for i in range(1, alumnos + 1) for a in asignatura_ids for k, t in enumerate(tipos)
+        ])
+        db.commit()
+
+        snapshots = [CicloSnapshot(i, "I", "I") for i in range(1, alumnos + 1)]
+        inicio = time.perf_counter()
+        snapshot_cycles(db, snapshots)
+        db.commit()
+        bloque = time.perf_counter() - inicio
+        filas = (db.query(AsignaturaHistorial).count(), db.query(NotaHistorial).count())
+
+        inicio = time.perf_counter()
+        snapshot_cycles(db, snapshots)
+        db.commit()
+        repetido = time.perf_counter() - inicio
+        idempotente = filas == (db.query(AsignaturaHistorial).count(), db.query(NotaHistorial).count())
+
+        # Copia fila a fila (flush por asignatura, avg por asignatura, una fila ORM por nota)
+        from sqlalchemy import func
+        inicio = time.perf_counter()
+        for alumno_id in range(1, muestra_orm + 1):
+            historial = HistorialAcademico(alumno_id=alumno_id, ciclo="I-orm")
+            db.add(historial)
+            db.flush()
+            for asignatura in db.query(Asignatura).filter(Asignatura.id.in_(asignatura_ids)).all():
+                promedio = db.query(func.avg(Nota.calificacion)).filter(
+                    Nota.alumno_id == alumno_id, Nota.asignatura_id == asignatura.id
+                ).scalar() or 0.0
+                asignatura_historial = AsignaturaHistorial(historial_id=historial.id, nombre=asignatura.nombre, promedio=promedio)
+                db.add(asignatura_historial)
+                db.flush()
+                for nota in db.query(Nota).filter(Nota.alumno_id == alumno_id, Nota.asignatura_id == asignatura.id).all():
+                    db.add(NotaHistorial(asignatura_id=asignatura_historial.id, calificacion=nota.calificacion,
+                                         tipo_nota=nota.tipo_nota, fecha_registro=nota.fecha_registro))
+        db.commit()
+        orm = (time.perf_counter() - inicio) / muestra_orm * alumnos
+    finally:
+        db.close()
+        bench_engine.dispose()
+
+    return {
+        "alumnos": alumnos,
+        "asignaturas_historial": filas[0],
+        "notas_historial": filas[1],
+        "snapshot_bloque_s": round(bloque, 3),
+        "snapshot_repetido_s": round(repetido, 3),
+        "idempotente": idempotente,
+        "orm_fila_a_fila_estimado_s": round(orm, 3),
+        "muestra_orm": muestra_orm,
+    }
+
+@app.get("/debug/delete-benchmark", dependencies=BENCHMARK)
+def debug_delete_benchmark(alumnos: int = 200, ciclos: int = 10):
+    """Mide la eliminación de alumnos con historial largo en una BD en memoria: la mitad con el borrado
+    anterior (bucles por historial y asignatura) y la otra mitad con un DELETE del usuario en cascada.
+    Síncrono a propósito: se ejecuta en el threadpool y no bloquea el event loop."""
+    import time
+    from datetime import datetime
+    from sqlalchemy import create_engine, func, insert, literal, select
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from models import (Alumno, Asignatura, AsignaturaHistorial, HistorialAcademico, Nota, NotaHistorial,
+                        Promedio, RefreshToken, matriculas)
+
+    alumnos = max(2, min(alumnos, 2000))
+    ciclos = max(1, min(ciclos, 20))
+    asignaturas, notas_por_asignatura = 6, 4
+    bench_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    enable_sqlite_foreign_keys(bench_engine)
+    Base.metadata.create_all(bind=bench_engine)
+    db = sessionmaker(bind=bench_engine)()
+    try:
+        alumno_ids = range(1, alumnos + 1)
+        db.execute(insert(Usuario), [
+            {"id": i, "nombre": f"u{i}", "email": f"u{i}@bench", "password_hash": "x", "rol": "alumno"}
+            for i in range(0, alumnos + 1)
+        ])
+        db.execute(insert(Docente), [{"id": 1, "nombre_completo": "Docente", "dni": "0", "usuario_id": 0}])
+        db.execute(insert(Asignatura), [{"id": a, "nombre": f"Asignatura {a}", "ciclo": "I", "docente_id": 1} for a in range(1, asignaturas + 1)])
+        db.execute(insert(Alumno), [{"id": i, "nombre_completo": f"Alumno {i}", "dni": str(i), "ciclo": "X", "usuario_id": i} for i in alumno_ids])
+        db.execute(insert(RefreshToken), [
+            {"jti": f"j{i}", "family": f"f{i}", "usuario_id": i, "expires_at": datetime.utcnow()} for i in alumno_ids
+        ])
+        db.execute(insert(matriculas), [{"alumno_id": i, "asignatura_id": a} for i in alumno_ids for a in range(1, asignaturas + 1)])
+        db.execute(insert(Promedio), [{"alumno_id": i, "asignatura_id": a, "promedio_final": 14} for i in alumno_ids for a in range(1, asignaturas + 1)])
+        db.execute(insert(Nota), [
+            {"alumno_id": i, "asignatura_id": a, "calificacion": 14, "tipo_nota": "practica", "publicada": True}
+            for i in alumno_ids for a in range(1, asignaturas + 1) for _ in range(notas_por_asignatura)
+        ])
+        db.execute(insert(HistorialAcademico), [{"alumno_id": i, "ciclo": f"C{c}"} for i in alumno_ids for c in range(ciclos)])
+        db.execute(insert(AsignaturaHistorial).from_select(
+            ["historial_id", "nombre", "promedio"],
+            select(HistorialAcademico.id, Asignatura.nombre, literal(14.0)).join(Asignatura, Asignatura.id > 0),
+        ))
+        ahora = datetime.utcnow()
+        for _ in range(notas_por_asignatura):
+            db.execute(insert(NotaHistorial).from_select(
+                ["asignatura_id", "calificacion", "tipo_nota", "fecha_registro"],
+                select(AsignaturaHistorial.id, literal(14.0), literal("practica"), literal(ahora)),
+            ))
+        db.commit()
+        notas_historial = db.query(NotaHistorial).count()
+
+        mitad = alumnos // 2
+        # Borrado anterior: bucles en Python y dos commits por alumno
+        inicio = time.perf_counter()
+        for alumno_id in range(1, mitad + 1):
+            for registro in db.query(HistorialAcademico).filter(HistorialAcademico.alumno_id == alumno_id).all():
+                for asignatura in db.query(AsignaturaHistorial).filter(AsignaturaHistorial.historial_id == registro.id).all():
+                    db.query(NotaHistorial).filter(NotaHistorial.asignatura_id == asignatura.id).delete()
+                db.query(AsignaturaHistorial).filter(AsignaturaHistorial.historial_id == registro.id).delete()
+            db.query(HistorialAcademico).filter(HistorialAcademico.alumno_id == alumno_id).delete()
+            db.query(Nota).filter(Nota.alumno_id == alumno_id).delete()
+            db.query(Promedio).filter(Promedio.alumno_id == alumno_id).delete()
+            db.execute(matriculas.delete().where(matriculas.c.alumno_id == alumno_id))
+            db.query(RefreshToken).filter(RefreshToken.usuario_id == alumno_id).delete()
+            db.query(Alumno).filter(Alumno.id == alumno_id).delete()
+            db.commit()
+            db.query(Usuario).filter(Usuario.id == alumno_id).delete()
+            db.commit()
+        bucles = time.perf_counter() - inicio
+
+        # Borrado actual: una sentencia y un commit por alumno
+        inicio = time.perf_counter()
+        for alumno_id in range(mitad + 1, alumnos + 1):
+            db.query(Usuario).filter(Usuario.id == alumno_id).delete(synchronize_session=False)
+            db.commit()
+        cascada = time.perf_counter() - inicio
+
+        restantes = {
+            modelo.__tablename__: db.query(modelo).count()
+            for modelo in (Alumno, Nota, Promedio, RefreshToken, HistorialAcademico, AsignaturaHistorial, NotaHistorial)
+        }
+        restantes["matriculas"] = db.execute(select(func.count()).select_from(matriculas)).scalar()
+    finally:
+        db.close()
+        bench_engine.dispose()
+
+    return {
+        "alumnos": alumnos,
+        "ciclos_por_alumno": ciclos,
+        "notas_historial_por_alumno": notas_historial // alumnos,
+        "bucles_ms_por_alumno": round(bucles / mitad * 1000, 3),
+        "cascada_ms_por_alumno": round(cascada / (alumnos - mitad) * 1000, 3),
+        "filas_restantes": restantes,
+    }
+
+@app.get("/debug/grade-stats-benchmark", dependencies=BENCHMARK)
+def debug_grade_stats_benchmark(notas: int = 100000, alumnos: int = 2000):
+    """Mide las estadísticas vectorizadas (NumPy) sobre `notas` notas sintéticas de una asignatura y las
+    compara con el cálculo fila a fila en Python (ranking por conteo, cuadrático en alumnos).
+    Síncrono a propósito: se ejecuta en el threadpool y no bloquea el event loop."""
+    import random
+    import statistics
+    import time
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from models import Alumno, Asignatura, Nota
+    from grade_stats import grade_statistics, load_grades
+
+    notas = max(1, min(notas, 200000))
+    # El ranking de referencia es cuadrático en alumnos
+    alumnos = max(1, min(alumnos, notas, 5000))
+    bench_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    enable_sqlite_foreign_keys(bench_engine)
+    Base.metadata.create_all(bind=bench_engine)
+    db = sessionmaker(bind=bench_engine)()
+    try:
+        db.execute(insert(Usuario), [{"id": 1, "nombre": "d", "email": "d@bench", "password_hash": "x", "rol": "docente"}])
+        db.execute(insert(Docente), [{"id": 1, "nombre_completo": "Docente", "dni": "0", "usuario_id": 1}])
+        db.execute(insert(Asignatura), [{"id": 1, "nombre": "Asignatura", "ciclo": "I", "docente_id": 1}])
+        db.execute(insert(Alumno), [{"id": i, "nombre_completo": f"Alumno {i}", "dni": str(i), "ciclo": "I", "usuario_id": 1} for i in range(1, alumnos + 1)])
+        aleatorio = random.Random(45)
+        tipos = ["practica", "examen_parcial", "tarea", "examen_final"]
+        db.execute(insert(Nota), [
+            {"alumno_id": k % alumnos + 1, "asignatura_id": 1, "calificacion": round(aleatorio.uniform(0, 20), 1),
+             "tipo_nota": tipos[k % len(tipos)], "publicada": True}
+            for k in range(notas)
+        ])
+        db.commit()
+
+        inicio = time.perf_counter()
+        columnas = load_grades(db, [1])
+        carga = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        vectorizado = grade_statistics(columnas)
+        calculo = time.perf_counter() - inicio
+
+        # Referencia fila a fila: objetos ORM, promedios por diccionario y puesto contando a los mejores
+        inicio = time.perf_counter()
+        por_alumno = {}
+        for nota in db.query(Nota).filter(Nota.asignatura_id == 1).all():
+            por_alumno.setdefault(nota.alumno_id, []).append(nota.calificacion)
+        promedios = {a: sum(v) / len(v) for a, v in por_alumno.items()}
+        puestos = {a: 1 + sum(1 for otro in promedios.values() if otro > p) for a, p in promedios.items()}
+        desviacion = statistics.pstdev([c for v in por_alumno.values() for c in v])
+        fila_a_fila = time.perf_counter() - inicio
+    finally:
+        db.close()
+        bench_engine.dispose()
+
+    coinciden = all(puestos[f["alumno_id"]] == f["puesto"] for f in vectorizado["ranking"]) and \
+        round(desviacion, 2) == vectorizado["notas"]["desviacion"]
+    return {
+        "notas": notas,
+        "alumnos": alumnos,
+        "carga_columnar_s": round(carga, 4),
+        "calculo_vectorizado_s": round(calculo, 4),
+        "fila_a_fila_s": round(fila_a_fila, 4),
+        "resultados_coinciden": coinciden,
+        "desviacion": vectorizado["notas"]["desviacion"],
+        "percentiles": vectorizado["notas"]["percentiles"],
+    }
+
+@app.get("/debug/promedios-benchmark", dependencies=BENCHMARK)
+def debug_promedios_benchmark(alumnos: int = 2000, notas_por_alumno: int = 20):
+    """Mide el recálculo vectorizado de los promedios de una asignatura completa (esquema por defecto)
+    frente al recálculo alumno por alumno con una consulta y un bucle en Python cada uno.
+    Síncrono a propósito: se ejecuta en el threadpool y no bloquea el event loop."""
+    import random
+    import time
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from models import Alumno, Asignatura, Nota, Promedio
+    from grading import CATEGORIAS, ESQUEMA_POR_DEFECTO, recompute_subject_grades
+
+    alumnos = max(1, min(alumnos, 10000))
+    notas_por_alumno = max(1, min(notas_por_alumno, 50))
+    bench_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    enable_sqlite_foreign_keys(bench_engine)
+    Base.metadata.create_all(bind=bench_engine)
+    db = sessionmaker(bind=bench_engine, autoflush=False)()
+    try:
+        db.execute(insert(Usuario), [{"id": 1, "nombre": "d", "email": "d@bench", "password_hash": "x", "rol": "docente"}])
+        db.execute(insert(Docente), [{"id": 1, "nombre_completo": "Docente", "dni": "0", "usuario_id": 1}])
+        db.execute(insert(Asignatura), [{"id": 1, "nombre": "Asignatura", "ciclo": "I", "docente_id": 1}])
+        db.execute(insert(Alumno), [{"id": i, "nombre_completo": f"Alumno {i}", "dni": str(i), "ciclo": "I", "usuario_id": 1} for i in range(1, alumnos + 1)])
+        aleatorio = random.Random(46)
+        tipos = [t for conf in ESQUEMA_POR_DEFECTO.values() for t in conf["tipos"]]
+        db.execute(insert(Nota), [
+            {"alumno_id": i, "asignatura_id": 1, "calificacion": round(aleatorio.uniform(0, 20), 1),
+             "tipo_nota": aleatorio.choice(tipos), "publicada": True}
+            for i in range(1, alumnos + 1) for _ in range(notas_por_alumno)
+        ])
+        db.commit()
+
+        inicio = time.perf_counter()
+        recompute_subject_grades(db, [1])
+        db.commit()
+        vectorizado = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        sin_cambios = recompute_subject_grades(db, [1])
+        db.commit()
+        repetido = time.perf_counter() - inicio
+
+        # Referencia: una consulta por alumno y el cálculo en Python
+        inicio = time.perf_counter()
+        referencia = {}
+        for alumno_id in range(1, alumnos + 1):
+            notas = db.query(Nota).filter(Nota.alumno_id == alumno_id, Nota.asignatura_id == 1).order_by(Nota.fecha_registro, Nota.id).all()
+            final = 0.0
+            for categoria in CATEGORIAS:
+                conf = ESQUEMA_POR_DEFECTO[categoria]
+                cal = [n.calificacion for n in notas if n.tipo_nota in conf["tipos"]]
+                if cal:
+                    final += conf["peso"] * (sum(cal) / len(cal) if conf["agregacion"] == "promedio" else cal[-1])
+            referencia[alumno_id] = round(final, 2)
+        por_alumno = time.perf_counter() - inicio
+
+        guardados = dict(db.query(Promedio.alumno_id, Promedio.promedio_final).filter(Promedio.asignatura_id == 1).all())
+    finally:
+        db.close()
+        bench_engine.dispose()
+
+    return {
+        "alumnos": alumnos,
+        "notas": alumnos * notas_por_alumno,
+        "recalculo_vectorizado_s": round(vectorizado, 4),
+        "recalculo_sin_cambios_s": round(repetido, 4),
+        "filas_reescritas_sin_cambios": sin_cambios,
+        "alumno_por_alumno_s": round(por_alumno, 4),
+        "resultados_coinciden": all(abs(guardados.get(a, -1) - v) < 0.011 for a, v in referencia.items()),
+    }
+
 @app.get("/debug/routes")
 async def debug_routes():
     """Devuelve la lista de rutas registradas y sus métodos (útil para depuración)."""
@@ -151,19 +779,6 @@ async def debug_routes():
             continue
     return {"count": len(routes), "routes": routes}
 
-# Ruta directa para enviar reporte por correo, como respaldo si el router no se actualiza
-@app.post("/docente/reportes/enviar-email")
-async def enviar_reporte_email_direct(
-    payload: dict,
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
-):
-    """Proxy que delega al handler del router de docente para enviar el reporte por email.
-    Esto garantiza que la ruta exista aun cuando el servidor no recargó correctamente el módulo docente.
-    """
-    from routers.docente import enviar_reporte_email as enviar
-    return await enviar(payload, db, current_user)
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
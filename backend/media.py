@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile
+from fastapi.staticfiles import StaticFiles
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+    import cloudinary
+    import cloudinary.exceptions
+    import cloudinary.uploader
+except Exception:
+    cloudinary = None
+
+load_dotenv()
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOADS_DIR = os.path.join(BACKEND_DIR, "uploads")
+LOGOS_DIR = os.path.join(UPLOADS_DIR, "logos")
+
+# Tamaño máximo aceptado para un logo (bytes) y tamaño de cada bloque leído del upload
+LOGO_MAX_BYTES = int(os.getenv("LOGO_MAX_BYTES", str(2 * 1024 * 1024)))
+_CHUNK_SIZE = 64 * 1024
+# Margen del cuerpo multipart sobre el archivo (boundaries y cabeceras de cada parte)
+_MULTIPART_MARGIN = 16 * 1024
+# Lado máximo en píxeles que se acepta decodificar (evita bombas de descompresión)
+_MAX_PIXELS = 4096 * 4096
+
+# Variantes generadas: nombre -> (lado máximo en px, formato, extensión)
+LOGO_VARIANTS = {
+    "favicon": (64, "PNG", "png"),
+    "header": (256, "PNG", "png"),
+    "header_webp": (256, "WEBP", "webp"),
+}
+
+# Subidas remotas (Cloudinary): hilos dedicados, timeout por intento y reintentos con espera creciente
+MEDIA_UPLOAD_WORKERS = int(os.getenv("MEDIA_UPLOAD_WORKERS", "2"))
+MEDIA_UPLOAD_TIMEOUT = float(os.getenv("MEDIA_UPLOAD_TIMEOUT", "20"))
+MEDIA_UPLOAD_RETRIES = int(os.getenv("MEDIA_UPLOAD_RETRIES", "3"))
+# URL base alternativa de la API de Cloudinary (p. ej. un servidor local de prueba)
+CLOUDINARY_UPLOAD_PREFIX = os.getenv("CLOUDINARY_UPLOAD_PREFIX") or None
+
+_upload_executor = ThreadPoolExecutor(max_workers=MEDIA_UPLOAD_WORKERS, thread_name_prefix="media-upload")
+_cloudinary_lock = threading.Lock()
+_cloudinary_state = {"configured": False}
+_upload_stats = {"remote_ok": 0, "remote_retries": 0, "local_fallback": 0, "rejected_too_large": 0}
+
+
+async def save_upload_limited(archivo: UploadFile, max_bytes: int = LOGO_MAX_BYTES) -> str:
+    """Copiar el upload a un archivo temporal por bloques, cortando al superar `max_bytes`"""
+    # Fuera de uploads/ para que el original nunca quede expuesto por StaticFiles
+    fd, tmp_path = tempfile.mkstemp(prefix="upload-")
+    total = 0
+    try:
+        with os.fdopen(fd, "wb") as destino:
+            while True:
+                chunk = await archivo.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"La imagen supera el máximo de {max_bytes // 1024} KB",
+                    )
+                destino.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    if total == 0:
+        os.remove(tmp_path)
+        raise HTTPException(status_code=400, detail="El archivo está vacío.")
+    return tmp_path
+
+
+class UploadLimitMiddleware:
+    """Middleware ASGI que limita el cuerpo de las rutas de subida antes de que se reciba entero.
+
+    FastAPI lee y guarda el formulario completo antes de llamar al endpoint, así que
+    save_upload_limited llega tarde para un archivo enorme: aquí se rechaza por Content-Length
+    y, si no viene o miente, se corta al superar el límite mientras se recibe.
+    """
+
+    def __init__(self, app, paths: Tuple[str, ...], max_bytes: int = LOGO_MAX_BYTES):
+        self.app = app
+        self.paths = paths
+        self.max_body = max_bytes + _MULTIPART_MARGIN
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST" or scope.get("path") not in self.paths:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers", []))
+        try:
+            declarado = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declarado = None
+        if declarado is not None and declarado > self.max_body:
+            return await self._reject(send)
+
+        recibido = 0
+
+        async def receive_limited():
+            nonlocal recibido
+            message = await receive()
+            if message["type"] == "http.request":
+                recibido += len(message.get("body", b""))
+                if recibido > self.max_body:
+                    # FastAPI propaga las HTTPException que surgen al leer el cuerpo
+                    _upload_stats["rejected_too_large"] += 1
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+    def _detail(self) -> str:
+        return f"La imagen supera el máximo de {self.max_bytes // 1024} KB"
+
+    async def _reject(self, send):
+        _upload_stats["rejected_too_large"] += 1
+        payload = json.dumps({"detail": self._detail()}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+
+def _encode(image: Image.Image, size: int, fmt: str) -> bytes:
+    variante = image.copy()
+    variante.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    if fmt == "WEBP":
+        variante.save(buffer, fmt, quality=82, method=6)
+    else:
+        variante.save(buffer, fmt, optimize=True)
+    return buffer.getvalue()
+
+
+def process_logo(tmp_path: str) -> Dict[str, str]:
+    """Generar las variantes del logo con hash de contenido en el nombre.
+
+    Devuelve {variante: nombre de archivo dentro de uploads/logos}. Es CPU intensivo:
+    llamarlo desde un hilo (run_in_threadpool).
+    """
+    os.makedirs(LOGOS_DIR, exist_ok=True)
+    try:
+        with Image.open(tmp_path) as original:
+            if original.width * original.height > _MAX_PIXELS:
+                raise HTTPException(status_code=400, detail="La imagen tiene dimensiones demasiado grandes.")
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("RGBA")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise HTTPException(status_code=400, detail="El archivo no es una imagen válida.")
+    finally:
+        os.remove(tmp_path)
+
+    archivos = {}
+    for nombre, (size, fmt, ext) in LOGO_VARIANTS.items():
+        contenido = _encode(image, size, fmt)
+        digest = hashlib.sha256(contenido).hexdigest()[:16]
+        filename = f"logo-{digest}-{size}.{ext}"
+        destino = os.path.join(LOGOS_DIR, filename)
+        # Mismo contenido -> mismo nombre: no se reescribe
+        if not os.path.exists(destino):
+            with open(destino, "wb") as f:
+                f.write(contenido)
+        archivos[nombre] = filename
+    return archivos
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles que marca como inmutables los archivos con hash de contenido en el nombre"""
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            nombre = os.path.basename(path)
+            if nombre.startswith("logo-"):
+                response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+            else:
+                response.headers["Cache-Control"] = "public, max-age=3600"
+        return response
+
+
+def _configure_cloudinary() -> bool:
+    """Configurar el SDK una sola vez por proceso. Devuelve False si no hay credenciales."""
+    if cloudinary is None:
+        return False
+    with _cloudinary_lock:
+        if not _cloudinary_state["configured"]:
+            cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
+            api_key = os.getenv("CLOUDINARY_API_KEY")
+            api_secret = os.getenv("CLOUDINARY_API_SECRET")
+            if not (cloud_name and api_key and api_secret):
+                return False
+            opciones = {"cloud_name": cloud_name, "api_key": api_key, "api_secret": api_secret, "secure": True}
+            if CLOUDINARY_UPLOAD_PREFIX:
+                opciones["upload_prefix"] = CLOUDINARY_UPLOAD_PREFIX
+            cloudinary.config(**opciones)
+            _cloudinary_state["configured"] = True
+    return True
+
+
+def _es_error_definitivo(error: Exception) -> bool:
+    # Errores del cliente (credenciales, parámetros): reintentar no los corrige
+    definitivos = (
+        cloudinary.exceptions.BadRequest,
+        cloudinary.exceptions.AuthorizationRequired,
+        cloudinary.exceptions.NotAllowed,
+        cloudinary.exceptions.NotFound,
+        cloudinary.exceptions.AlreadyExists,
+    )
+    return isinstance(error, definitivos)
+
+
+async def upload_remote(path: str, public_id: str) -> Optional[str]:
+    """Subir un archivo a Cloudinary sin bloquear el event loop.
+
+    Devuelve la URL pública, o None si el servicio no está configurado o no respondió
+    tras los reintentos (el llamador decide el respaldo local).
+    """
+    if not _configure_cloudinary():
+        return None
+
+    loop = asyncio.get_running_loop()
+    subir = partial(
+        cloudinary.uploader.upload,
+        path,
+        public_id=public_id,
+        resource_type="image",
+        overwrite=True,
+        timeout=MEDIA_UPLOAD_TIMEOUT,
+    )
+    for intento in range(1, MEDIA_UPLOAD_RETRIES + 1):
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(_upload_executor, subir),
+                timeout=MEDIA_UPLOAD_TIMEOUT + 5,
+            )
+            url = result.get("secure_url") or result.get("url")
+            if url:
+                _upload_stats["remote_ok"] += 1
+                return url
+            print(f"[Media] Cloudinary no devolvió URL: {result}")
+            return None
+        except Exception as e:
+            print(f"[Media] Error subiendo a Cloudinary (intento {intento}/{MEDIA_UPLOAD_RETRIES}): {e}")
+            if _es_error_definitivo(e) or intento == MEDIA_UPLOAD_RETRIES:
+                return None
+            _upload_stats["remote_retries"] += 1
+            await asyncio.sleep(0.5 * 2 ** (intento - 1))
+    return None
+
+
+def record_local_fallback() -> None:
+    _upload_stats["local_fallback"] += 1
+
+
+def media_stats() -> dict:
+    return {
+        **_upload_stats,
+        "cloudinary_configurado": _cloudinary_state["configured"],
+        "workers": MEDIA_UPLOAD_WORKERS,
+        "timeout": MEDIA_UPLOAD_TIMEOUT,
+        "reintentos": MEDIA_UPLOAD_RETRIES,
+    }
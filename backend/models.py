@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Date, LargeBinary
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Boolean, Date, LargeBinary, Index
+from sqlalchemy.orm import relationship, deferred, backref
 from sqlalchemy.sql import func
 from database import Base
 
@@ -15,8 +15,9 @@ class Usuario(Base):
     fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relaciones
-    alumno = relationship("Alumno", back_populates="usuario", uselist=False)
-    docente = relationship("Docente", back_populates="usuario", uselist=False)
+    # Los borrados se propagan en la base de datos (ON DELETE CASCADE); el ORM no carga los hijos
+    alumno = relationship("Alumno", back_populates="usuario", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+    docente = relationship("Docente", back_populates="usuario", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
 
 class Alumno(Base):
     __tablename__ = "alumnos"
@@ -28,43 +29,45 @@ class Alumno(Base):
     genero = Column(String(20), nullable=True)  # Masculino, Femenino, Otro
     telefono = Column(String(20), nullable=True)
     ciclo = Column(String(50), nullable=False)
-    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id", ondelete="CASCADE"), index=True, nullable=False)
     
     # Relaciones
     usuario = relationship("Usuario", back_populates="alumno")
-    notas = relationship("Nota", back_populates="alumno")
-    asignaturas_matriculadas = relationship("Asignatura", secondary="matriculas", overlaps="alumnos_matriculados")
-    historiales = relationship("HistorialAcademico", back_populates="alumno")
+    notas = relationship("Nota", back_populates="alumno", cascade="all, delete-orphan", passive_deletes=True)
+    asignaturas_matriculadas = relationship("Asignatura", secondary="matriculas", overlaps="alumnos_matriculados", passive_deletes=True)
+    historiales = relationship("HistorialAcademico", back_populates="alumno", cascade="all, delete-orphan", passive_deletes=True)
 
 class HistorialAcademico(Base):
     __tablename__ = "historiales_academicos"
     
     id = Column(Integer, primary_key=True, index=True)
-    alumno_id = Column(Integer, ForeignKey("alumnos.id"), nullable=False)
+    alumno_id = Column(Integer, ForeignKey("alumnos.id", ondelete="CASCADE"), index=True, nullable=False)
     ciclo = Column(String(50), nullable=False)
     fecha_registro = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relaciones
     alumno = relationship("Alumno", back_populates="historiales")
-    asignaturas = relationship("AsignaturaHistorial", back_populates="historial")
+    asignaturas = relationship("AsignaturaHistorial", back_populates="historial", cascade="all, delete-orphan", passive_deletes=True)
 
 class AsignaturaHistorial(Base):
     __tablename__ = "asignaturas_historial"
     
     id = Column(Integer, primary_key=True, index=True)
-    historial_id = Column(Integer, ForeignKey("historiales_academicos.id"), nullable=False)
+    historial_id = Column(Integer, ForeignKey("historiales_academicos.id", ondelete="CASCADE"), index=True, nullable=False)
     nombre = Column(String(200), nullable=False)
     promedio = Column(Float, nullable=False)
+    # Asignatura copiada en el snapshot (None para asignaturas fijas como "Cultura")
+    asignatura_origen_id = Column(Integer, ForeignKey("asignaturas.id", ondelete="SET NULL"), index=True, nullable=True)
     
     # Relaciones
     historial = relationship("HistorialAcademico", back_populates="asignaturas")
-    notas = relationship("NotaHistorial", back_populates="asignatura")
+    notas = relationship("NotaHistorial", back_populates="asignatura", cascade="all, delete-orphan", passive_deletes=True)
 
 class NotaHistorial(Base):
     __tablename__ = "notas_historial"
     
     id = Column(Integer, primary_key=True, index=True)
-    asignatura_id = Column(Integer, ForeignKey("asignaturas_historial.id"), nullable=False)
+    asignatura_id = Column(Integer, ForeignKey("asignaturas_historial.id", ondelete="CASCADE"), index=True, nullable=False)
     calificacion = Column(Float, nullable=False)
     tipo_nota = Column(String(50), nullable=False)
     fecha_registro = Column(DateTime(timezone=True), nullable=False)
@@ -78,7 +81,7 @@ class Docente(Base):
     id = Column(Integer, primary_key=True, index=True)
     nombre_completo = Column(String(200), nullable=False)
     dni = Column(String(20), unique=True, index=True, nullable=False)
-    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id", ondelete="CASCADE"), index=True, nullable=False)
     
     # Relaciones
     usuario = relationship("Usuario", back_populates="docente")
@@ -90,19 +93,19 @@ class Asignatura(Base):
     id = Column(Integer, primary_key=True, index=True)
     nombre = Column(String(200), nullable=False)
     ciclo = Column(String(50), nullable=False)
-    docente_id = Column(Integer, ForeignKey("docentes.id"), nullable=False)
+    docente_id = Column(Integer, ForeignKey("docentes.id"), index=True, nullable=False)
     
     # Relaciones
     docente = relationship("Docente", back_populates="asignaturas")
-    notas = relationship("Nota", back_populates="asignatura")
-    alumnos_matriculados = relationship("Alumno", secondary="matriculas", overlaps="asignaturas_matriculadas")
+    notas = relationship("Nota", back_populates="asignatura", cascade="all, delete-orphan", passive_deletes=True)
+    alumnos_matriculados = relationship("Alumno", secondary="matriculas", overlaps="asignaturas_matriculadas", passive_deletes=True)
 
 class Nota(Base):
     __tablename__ = "notas"
     
     id = Column(Integer, primary_key=True, index=True)
-    alumno_id = Column(Integer, ForeignKey("alumnos.id"), nullable=False)
-    asignatura_id = Column(Integer, ForeignKey("asignaturas.id"), nullable=False)
+    alumno_id = Column(Integer, ForeignKey("alumnos.id", ondelete="CASCADE"), nullable=False)
+    asignatura_id = Column(Integer, ForeignKey("asignaturas.id", ondelete="CASCADE"), index=True, nullable=False)
     calificacion = Column(Float, nullable=False)  # 0-20
     tipo_nota = Column(String(50), nullable=False)  # examen_final, examen_parcial, practica, participacion, etc.
     fecha_registro = Column(DateTime(timezone=True), server_default=func.now())
@@ -112,22 +115,26 @@ class Nota(Base):
     alumno = relationship("Alumno", back_populates="notas")
     asignatura = relationship("Asignatura", back_populates="notas")
 
+    # Casi todas las lecturas filtran por alumno y asignatura (promedios, reportes, historial);
+    # las claves foráneas hijas van indexadas para que los borrados en cascada no recorran la tabla
+    __table_args__ = (Index("ix_notas_alumno_asignatura", "alumno_id", "asignatura_id"),)
+
 # Tabla de relación muchos a muchos para matrículas
 from sqlalchemy import Table
 
 matriculas = Table(
     'matriculas',
     Base.metadata,
-    Column('alumno_id', Integer, ForeignKey('alumnos.id'), primary_key=True),
-    Column('asignatura_id', Integer, ForeignKey('asignaturas.id'), primary_key=True)
+    Column('alumno_id', Integer, ForeignKey('alumnos.id', ondelete="CASCADE"), primary_key=True),
+    Column('asignatura_id', Integer, ForeignKey('asignaturas.id', ondelete="CASCADE"), primary_key=True, index=True)
 )
 
 class Promedio(Base):
     __tablename__ = "promedios"
     
     id = Column(Integer, primary_key=True, index=True)
-    alumno_id = Column(Integer, ForeignKey("alumnos.id"), nullable=False)
-    asignatura_id = Column(Integer, ForeignKey("asignaturas.id"), nullable=False)
+    alumno_id = Column(Integer, ForeignKey("alumnos.id", ondelete="CASCADE"), index=True, nullable=False)
+    asignatura_id = Column(Integer, ForeignKey("asignaturas.id", ondelete="CASCADE"), index=True, nullable=False)
     actividades = Column(Float, nullable=True)
     practicas = Column(Float, nullable=True)
     parciales = Column(Float, nullable=True)
@@ -137,14 +144,15 @@ class Promedio(Base):
     fecha_actualizacion = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relaciones
-    alumno = relationship("Alumno", backref="promedios")
-    asignatura = relationship("Asignatura", backref="promedios")
+    alumno = relationship("Alumno", backref=backref("promedios", cascade="all, delete-orphan", passive_deletes=True))
+    asignatura = relationship("Asignatura", backref=backref("promedios", cascade="all, delete-orphan", passive_deletes=True))
 
 class ReporteDocente(Base):
     __tablename__ = "reportes_docentes"
 
     id = Column(Integer, primary_key=True, index=True)
-    docente_id = Column(Integer, ForeignKey("docentes.id"), nullable=False)
+    # Los reportes recibidos se conservan si se elimina el docente (nombre_docente queda como registro)
+    docente_id = Column(Integer, ForeignKey("docentes.id", ondelete="SET NULL"), index=True, nullable=True)
     nombre_docente = Column(String(200), nullable=False)
     asignatura = Column(String(200), nullable=False)
     tipo_evaluacion = Column(String(100), nullable=False)
@@ -154,20 +162,91 @@ class ReporteDocente(Base):
     # Relaciones
     docente = relationship("Docente")
 
-# Nuevo: almacenamiento de archivo del reporte en la base de datos
+# Archivo del reporte: el contenido vive en el almacén de blobs en disco (report_store.py).
+# `content` solo conserva datos de filas antiguas hasta su migración y nunca se carga por defecto.
 class ReporteArchivoDocente(Base):
     __tablename__ = "reportes_docentes_archivos"
 
     id = Column(Integer, primary_key=True, index=True)
-    reporte_id = Column(Integer, ForeignKey("reportes_docentes.id"), nullable=False)
+    reporte_id = Column(Integer, ForeignKey("reportes_docentes.id", ondelete="CASCADE"), index=True, nullable=False)
     filename = Column(String(300), nullable=False)
     mime_type = Column(String(100), nullable=True)
-    content = Column(LargeBinary, nullable=False)
+    content = deferred(Column(LargeBinary, nullable=False))
+    sha256 = Column(String(64), index=True, nullable=True)
+    size = Column(Integer, nullable=True)
     fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relaciones
     reporte = relationship("ReporteDocente")
 
+# Contenido único de archivos de reportes (deduplicado por hash). `ref_count` cuenta las filas de
+# ReporteArchivoDocente que lo usan; al llegar a 0 el blob se elimina del disco.
+class ReporteBlob(Base):
+    __tablename__ = "reportes_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    stored_size = Column(Integer, nullable=False)
+    compression = Column(String(10), nullable=True)  # gzip o None
+    ref_count = Column(Integer, nullable=False, default=0)
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Esquema de calificación de una asignatura (grading.py): peso, tipos de nota y forma de agregar
+# de cada categoría de la tabla promedios. Sin fila se usa el esquema por defecto.
+class EsquemaCalificacion(Base):
+    __tablename__ = "esquemas_calificacion"
+
+    asignatura_id = Column(Integer, ForeignKey("asignaturas.id", ondelete="CASCADE"), primary_key=True)
+    categorias = Column(Text, nullable=False)  # JSON: {categoria: {"peso", "tipos", "agregacion"}}
+    fecha_actualizacion = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# Agregados por asignatura para la analítica del administrador (analytics.py).
+# Se recalculan por asignatura al escribir notas, publicarlas o cambiar matrículas.
+class AnaliticaAsignatura(Base):
+    __tablename__ = "analitica_asignaturas"
+
+    asignatura_id = Column(Integer, ForeignKey("asignaturas.id", ondelete="CASCADE"), primary_key=True)
+    matriculados = Column(Integer, nullable=False, default=0)
+    alumnos_evaluados = Column(Integer, nullable=False, default=0)  # con al menos una nota publicada
+    aprobados = Column(Integer, nullable=False, default=0)  # nota publicada máxima >= PASSING_GRADE
+    notas_registradas = Column(Integer, nullable=False, default=0)
+    notas_publicadas = Column(Integer, nullable=False, default=0)
+    suma_publicadas = Column(Float, nullable=False, default=0)
+    histograma = Column(String(200), nullable=False, default="[]")  # JSON: notas publicadas por punto entero 0..20
+    fecha_actualizacion = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# Registro de cambios para la sincronización incremental (change_log.py). Lo llenan triggers de
+# SQLite sobre notas, promedios y matriculas, así que también captura borrados en bloque y en cascada.
+# Sin claves foráneas: la entrada sobrevive a la fila que describe.
+class CambioRegistro(Base):
+    __tablename__ = "cambios"
+
+    id = Column(Integer, primary_key=True)  # cursor de sincronización; AUTOINCREMENT nunca reutiliza ids
+    tabla = Column(String(20), nullable=False)  # notas, promedios, matriculas
+    fila_id = Column(Integer, nullable=True)  # None en matriculas (la clave es alumno + asignatura)
+    alumno_id = Column(Integer, nullable=False)
+    asignatura_id = Column(Integer, nullable=False)
+    operacion = Column(String(1), nullable=False)  # I, U, D
+    fecha = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_cambios_alumno", "alumno_id", "id"),
+        Index("ix_cambios_asignatura", "asignatura_id", "id"),
+        Index("ix_cambios_fecha", "fecha"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+# Contadores de versión por entidad para los ETag de las lecturas (versioning.py). Los incrementan
+# triggers de SQLite: "notas" cuenta cualquier cambio en la tabla y "notas:5" los de las notas del alumno 5.
+class VersionEntidad(Base):
+    __tablename__ = "versiones"
+
+    clave = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
 
 class ConfiguracionSistema(Base):
     __tablename__ = "configuracion_sistema"
@@ -176,3 +255,21 @@ class ConfiguracionSistema(Base):
     nombre_sistema = Column(String(200), nullable=False, default="Sistema de Gestión de Notas")
     logo_url = Column(String(500), nullable=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Se incrementa en cada cambio; los workers lo comparan para refrescar su caché
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(64), unique=True, index=True, nullable=False)
+    # Todos los tokens obtenidos por rotación desde un mismo login comparten familia
+    family = Column(String(64), index=True, nullable=False)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id", ondelete="CASCADE"), index=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked = Column(Boolean, default=False, nullable=False)
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relaciones
+    usuario = relationship("Usuario")
@@ -0,0 +1,231 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+# Límites por IP y por cuenta: "capacidad/segundos" (ráfaga máxima y tiempo en recargarla completa)
+LOGIN_LIMIT_IP = os.getenv("LOGIN_LIMIT_IP", "20/60")
+LOGIN_LIMIT_ACCOUNT = os.getenv("LOGIN_LIMIT_ACCOUNT", "5/300")
+RECOVERY_LIMIT_IP = os.getenv("RECOVERY_LIMIT_IP", "5/300")
+RECOVERY_LIMIT_ACCOUNT = os.getenv("RECOVERY_LIMIT_ACCOUNT", "2/900")
+# Backend compartido opcional (varios workers/instancias). Sin él se usa la memoria del proceso.
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+# Solo detrás de un proxy de confianza: tomar la IP de X-Forwarded-For
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+
+# Cuerpo máximo que se lee para extraer la cuenta; por encima solo se limita por IP
+_MAX_BODY = 16 * 1024
+
+
+def parse_limit(value: str) -> Tuple[int, float]:
+    """Convertir "5/300" en (capacidad, tokens recargados por segundo)"""
+    capacidad, segundos = value.split("/")
+    capacidad = int(capacidad)
+    return capacidad, capacidad / float(segundos)
+
+
+class LocalBucketBackend:
+    """Token buckets en memoria del proceso (suplente local del backend compartido).
+
+    Como mucho `max_keys` buckets, desalojados en orden LRU: cada petición cuesta O(1) aunque
+    se creen cuentas distintas a propósito. Las claves por IP se usan en cada intento y no se desalojan
+    mientras el atacante siga enviando.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        """Consumir un token. Devuelve (permitido, segundos hasta el próximo token)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _, _ = self._buckets.get(key, (float(capacity), now, capacity, rate))
+            tokens = min(float(capacity), tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, capacity, rate)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now, capacity, rate)
+                allowed, retry_after = False, (1 - tokens) / rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed, retry_after
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketBackend:
+    """Token buckets compartidos en Redis; el cálculo se hace atómicamente en el servidor."""
+
+    _SCRIPT = """
+    local data = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local tokens = tonumber(data[1]) or capacity
+    local updated = tonumber(data[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self._SCRIPT)
+
+    def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        allowed, tokens = self._take(keys=[f"ratelimit:{key}"], args=[capacity, rate, time.time()])
+        if int(allowed):
+            return True, 0.0
+        return False, (1 - float(tokens)) / rate
+
+    def reset(self) -> None:
+        for key in self._client.scan_iter("ratelimit:*"):
+            self._client.delete(key)
+
+
+def build_backend():
+    if RATE_LIMIT_REDIS_URL and redis is not None:
+        try:
+            backend = RedisBucketBackend(RATE_LIMIT_REDIS_URL)
+            backend._client.ping()
+            return backend
+        except Exception as e:
+            print(f"Rate limit: Redis no disponible ({e}), usando memoria local")
+    return LocalBucketBackend()
+
+
+# Rutas limitadas: (IP, cuenta) y el campo del cuerpo que identifica la cuenta
+DEFAULT_RULES = {
+    "/auth/login": {
+        "ip": parse_limit(LOGIN_LIMIT_IP),
+        "account": parse_limit(LOGIN_LIMIT_ACCOUNT),
+        "field": "username",
+    },
+    "/auth/recuperar-contrasena": {
+        "ip": parse_limit(RECOVERY_LIMIT_IP),
+        "account": parse_limit(RECOVERY_LIMIT_ACCOUNT),
+        "field": "email",
+    },
+}
+
+_stats = {"allowed": 0, "limited": 0}
+limiter_state = {"backend": None}
+
+
+def _account_from_body(body: bytes, content_type: str, field: str) -> Optional[str]:
+    try:
+        if "application/json" in content_type:
+            value = json.loads(body or b"{}").get(field)
+        else:
+            value = (parse_qs(body.decode("utf-8")).get(field) or [None])[0]
+    except Exception:
+        return None
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI que aplica token buckets por IP y por cuenta antes de llegar al endpoint.
+
+    Responde 429 con Retry-After sin tocar la base de datos ni bcrypt. El cuerpo
+    se lee una sola vez y se reenvía intacto al endpoint.
+    """
+
+    def __init__(self, app, rules: Optional[dict] = None, backend=None):
+        self.app = app
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.backend = backend or build_backend()
+        limiter_state["backend"] = self.backend
+
+    async def __call__(self, scope, receive, send):
+        rule = self.rules.get(scope.get("path")) if scope["type"] == "http" else None
+        if rule is None or scope.get("method") != "POST":
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        client = scope.get("client")
+        ip = client[0] if client else "desconocido"
+        if RATE_LIMIT_TRUST_PROXY and headers.get("x-forwarded-for"):
+            ip = headers["x-forwarded-for"].split(",")[0].strip()
+
+        chunks: List[bytes] = []
+        size = 0
+        more = True
+        while more and size <= _MAX_BODY:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        keys = [(f"ip:{scope['path']}:{ip}", rule["ip"])]
+        account = _account_from_body(body, headers.get("content-type", ""), rule["field"]) if size <= _MAX_BODY else None
+        if account:
+            keys.append((f"cuenta:{scope['path']}:{account}", rule["account"]))
+
+        for key, (capacity, rate) in keys:
+            allowed, retry_after = self.backend.take(key, capacity, rate)
+            if not allowed:
+                _stats["limited"] += 1
+                return await self._reject(send, retry_after)
+        _stats["allowed"] += 1
+
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": more}
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+    async def _reject(self, send, retry_after: float):
+        payload = json.dumps({"detail": "Demasiados intentos, espera antes de reintentar"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+
+
+def rate_limit_stats() -> dict:
+    backend = limiter_state["backend"]
+    return {
+        **_stats,
+        "backend": type(backend).__name__ if backend else None,
+        "rules": {path: {"ip": r["ip"], "account": r["account"]} for path, r in DEFAULT_RULES.items()},
+    }
@@ -0,0 +1,307 @@
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from typing import Iterable, Iterator, Optional, Union
+
+from dotenv import load_dotenv
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import case, func, text, update
+from sqlalchemy.orm import Session
+
+from models import ReporteArchivoDocente, ReporteBlob
+
+load_dotenv()
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Archivos de reportes direccionados por contenido: <dir>/<ab>/<sha256>[.gz]
+REPORT_BLOB_DIR = os.getenv("REPORT_BLOB_DIR") or os.path.join(BACKEND_DIR, "reports", "blobs")
+# Tamaño de los bloques leídos al migrar contenido antiguo desde la base de datos
+_CHUNK_SIZE = 256 * 1024
+# Solo se guarda comprimido si ahorra al menos este porcentaje (los PDF ya vienen comprimidos)
+_MIN_AHORRO = 0.10
+# Temporales abandonados (p. ej. por una caída a mitad de escritura) se borran tras este tiempo
+_TMP_MAX_AGE = 3600
+
+
+def blob_path(sha256: str, compression: Optional[str] = None) -> str:
+    path = os.path.join(REPORT_BLOB_DIR, sha256[:2], sha256)
+    return path + ".gz" if compression == "gzip" else path
+
+
+def _tmp_file() -> str:
+    os.makedirs(REPORT_BLOB_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=REPORT_BLOB_DIR, prefix=".tmp-")
+    os.close(fd)
+    return tmp_path
+
+
+def _prepare_blob(raw_path: str, size: int):
+    """Comprimir con gzip el archivo crudo si compensa. Devuelve (compresión, temporal elegido, bytes en disco)."""
+    gz_path = _tmp_file()
+    with open(raw_path, "rb") as origen, gzip.open(gz_path, "wb", compresslevel=6) as destino:
+        shutil.copyfileobj(origen, destino, _CHUNK_SIZE)
+    gz_size = os.path.getsize(gz_path)
+
+    if gz_size <= size * (1 - _MIN_AHORRO):
+        compression, elegido, descartado, stored_size = "gzip", gz_path, raw_path, gz_size
+    else:
+        compression, elegido, descartado, stored_size = None, raw_path, gz_path, size
+    os.remove(descartado)
+    return compression, elegido, stored_size
+
+
+def _place_blob(tmp_path: str, sha256: str, compression: Optional[str]) -> None:
+    destino = blob_path(sha256, compression)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    os.replace(tmp_path, destino)
+
+
+# Los contadores se cambian en la propia sentencia (no leer-modificar-escribir en Python):
+# dos envíos simultáneos del mismo contenido no pierden referencias ni chocan al insertar
+_INSERTAR_O_SUMAR = text(
+    "INSERT INTO reportes_blobs (sha256, size, stored_size, compression, ref_count) "
+    "VALUES (:sha256, :size, :stored_size, :compression, 1) "
+    "ON CONFLICT(sha256) DO UPDATE SET ref_count = ref_count + 1, "
+    "stored_size = excluded.stored_size, compression = excluded.compression"
+)
+
+
+def _increment(db: Session, sha256: str) -> bool:
+    resultado = db.execute(
+        update(ReporteBlob).where(ReporteBlob.sha256 == sha256)
+        .values(ref_count=ReporteBlob.ref_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount > 0
+
+
+def _add_reference(db: Session, raw_path: str, sha256: str, size: int) -> ReporteBlob:
+    """Sumar una referencia al blob `sha256`, guardándolo solo si aún no existe"""
+    blob = db.get(ReporteBlob, sha256)
+    if blob is not None and os.path.exists(blob_path(sha256, blob.compression)) and _increment(db, sha256):
+        # Mismo contenido ya almacenado
+        os.remove(raw_path)
+    else:
+        # Fila nueva, o la fila existía pero el archivo se perdió (o se purgó entretanto): se repone.
+        # La fila se escribe antes de mover el archivo: un purge_blobs en curso termina (y borra
+        # sus archivos) antes de que esta sentencia obtenga el bloqueo, nunca después
+        compression, tmp_path, stored_size = _prepare_blob(raw_path, size)
+        try:
+            db.execute(_INSERTAR_O_SUMAR, {
+                "sha256": sha256, "size": size, "stored_size": stored_size, "compression": compression,
+            })
+            _place_blob(tmp_path, sha256, compression)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return db.get(ReporteBlob, sha256, populate_existing=True)
+
+
+def put_blob(db: Session, chunks: Iterable[bytes]) -> ReporteBlob:
+    """Guardar bloques de bytes en el almacén (deduplicado y comprimido) y sumar una referencia"""
+    raw_path = _tmp_file()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(raw_path, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(raw_path)
+        raise
+    return _add_reference(db, raw_path, digest.hexdigest(), size)
+
+
+def store_report_file(db: Session, reporte_id: int, filename: str, mime_type: str,
+                      content: Union[bytes, Iterable[bytes]]) -> ReporteArchivoDocente:
+    """Registrar el archivo de un reporte guardando el contenido en disco (no en la BD).
+
+    `content` puede ser bytes o un iterable de bloques (p. ej. un CSV generado fila a fila).
+    """
+    blob = put_blob(db, [content] if isinstance(content, bytes) else content)
+    archivo = ReporteArchivoDocente(
+        reporte_id=reporte_id,
+        filename=filename,
+        mime_type=mime_type,
+        # La columna es NOT NULL en bases existentes; el contenido real vive en el almacén
+        content=b"",
+        sha256=blob.sha256,
+        size=blob.size,
+    )
+    db.add(archivo)
+    return archivo
+
+
+def _adopt_raw_file(db: Session, sha256: str) -> ReporteBlob:
+    # Blob sin comprimir guardado antes de existir la tabla de referencias
+    refs = db.query(func.count(ReporteArchivoDocente.id)).filter(ReporteArchivoDocente.sha256 == sha256).scalar()
+    size = os.path.getsize(blob_path(sha256))
+    blob = ReporteBlob(sha256=sha256, size=size, stored_size=size, compression=None, ref_count=refs)
+    db.add(blob)
+    return blob
+
+
+def ensure_blob(db: Session, archivo: ReporteArchivoDocente) -> Optional[ReporteBlob]:
+    """Devolver el blob del archivo, migrando por bloques el contenido guardado en la BD.
+
+    Devuelve None si el contenido no está ni en disco ni en la base de datos.
+    """
+    if archivo.sha256:
+        blob = db.get(ReporteBlob, archivo.sha256)
+        if blob is not None and os.path.exists(blob_path(blob.sha256, blob.compression)):
+            return blob
+        if blob is None and os.path.exists(blob_path(archivo.sha256)):
+            blob = _adopt_raw_file(db, archivo.sha256)
+            db.commit()
+            return blob
+
+    total = db.query(func.length(ReporteArchivoDocente.content)).filter(ReporteArchivoDocente.id == archivo.id).scalar() or 0
+    if total == 0:
+        return None
+    raw_path = _tmp_file()
+    digest = hashlib.sha256()
+    with open(raw_path, "wb") as f:
+        # substr() de SQLite es 1-indexado y sobre BLOB cuenta bytes
+        for inicio in range(1, total + 1, _CHUNK_SIZE):
+            chunk = db.query(func.substr(ReporteArchivoDocente.content, inicio, _CHUNK_SIZE)).filter(
+                ReporteArchivoDocente.id == archivo.id
+            ).scalar()
+            chunk = bytes(chunk or b"")
+            digest.update(chunk)
+            f.write(chunk)
+    blob = _add_reference(db, raw_path, digest.hexdigest(), total)
+
+    archivo.sha256 = blob.sha256
+    archivo.size = total
+    archivo.content = b""
+    db.commit()
+    return blob
+
+
+def iter_blob(blob: ReporteBlob) -> Iterator[bytes]:
+    """Leer el contenido original del blob por bloques (descomprimiendo si hace falta)"""
+    path = blob_path(blob.sha256, blob.compression)
+    opener = gzip.open if blob.compression == "gzip" else open
+    with opener(path, "rb") as f:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def blob_response(blob: ReporteBlob, filename: str, media_type: str, accept_encoding: str = ""):
+    """Respuesta de descarga de un blob.
+
+    Sin comprimir, o si el cliente acepta gzip, se sirve el archivo tal cual (con soporte de Range);
+    si no, se descomprime en streaming.
+    """
+    headers = {"Cache-Control": "private, max-age=3600"}
+    if blob.compression is None or "gzip" in accept_encoding.lower():
+        if blob.compression == "gzip":
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+        return FileResponse(
+            path=blob_path(blob.sha256, blob.compression),
+            media_type=media_type,
+            filename=filename,
+            headers=headers,
+        )
+    headers["Content-Disposition"] = f"attachment; filename=\"{filename}\""
+    headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(iter_blob(blob), media_type=media_type, headers=headers)
+
+
+def release_blob(db: Session, sha256: Optional[str]) -> None:
+    """Restar una referencia al blob. Llamar en la misma transacción que borra el archivo del reporte."""
+    if not sha256:
+        return
+    db.execute(
+        update(ReporteBlob).where(ReporteBlob.sha256 == sha256)
+        .values(ref_count=case((ReporteBlob.ref_count > 0, ReporteBlob.ref_count - 1), else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _remove_files(sha256: str) -> None:
+    for compression in (None, "gzip"):
+        try:
+            os.remove(blob_path(sha256, compression))
+        except FileNotFoundError:
+            pass
+
+
+def purge_blobs(db: Session, shas: Iterable[Optional[str]]) -> int:
+    """Eliminar (fila y archivo) los blobs indicados que ya no tienen referencias. Llamar después del commit.
+
+    El DELETE comprueba ref_count y el archivo se borra antes del commit, con la fila aún bloqueada:
+    una referencia nueva espera al commit, no encuentra la fila y vuelve a guardar el archivo.
+    """
+    eliminados = 0
+    for sha256 in {s for s in shas if s}:
+        borrados = db.query(ReporteBlob).filter(
+            ReporteBlob.sha256 == sha256,
+            ReporteBlob.ref_count <= 0,
+        ).delete(synchronize_session=False)
+        if borrados:
+            _remove_files(sha256)
+            eliminados += 1
+        db.commit()
+    return eliminados
+
+
+def collect_garbage(db: Session) -> dict:
+    """Recalcular referencias desde la BD y borrar blobs sin uso, archivos huérfanos y temporales viejos"""
+    refs = dict(
+        db.query(ReporteArchivoDocente.sha256, func.count(ReporteArchivoDocente.id))
+        .filter(ReporteArchivoDocente.sha256.isnot(None))
+        .group_by(ReporteArchivoDocente.sha256)
+        .all()
+    )
+    for blob in db.query(ReporteBlob).all():
+        blob.ref_count = refs.get(blob.sha256, 0)
+    db.commit()
+    sin_uso = [sha for (sha,) in db.query(ReporteBlob.sha256).filter(ReporteBlob.ref_count <= 0).all()]
+    blobs_eliminados = purge_blobs(db, sin_uso)
+
+    conocidos = {sha for (sha,) in db.query(ReporteBlob.sha256).all()}
+    huerfanos = 0
+    ahora = time.time()
+    if os.path.isdir(REPORT_BLOB_DIR):
+        for raiz, _dirs, archivos in os.walk(REPORT_BLOB_DIR):
+            for nombre in archivos:
+                path = os.path.join(raiz, nombre)
+                if nombre.startswith(".tmp-"):
+                    if ahora - os.path.getmtime(path) > _TMP_MAX_AGE:
+                        os.remove(path)
+                        huerfanos += 1
+                    continue
+                sha256 = nombre[:-3] if nombre.endswith(".gz") else nombre
+                # Blobs sin fila pero aún referenciados (formato anterior) se conservan
+                if sha256 not in conocidos and sha256 not in refs:
+                    os.remove(path)
+                    huerfanos += 1
+    return {"blobs_eliminados": blobs_eliminados, "archivos_huerfanos_eliminados": huerfanos}
+
+
+def report_store_stats(db: Session) -> dict:
+    blobs, size, stored_size, refs = db.query(
+        func.count(ReporteBlob.sha256),
+        func.coalesce(func.sum(ReporteBlob.size), 0),
+        func.coalesce(func.sum(ReporteBlob.stored_size), 0),
+        func.coalesce(func.sum(ReporteBlob.ref_count), 0),
+    ).one()
+    pendientes = db.query(func.count(ReporteArchivoDocente.id)).filter(func.length(ReporteArchivoDocente.content) > 0).scalar()
+    return {
+        "blobs": blobs,
+        "referencias": refs,
+        "bytes_originales": size,
+        "bytes_en_disco": stored_size,
+        "archivos_pendientes_de_migrar": pendientes,
+    }
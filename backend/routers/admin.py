@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request, Response
 from sqlalchemy.orm import Session, joinedload
-from typing import List
+from typing import List, Optional
 from database import get_db
-from models import Usuario, Alumno, Docente, Asignatura, Nota, Promedio, matriculas, HistorialAcademico, AsignaturaHistorial, NotaHistorial, ReporteDocente, ReporteArchivoDocente
+from models import Usuario, Alumno, Docente, Asignatura, Nota, matriculas, ReporteDocente, ReporteArchivoDocente
 from schemas import (
     AlumnoCreate, AlumnoUpdate, Alumno as AlumnoSchema,
     DocenteCreate, Docente as DocenteSchema,
@@ -10,11 +10,17 @@ from schemas import (
     MatriculaCreate, Matricula,
     ReporteDocente as ReporteDocenteSchema
 )
-from auth import require_role, get_password_hash, verify_password
+from auth import require_role, invalidate_identity, revoke_refresh_tokens
+from hashing import get_password_hash_async, verify_password_async
+from academic_summary import invalidate_summaries, invalidate_asignatura_summaries
+from change_log import changes_since
+from versioning import not_modified
+from analytics import get_analytics, get_totals, invalidate_analytics, rebuild_analytics, refresh_subject_stats, student_subject_ids
+from history_snapshot import CicloSnapshot, snapshot_cycles, invalidate_history
+from report_store import ensure_blob, blob_response, release_blob, purge_blobs
 from fastapi import BackgroundTasks
 from sqlalchemy.orm import Session
 from starlette.responses import FileResponse
-from fastapi.responses import StreamingResponse
 import os
 import re
 import csv
@@ -67,134 +73,108 @@ def get_base_ciclo(ciclo: str) -> str:
     return text
 
 
-def alumno_aprobo_asignatura(db: Session, alumno_id: int, asignatura_id: int) -> bool:
-    notas = db.query(Nota).filter(
-        Nota.alumno_id == alumno_id,
-        Nota.asignatura_id == asignatura_id,
-        Nota.publicada == True
-    ).all()
-    if not notas:
-        return False
-    return max(n.calificacion for n in notas) >= PASSING_GRADE
-
-
-def registrar_alumno_en_siguiente_ciclo(db: Session, alumno: Alumno) -> dict:
-    resultado = {"alumno_id": alumno.id, "nombre": alumno.nombre_completo, "matriculado": False, "registrado": False, "mensaje": ""}
-    try:
-        next_ciclo = get_next_cycle(alumno.ciclo)
-    except ValueError as e:
-        resultado["mensaje"] = str(e)
-        return resultado
-
-    # Guardar el ciclo actual antes de cambiarlo
-    ciclo_actual = alumno.ciclo
-
-    matriculas_data = db.execute(
-        matriculas.select().where(matriculas.c.alumno_id == alumno.id)
-    ).fetchall()
-
-    asignaturas_actuales_ids = [m.asignatura_id for m in matriculas_data]
-    asignaturas_actuales = db.query(Asignatura).filter(
-        Asignatura.id.in_(asignaturas_actuales_ids),
-        Asignatura.ciclo == get_base_ciclo(ciclo_actual)
-    ).all()
-
-    if not asignaturas_actuales:
-        resultado["mensaje"] = "No se encontraron asignaturas del ciclo actual para evaluar."
-        return resultado
-
-    # Verificar si todas las asignaturas están aprobadas
-    asignaturas_no_aprobadas = []
-    for asign in asignaturas_actuales:
-        if not alumno_aprobo_asignatura(db, alumno.id, asign.id):
-            asignaturas_no_aprobadas.append(asign.nombre)
-    
-    if asignaturas_no_aprobadas:
-        resultado["mensaje"] = f"No puede avanzar al siguiente ciclo. No ha aprobado las siguientes asignaturas: {', '.join(asignaturas_no_aprobadas)}."
-        resultado["puede_avanzar"] = False
-        return resultado
-    
-    resultado["puede_avanzar"] = True
-
-    # Crear historial académico para el ciclo actual antes de avanzar al siguiente
-    historial = HistorialAcademico(
-        alumno_id=alumno.id,
-        ciclo=ciclo_actual
-    )
-    db.add(historial)
-    db.flush()  # Para obtener el ID del historial
-    
-    # Agregar asignaturas al historial
-    for asignatura in asignaturas_actuales:
-        # Calcular promedio de notas para esta asignatura
-        promedio_query = db.query(func.avg(Nota.calificacion)).filter(
-            Nota.alumno_id == alumno.id,
-            Nota.asignatura_id == asignatura.id
-        ).scalar()
-        
-        promedio = promedio_query if promedio_query else 0.0
-        
-        # Crear asignatura en historial
-        asignatura_historial = AsignaturaHistorial(
-            historial_id=historial.id,
-            nombre=asignatura.nombre,
-            promedio=promedio
-        )
-        db.add(asignatura_historial)
-        db.flush()
-        
-        # Obtener notas de esta asignatura
-        notas = db.query(Nota).filter(
-            Nota.alumno_id == alumno.id,
-            Nota.asignatura_id == asignatura.id
-        ).all()
-        
-        # Guardar notas en historial
-        for nota in notas:
-            nota_historial = NotaHistorial(
-                asignatura_id=asignatura_historial.id,
-                calificacion=nota.calificacion,
-                tipo_nota=nota.tipo_nota,
-                fecha_registro=nota.fecha_registro
-            )
-            db.add(nota_historial)
-    
-    # Agregar la asignatura "Cultura" al historial si el alumno está pasando del ciclo I al II
-    if ciclo_actual == "I" and next_ciclo == "II":
-        asignatura_cultura = AsignaturaHistorial(
-            historial_id=historial.id,
-            nombre="Cultura",
-            promedio=15.0  # Promedio predeterminado
-        )
-        db.add(asignatura_cultura)
-        db.flush()
-        
-        # Agregar una nota para la asignatura Cultura
-        nota_cultura = NotaHistorial(
-            asignatura_id=asignatura_cultura.id,
-            calificacion=15.0,
-            tipo_nota="Promedio Final",
-            fecha_registro=func.now()
-        )
-        db.add(nota_cultura)
+def _notas_maximas_publicadas(db: Session, alumno_ids: List[int]) -> dict:
+    """{(alumno_id, asignatura_id): mayor nota publicada} en una sola consulta por lote"""
+    maximas = {}
+    for inicio in range(0, len(alumno_ids), 500):
+        lote = alumno_ids[inicio:inicio + 500]
+        filas = db.query(Nota.alumno_id, Nota.asignatura_id, func.max(Nota.calificacion)).filter(
+            Nota.alumno_id.in_(lote),
+            Nota.publicada == True
+        ).group_by(Nota.alumno_id, Nota.asignatura_id).all()
+        maximas.update({(a, s): m for a, s, m in filas})
+    return maximas
+
+
+def _asignaturas_matriculadas(db: Session, alumno_ids: List[int]) -> dict:
+    """{alumno_id: [(asignatura_id, nombre, ciclo), ...]} en una sola consulta por lote"""
+    por_alumno = {}
+    for inicio in range(0, len(alumno_ids), 500):
+        lote = alumno_ids[inicio:inicio + 500]
+        filas = db.query(matriculas.c.alumno_id, Asignatura.id, Asignatura.nombre, Asignatura.ciclo).join(
+            Asignatura, Asignatura.id == matriculas.c.asignatura_id
+        ).filter(matriculas.c.alumno_id.in_(lote)).order_by(Asignatura.id).all()
+        for alumno_id, asignatura_id, nombre, ciclo in filas:
+            por_alumno.setdefault(alumno_id, []).append((asignatura_id, nombre, ciclo))
+    return por_alumno
+
+
+def registrar_cohorte_en_siguiente_ciclo(db: Session, alumnos: List[Alumno]) -> List[dict]:
+    """Registrar en el siguiente ciclo a los alumnos que aprobaron todo su ciclo actual.
+
+    Las aprobaciones se evalúan con consultas agrupadas y el historial de todos los que avanzan
+    se copia con un único snapshot en bloque; se hace un solo commit.
+    """
+    alumno_ids = [a.id for a in alumnos]
+    matriculadas = _asignaturas_matriculadas(db, alumno_ids)
+    maximas = _notas_maximas_publicadas(db, alumno_ids)
+    asignaturas_por_ciclo = {}
+    resultados = []
+    avanzan = []
 
-    asignaturas_siguiente = db.query(Asignatura).filter(Asignatura.ciclo == get_base_ciclo(next_ciclo)).all()
+    for alumno in alumnos:
+        resultado = {"alumno_id": alumno.id, "nombre": alumno.nombre_completo, "matriculado": False, "registrado": False, "mensaje": ""}
+        resultados.append(resultado)
+        try:
+            next_ciclo = get_next_cycle(alumno.ciclo)
+        except ValueError as e:
+            resultado["mensaje"] = str(e)
+            continue
+
+        ciclo_actual = alumno.ciclo
+        asignaturas_actuales = [
+            (asignatura_id, nombre) for asignatura_id, nombre, ciclo in matriculadas.get(alumno.id, [])
+            if ciclo == get_base_ciclo(ciclo_actual)
+        ]
+        if not asignaturas_actuales:
+            resultado["mensaje"] = "No se encontraron asignaturas del ciclo actual para evaluar."
+            continue
+
+        # Verificar si todas las asignaturas están aprobadas
+        asignaturas_no_aprobadas = [
+            nombre for asignatura_id, nombre in asignaturas_actuales
+            if maximas.get((alumno.id, asignatura_id), -1) < PASSING_GRADE
+        ]
+        if asignaturas_no_aprobadas:
+            resultado["mensaje"] = f"No puede avanzar al siguiente ciclo. No ha aprobado las siguientes asignaturas: {', '.join(asignaturas_no_aprobadas)}."
+            resultado["puede_avanzar"] = False
+            continue
+
+        base_siguiente = get_base_ciclo(next_ciclo)
+        if base_siguiente not in asignaturas_por_ciclo:
+            asignaturas_por_ciclo[base_siguiente] = [
+                a.id for a in db.query(Asignatura.id).filter(Asignatura.ciclo == base_siguiente).all()
+            ]
+        asignaturas_siguiente_ids = asignaturas_por_ciclo[base_siguiente]
+
+        # Historial del ciclo actual; "Cultura" se agrega al pasar del ciclo I al II
+        extras = (("Cultura", 15.0, "Promedio Final"),) if ciclo_actual == "I" and next_ciclo == "II" else ()
+        avanzan.append((alumno, CicloSnapshot(alumno.id, ciclo_actual, get_base_ciclo(ciclo_actual), extras), next_ciclo))
+
+        resultado["registrado"] = True
+        resultado["asignaturas_siguiente_ids"] = asignaturas_siguiente_ids
+        if asignaturas_siguiente_ids:
+            resultado["mensaje"] = f"Registrado en el siguiente ciclo ({next_ciclo}). Existen {len(asignaturas_siguiente_ids)} asignaturas disponibles en ese ciclo. Se ha generado el historial académico."
+        else:
+            resultado["mensaje"] = f"Registrado en el siguiente ciclo ({next_ciclo}). No hay asignaturas definidas para ese ciclo. Se ha generado el historial académico."
+        resultado["puede_avanzar"] = True
+
+    if avanzan:
+        snapshot_cycles(db, [snapshot for _alumno, snapshot, _next in avanzan])
+        # Actualizar solo el campo ciclo del alumno (registrar avance de ciclo)
+        for alumno, _snapshot, next_ciclo in avanzan:
+            alumno.ciclo = next_ciclo
+        db.commit()
+        for alumno, _snapshot, _next in avanzan:
+            invalidate_identity(alumno.usuario_id)
+        invalidate_summaries([alumno.id for alumno, _snapshot, _next in avanzan])
+        invalidate_history([alumno.id for alumno, _snapshot, _next in avanzan])
 
-    # Actualizar solo el campo ciclo del alumno (registrar avance de ciclo)
-    alumno.ciclo = next_ciclo
-    db.commit()
+    return resultados
 
-    asignaturas_siguiente_ids = [a.id for a in asignaturas_siguiente]
-    resultado["matriculado"] = False
-    resultado["registrado"] = True
-    resultado["asignaturas_siguiente_ids"] = asignaturas_siguiente_ids
-    if asignaturas_siguiente_ids:
-        resultado["mensaje"] = f"Registrado en el siguiente ciclo ({next_ciclo}). Existen {len(asignaturas_siguiente_ids)} asignaturas disponibles en ese ciclo. Se ha generado el historial académico."
-    else:
-        resultado["mensaje"] = f"Registrado en el siguiente ciclo ({next_ciclo}). No hay asignaturas definidas para ese ciclo. Se ha generado el historial académico."
-    resultado["puede_avanzar"] = True
 
-    return resultado
+def registrar_alumno_en_siguiente_ciclo(db: Session, alumno: Alumno) -> dict:
+    return registrar_cohorte_en_siguiente_ciclo(db, [alumno])[0]
 
 
 @router.post("/alumnos/{alumno_id}/registrar-siguiente-ciclo")
@@ -220,10 +200,7 @@ async def admin_registrar_siguiente_ciclo_todos(
     Retorna un reporte con los resultados por alumno.
     """
     alumnos = db.query(Alumno).all()
-    reporte = []
-    for alumno in alumnos:
-        reporte.append(registrar_alumno_en_siguiente_ciclo(db, alumno))
-    return reporte
+    return registrar_cohorte_en_siguiente_ciclo(db, alumnos)
 
 
 # ========== GESTIÓN DE ALUMNOS ==========
@@ -256,7 +233,7 @@ async def crear_alumno(
         )
     
     # Crear usuario
-    hashed_password = get_password_hash(alumno_data.password)
+    hashed_password = await get_password_hash_async(alumno_data.password)
     db_user = Usuario(
         nombre=alumno_data.nombre_completo.split()[0],  # Primer nombre
         email=alumno_data.email,
@@ -343,9 +320,12 @@ async def actualizar_alumno(
     
     # Actualizar contraseña solo si se proporciona
     if alumno_data.password is not None and alumno_data.password.strip() != "":
-        db_alumno.usuario.password_hash = get_password_hash(alumno_data.password)
+        db_alumno.usuario.password_hash = await get_password_hash_async(alumno_data.password)
+        revoke_refresh_tokens(db, db_alumno.usuario_id)
     
     db.commit()
+    invalidate_identity(db_alumno.usuario_id)
+    invalidate_summaries([db_alumno.id])
     db.refresh(db_alumno)
     
     return db_alumno
@@ -365,46 +345,17 @@ async def eliminar_alumno(
             detail="Alumno no encontrado"
         )
     
+    usuario_id = db_alumno.usuario_id
+    asignatura_ids = student_subject_ids(db, alumno_id)
     try:
-        # Eliminar historial académico completo
-        # 1. Primero eliminar las notas del historial
-        historiales = db.query(HistorialAcademico).filter(HistorialAcademico.alumno_id == alumno_id).all()
-        for historial in historiales:
-            # Obtener todas las asignaturas del historial
-            asignaturas_historial = db.query(AsignaturaHistorial).filter(AsignaturaHistorial.historial_id == historial.id).all()
-            for asignatura in asignaturas_historial:
-                # Eliminar todas las notas de la asignatura en el historial
-                db.query(NotaHistorial).filter(NotaHistorial.asignatura_id == asignatura.id).delete()
-            
-            # Eliminar todas las asignaturas del historial
-            db.query(AsignaturaHistorial).filter(AsignaturaHistorial.historial_id == historial.id).delete()
-        
-        # Eliminar todos los registros de historial académico
-        db.query(HistorialAcademico).filter(HistorialAcademico.alumno_id == alumno_id).delete()
-        
-        # Eliminar todas las notas del alumno
-        db.query(Nota).filter(Nota.alumno_id == alumno_id).delete()
-
-        # Eliminar todos los promedios del alumno
-        db.query(Promedio).filter(Promedio.alumno_id == alumno_id).delete()
-        
-        # Eliminar todas las matrículas del alumno
-        db.execute(
-            matriculas.delete().where(matriculas.c.alumno_id == alumno_id)
-        )
-        
-        # Guardar el ID del usuario para eliminarlo después
-        usuario_id = db_alumno.usuario_id
-        
-        # Eliminar el alumno
-        db.delete(db_alumno)
+        # Una sola sentencia: ON DELETE CASCADE elimina alumno, notas, promedios, matrículas,
+        # historial académico (asignaturas y notas) y refresh tokens del usuario
+        db.query(Usuario).filter(Usuario.id == usuario_id).delete(synchronize_session=False)
         db.commit()
-        
-        # Eliminar el usuario asociado
-        db_usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
-        if db_usuario:
-            db.delete(db_usuario)
-            db.commit()
+        invalidate_identity(usuario_id)
+        invalidate_history([alumno_id])
+        invalidate_summaries([alumno_id])
+        refresh_subject_stats(db, asignatura_ids)
         
         return {"message": "Alumno eliminado completamente junto con todo su historial académico, notas y matrículas"}
     
@@ -593,7 +544,7 @@ async def importar_alumnos_csv(
                 import secrets, string
                 chars = string.ascii_letters + string.digits
                 password = ''.join(secrets.choice(chars) for _ in range(8))
-            hashed_password = get_password_hash(password)
+            hashed_password = await get_password_hash_async(password)
 
             # Crear usuario y alumno
             db_user = Usuario(
@@ -673,7 +624,7 @@ async def crear_docente(
         )
     
     # Crear usuario
-    hashed_password = get_password_hash(docente_data.password)
+    hashed_password = await get_password_hash_async(docente_data.password)
     db_user = Usuario(
         nombre=docente_data.nombre_completo.split()[0],  # Primer nombre
         email=docente_data.email,
@@ -765,13 +716,15 @@ async def actualizar_docente(
         usuario.nombre = docente_data.nombre_completo.split()[0]
         usuario.email = docente_data.email
         if docente_data.password:
-            usuario.password_hash = get_password_hash(docente_data.password)
+            usuario.password_hash = await get_password_hash_async(docente_data.password)
+            revoke_refresh_tokens(db, usuario.id)
     
     # Actualizar docente
     docente.nombre_completo = docente_data.nombre_completo
     docente.dni = docente_data.dni
     
     db.commit()
+    invalidate_identity(docente.usuario_id)
     db.refresh(docente)
     return docente
 
@@ -797,13 +750,13 @@ async def eliminar_docente(
             detail="No se puede eliminar el docente porque tiene asignaturas asignadas"
         )
     
-    # Eliminar usuario asociado
-    usuario = db.query(Usuario).filter(Usuario.id == docente.usuario_id).first()
-    if usuario:
-        db.delete(usuario)
-    
-    db.delete(docente)
+    # Al eliminar el usuario, ON DELETE CASCADE borra el docente y sus refresh tokens;
+    # los reportes que envió se conservan con docente_id en NULL
+    usuario_id = docente.usuario_id
+    db.query(Usuario).filter(Usuario.id == usuario_id).delete(synchronize_session=False)
     db.commit()
+    invalidate_identity(usuario_id)
+    invalidate_summaries(docente_ids=[docente_id])
     return {"message": "Docente eliminado correctamente"}
 
 # ========== GESTIÓN DE ASIGNATURAS ==========
@@ -866,6 +819,8 @@ async def crear_asignatura(
     
     # Confirmar los cambios en la base de datos
     db.commit()
+    invalidate_asignatura_summaries(db, db_asignatura.id)
+    refresh_subject_stats(db, [db_asignatura.id])
     
     return {
         "asignatura": {
@@ -889,11 +844,16 @@ async def crear_asignatura(
 
 @router.get("/asignaturas")
 async def listar_asignaturas(
+    request: Request,
+    response: Response,
     ciclo: str = None,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(require_role("admin"))
 ):
     """Listar todas las asignaturas, opcionalmente filtradas por ciclo"""
+    sin_cambios = not_modified(request, response, db, "asignaturas", ["asignaturas", "docentes"], ciclo)
+    if sin_cambios:
+        return sin_cambios
     try:
         # Consulta simple
         query = db.query(Asignatura)
@@ -962,12 +922,16 @@ async def actualizar_asignatura(
         )
     
     # Actualizar asignatura
+    docente_anterior_id = db_asignatura.docente_id
     db_asignatura.nombre = asignatura_data.nombre
     db_asignatura.ciclo = asignatura_data.ciclo
     db_asignatura.docente_id = asignatura_data.docente_id
     
     db.commit()
     db.refresh(db_asignatura)
+    invalidate_summaries(docente_ids=[docente_anterior_id])
+    invalidate_asignatura_summaries(db, asignatura_id)
+    invalidate_analytics()
     
     # Recargar con la relación del docente
     db_asignatura = db.query(Asignatura).options(joinedload(Asignatura.docente)).filter(Asignatura.id == asignatura_id).first()
@@ -1007,9 +971,10 @@ async def eliminar_asignatura(
             detail=f"No se puede eliminar la asignatura porque tiene {len(matriculas_count)} matrícula(s) activa(s). Elimine las matrículas primero."
         )
     
-    # Eliminar la asignatura
-    db.delete(db_asignatura)
+    # Eliminar la asignatura (sus promedios se borran y el historial conserva la copia, sin origen)
+    db.query(Asignatura).filter(Asignatura.id == asignatura_id).delete(synchronize_session=False)
     db.commit()
+    invalidate_analytics()
     
     return {"message": "Asignatura eliminada correctamente"}
 
@@ -1068,6 +1033,8 @@ async def matricular_alumno(
     
     # Confirmar los cambios en la base de datos
     db.commit()
+    invalidate_summaries([alumno.id], {a.docente_id for a in asignaturas_ciclo})
+    refresh_subject_stats(db, [m["asignatura_id"] for m in matriculas_creadas])
     
     # Obtener el usuario asociado al alumno
     usuario = db.query(Usuario).filter(Usuario.id == alumno.usuario_id).first()
@@ -1092,8 +1059,10 @@ async def matricular_alumno(
         temp_password = ''.join(secrets.choice(password_chars) for _ in range(8))
         
         # Actualizar la contraseña en la base de datos
-        usuario.password_hash = get_password_hash(temp_password)
+        usuario.password_hash = await get_password_hash_async(temp_password)
+        revoke_refresh_tokens(db, usuario.id)
         db.commit()
+        invalidate_identity(usuario.id)
         
         # Intentar enviar email
         try:
@@ -1171,6 +1140,9 @@ async def eliminar_matricula(
         )
     )
     db.commit()
+    invalidate_summaries([alumno_id])
+    invalidate_asignatura_summaries(db, asignatura_id)
+    refresh_subject_stats(db, [asignatura_id])
     
     return {"message": "Matrícula eliminada correctamente"}
 
@@ -1213,17 +1185,34 @@ async def dashboard_admin(
     current_user: Usuario = Depends(require_role("admin"))
 ):
     """Dashboard del administrador con estadísticas"""
-    total_alumnos = db.query(Alumno).count()
-    total_docentes = db.query(Docente).count()
-    total_asignaturas = db.query(Asignatura).count()
-    total_notas = db.query(Nota).count()
-    
-    return {
-        "total_alumnos": total_alumnos,
-        "total_docentes": total_docentes,
-        "total_asignaturas": total_asignaturas,
-        "total_notas": total_notas
-    }
+    return get_totals(db)
+
+@router.get("/changes")
+async def cambios_admin(
+    since: Optional[int] = None,
+    solo_publicadas: bool = True,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(require_role("admin"))
+):
+    """Notas, promedios y matrículas modificados después del cursor `since` (todo el sistema)"""
+    return changes_since(db, since, solo_publicadas=solo_publicadas)
+
+@router.get("/analytics")
+async def analitica_admin(
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(require_role("admin"))
+):
+    """Aprobados, desaprobados, promedios e histogramas por asignatura, ciclo y docente (precalculados)"""
+    return get_analytics(db)
+
+@router.post("/analytics/recalcular")
+async def recalcular_analitica(
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(require_role("admin"))
+):
+    """Recalcular desde cero los agregados de todas las asignaturas"""
+    asignaturas = rebuild_analytics(db)
+    return {"message": "Analítica recalculada", "asignaturas": asignaturas}
 
 @router.post("/alumnos/{alumno_id}/enviar-contrasena")
 async def enviar_contrasena_alumno(
@@ -1257,8 +1246,10 @@ async def enviar_contrasena_alumno(
     temp_password = ''.join(secrets.choice(password_chars) for _ in range(8))
     
     # Actualizar la contraseña en la base de datos
-    usuario.password_hash = get_password_hash(temp_password)
+    usuario.password_hash = await get_password_hash_async(temp_password)
+    revoke_refresh_tokens(db, usuario.id)
     db.commit()
+    invalidate_identity(usuario.id)
     
     # Intentar enviar email
     try:
@@ -1341,8 +1332,10 @@ async def enviar_contrasena_docente(
     temp_password = ''.join(secrets.choice(password_chars) for _ in range(8))
     
     # Actualizar la contraseña en la base de datos
-    usuario.password_hash = get_password_hash(temp_password)
+    usuario.password_hash = await get_password_hash_async(temp_password)
+    revoke_refresh_tokens(db, usuario.id)
     db.commit()
+    invalidate_identity(usuario.id)
     
     # Intentar enviar email
     try:
@@ -1409,7 +1402,7 @@ async def actualizar_mi_perfil_admin(
         )
     
     # Verificar la contraseña actual
-    if not verify_password(password_actual, current_user.password_hash):
+    if not await verify_password_async(password_actual, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="La contraseña actual es incorrecta"
@@ -1443,8 +1436,9 @@ async def actualizar_mi_perfil_admin(
                 detail="La nueva contraseña debe tener al menos 6 caracteres"
             )
         
-        # Actualizar la contraseña
-        current_user.password_hash = get_password_hash(nueva_password)
+        # Actualizar la contraseña y cerrar las demás sesiones
+        current_user.password_hash = await get_password_hash_async(nueva_password)
+        revoke_refresh_tokens(db, current_user.id)
     
     # Verificar que al menos se está cambiando algo
     if not nuevo_email and not nueva_password:
@@ -1454,6 +1448,7 @@ async def actualizar_mi_perfil_admin(
         )
     
     db.commit()
+    invalidate_identity(current_user.id)
     db.refresh(current_user)
     
     return {
@@ -1469,21 +1464,32 @@ async def actualizar_mi_perfil_admin(
 
 @router.get("/reportes", response_model=List[ReporteDocenteSchema])
 async def listar_reportes_docentes(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(require_role("admin"))
 ):
-    """Listar reportes enviados por docentes."""
-    reportes = db.query(ReporteDocente).order_by(ReporteDocente.fecha_envio.desc()).all()
+    """Listar reportes enviados por docentes (paginado; el total va en X-Total-Count)."""
+    response.headers["X-Total-Count"] = str(db.query(func.count(ReporteDocente.id)).scalar())
+    reportes = (
+        db.query(ReporteDocente)
+        .order_by(ReporteDocente.fecha_envio.desc(), ReporteDocente.id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
     return reportes
 
 @router.get("/reportes/{reporte_id}/archivo")
 async def descargar_archivo_reporte(
     reporte_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(require_role("admin"))
 ):
     """Descargar el archivo del reporte enviado por un docente.
-    Si el archivo fue guardado en BD, se transmite en streaming. Si es un path, se sirve desde disco.
+    Se transmite por bloques desde el almacén en disco (gzip si el cliente lo acepta) y admite peticiones Range.
     """
     reporte = db.query(ReporteDocente).filter(ReporteDocente.id == reporte_id).first()
     if not reporte:
@@ -1494,10 +1500,15 @@ async def descargar_archivo_reporte(
         archivo = db.query(ReporteArchivoDocente).filter(ReporteArchivoDocente.reporte_id == reporte.id).order_by(ReporteArchivoDocente.id.desc()).first()
         if not archivo:
             raise HTTPException(status_code=404, detail="Archivo del reporte no encontrado en la base de datos")
-        bytes_io = io.BytesIO(archivo.content)
-        media_type = archivo.mime_type or "text/csv"
-        headers = {"Content-Disposition": f"attachment; filename=\"{archivo.filename}\""}
-        return StreamingResponse(bytes_io, media_type=media_type, headers=headers)
+        blob = ensure_blob(db, archivo)
+        if blob is None:
+            raise HTTPException(status_code=404, detail="Contenido del reporte no disponible")
+        return blob_response(
+            blob,
+            filename=archivo.filename,
+            media_type=archivo.mime_type or "text/csv",
+            accept_encoding=request.headers.get("accept-encoding", ""),
+        )
 
     # Compatibilidad: si es un path en disco
     try:
@@ -1511,18 +1522,21 @@ async def eliminar_reporte_docente(
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(require_role("admin"))
 ):
-    """Eliminar un reporte de docente, removiendo su registro y archivo CSV."""
+    """Eliminar un reporte de docente, removiendo su registro y archivo."""
     reporte = db.query(ReporteDocente).filter(ReporteDocente.id == reporte_id).first()
     if not reporte:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
 
-    # Eliminar archivo según origen (BD o disco)
+    # Eliminar archivo según origen (BD/almacén o disco)
     file_removed = False
+    blobs = []
     try:
         if isinstance(reporte.archivo_path, str) and reporte.archivo_path.startswith("db:"):
-            # Eliminar filas de archivo almacenado en BD
+            # Eliminar filas de archivo y sus referencias; los blobs sin uso se borran tras el commit
             archivos = db.query(ReporteArchivoDocente).filter(ReporteArchivoDocente.reporte_id == reporte.id).all()
             for a in archivos:
+                blobs.append(a.sha256)
+                release_blob(db, a.sha256)
                 db.delete(a)
             file_removed = True if archivos else False
         else:
@@ -1541,6 +1555,8 @@ async def eliminar_reporte_docente(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"No se pudo eliminar el reporte: {e}")
 
+    purge_blobs(db, blobs)
+
     return {
         "message": "Reporte eliminado correctamente",
         "file_removed": file_removed
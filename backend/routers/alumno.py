@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from database import get_db
 from models import Usuario, Alumno, Asignatura, Nota, Promedio, matriculas
 from schemas import (
@@ -8,7 +8,11 @@ from schemas import (
     Nota as NotaSchema,
     Alumno as AlumnoSchema
 )
-from auth import require_role, get_password_hash, verify_password
+from auth import require_role, get_current_alumno, invalidate_identity, revoke_refresh_tokens
+from hashing import get_password_hash_async, verify_password_async
+from academic_summary import invalidate_summaries
+from change_log import changes_since
+from versioning import not_modified
 from pydantic import BaseModel
 import os
 import re
@@ -126,6 +130,8 @@ def matricular_alumno_en_siguiente_ciclo(db: Session, alumno: Alumno) -> dict:
     # Actualizamos el campo ciclo del alumno para registrar que pasó al siguiente ciclo.
     alumno.ciclo = next_ciclo
     db.commit()
+    invalidate_identity(alumno.usuario_id)
+    invalidate_summaries([alumno.id])
 
     # No crear matrículas automáticas: solo informar las asignaturas disponibles en el siguiente ciclo
     asignaturas_siguiente_ids = [a.id for a in asignaturas_siguiente]
@@ -144,17 +150,13 @@ def matricular_alumno_en_siguiente_ciclo(db: Session, alumno: Alumno) -> dict:
 async def matricula_automatica(
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno"))
+    alumno: Alumno = Depends(get_current_alumno)
 ):
     """Endpoint que verifica si el alumno actual puede ser matriculado automáticamente al siguiente ciclo.
 
     - Si el alumno aprobó todas las asignaturas de su ciclo actual, se le matricula en las asignaturas del siguiente ciclo.
     - Retorna el resultado de la operación.
     """
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alumno no encontrado")
-
     # Ejecutar la matrícula en background para no bloquear la petición (pero esperamos el resultado aquí para devolverlo)
     # Dado que la operación es rápida, la ejecutamos directamente y retornamos el resultado.
     resultado = matricular_alumno_en_siguiente_ciclo(db, alumno)
@@ -169,8 +171,10 @@ class CambiarContrasenaRequest(BaseModel):
 
 @router.get("/mis-asignaturas", response_model=List[AsignaturaSchema])
 async def mis_asignaturas(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno")),
+    alumno: Alumno = Depends(get_current_alumno),
     solo_ciclo_actual: bool = True
 ):
     """Obtener asignaturas matriculadas del alumno actual
@@ -178,14 +182,15 @@ async def mis_asignaturas(
     Por defecto, solo devuelve las asignaturas del ciclo actual.
     Si solo_ciclo_actual=False, devuelve todas las asignaturas matriculadas.
     """
-    # Buscar el alumno asociado al usuario
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Alumno no encontrado"
-        )
-    
+    claves = [f"matriculas:{alumno.id}", f"alumnos:{alumno.id}", "asignaturas", "docentes", "usuarios"]
+    sin_cambios = not_modified(request, response, db, "mis-asignaturas", claves, alumno.id, solo_ciclo_actual)
+    if sin_cambios:
+        return sin_cambios
+
+    return listar_mis_asignaturas(db, alumno, solo_ciclo_actual)
+
+def listar_mis_asignaturas(db: Session, alumno: Alumno, solo_ciclo_actual: bool = True) -> List[Asignatura]:
+    """Asignaturas matriculadas del alumno (también usado por /bootstrap)"""
     # Obtener asignaturas matriculadas
     matriculas_data = db.execute(
         matriculas.select().where(matriculas.c.alumno_id == alumno.id)
@@ -203,19 +208,22 @@ async def mis_asignaturas(
 
 @router.get("/mis-notas", response_model=List[NotaSchema])
 async def mis_notas(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno")),
+    alumno: Alumno = Depends(get_current_alumno),
     solo_ciclo_actual: bool = True
 ):
     """Obtener todas las notas del alumno actual"""
-    # Buscar el alumno asociado al usuario
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Alumno no encontrado"
-        )
-    
+    claves = [f"notas:{alumno.id}", f"alumnos:{alumno.id}", "asignaturas", "docentes", "usuarios"]
+    sin_cambios = not_modified(request, response, db, "mis-notas", claves, alumno.id, solo_ciclo_actual)
+    if sin_cambios:
+        return sin_cambios
+
+    return listar_mis_notas(db, alumno, solo_ciclo_actual)
+
+def listar_mis_notas(db: Session, alumno: Alumno, solo_ciclo_actual: bool = True) -> List[Nota]:
+    """Notas publicadas del alumno (también usado por /bootstrap)"""
     query = db.query(Nota).filter(Nota.alumno_id == alumno.id, Nota.publicada == True)
     
     if solo_ciclo_actual:
@@ -227,21 +235,22 @@ async def mis_notas(
     notas = query.all()
     return notas
 
+@router.get("/changes")
+async def mis_cambios(
+    since: Optional[int] = None,
+    db: Session = Depends(get_db),
+    alumno: Alumno = Depends(get_current_alumno)
+):
+    """Notas publicadas, promedios y matrículas propios modificados después del cursor `since`"""
+    return changes_since(db, since, alumno_id=alumno.id, solo_publicadas=True)
+
 @router.get("/asignaturas/{asignatura_id}/notas", response_model=List[NotaSchema])
 async def notas_por_asignatura(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno"))
+    alumno: Alumno = Depends(get_current_alumno)
 ):
     """Obtener notas del alumno en una asignatura específica"""
-    # Buscar el alumno asociado al usuario
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Alumno no encontrado"
-        )
-    
     # Verificar que el alumno está matriculado en la asignatura
     matricula = db.execute(
         matriculas.select().where(
@@ -267,17 +276,13 @@ async def notas_por_asignatura(
 @router.get("/promedio")
 async def mi_promedio(
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno"))
+    alumno: Alumno = Depends(get_current_alumno)
 ):
     """Calcular promedio general del alumno"""
-    # Buscar el alumno asociado al usuario
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Alumno no encontrado"
-        )
-    
+    return calcular_mi_promedio(db, alumno)
+
+def calcular_mi_promedio(db: Session, alumno: Alumno) -> dict:
+    """Promedio general de las notas publicadas del alumno (también usado por /bootstrap)"""
     notas = db.query(Nota).filter(Nota.alumno_id == alumno.id, Nota.publicada == True).all()
     
     if not notas:
@@ -300,17 +305,10 @@ async def mi_promedio(
 @router.get("/promedio-por-asignatura")
 async def promedio_por_asignatura(
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno")),
+    alumno: Alumno = Depends(get_current_alumno),
     solo_ciclo_actual: bool = True
 ):
     """Calcular promedio por asignatura del alumno"""
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Alumno no encontrado"
-        )
-
     matriculas_data = db.execute(
         matriculas.select().where(matriculas.c.alumno_id == alumno.id)
     ).fetchall()
@@ -358,7 +356,7 @@ async def promedio_por_asignatura(
 @router.get("/promedio-por-asignatura/pdf")
 async def promedio_por_asignatura_pdf(
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno")),
+    alumno: Alumno = Depends(get_current_alumno),
     solo_ciclo_actual: bool = True
 ):
     """Generar y descargar PDF con promedios por asignatura del alumno actual.
@@ -374,11 +372,6 @@ async def promedio_por_asignatura_pdf(
     from reportlab.lib import colors
     from reportlab.lib.styles import getSampleStyleSheet
 
-    # Buscar el alumno asociado al usuario
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alumno no encontrado")
-
     # Obtener asignaturas matriculadas
     matriculas_data = db.execute(
         matriculas.select().where(matriculas.c.alumno_id == alumno.id)
@@ -489,16 +482,9 @@ async def promedio_por_asignatura_pdf(
 @router.get("/perfil", response_model=AlumnoSchema)
 async def mi_perfil(
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno"))
+    alumno: Alumno = Depends(get_current_alumno)
 ):
     """Obtener perfil del alumno actual"""
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Alumno no encontrado"
-        )
-    
     return alumno
 
 @router.put("/cambiar-contrasena")
@@ -509,7 +495,7 @@ async def cambiar_contrasena(
 ):
     """Cambiar contraseña del alumno actual"""
     # Verificar que la contraseña actual sea correcta
-    if not verify_password(contrasena_data.contrasena_actual, current_user.password_hash):
+    if not await verify_password_async(contrasena_data.contrasena_actual, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="La contraseña actual es incorrecta"
@@ -523,8 +509,11 @@ async def cambiar_contrasena(
         )
     
     # Actualizar la contraseña
-    current_user.password_hash = get_password_hash(contrasena_data.nueva_contrasena)
+    current_user.password_hash = await get_password_hash_async(contrasena_data.nueva_contrasena)
+    # Cerrar las demás sesiones: un refresh token filtrado deja de servir
+    revoke_refresh_tokens(db, current_user.id)
     db.commit()
+    invalidate_identity(current_user.id)
     
     return {
         "message": "Contraseña actualizada correctamente",
@@ -539,7 +528,7 @@ async def cambiar_contrasena(
 async def resumen_pdf_asignatura(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("alumno"))
+    alumno: Alumno = Depends(get_current_alumno)
 ):
     """Generar y descargar PDF con resumen de promedios por asignatura.
 
@@ -554,11 +543,6 @@ async def resumen_pdf_asignatura(
     from reportlab.lib import colors
     from reportlab.lib.styles import getSampleStyleSheet
 
-    # Buscar alumno
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alumno no encontrado")
-
     # Verificar matrícula en la asignatura
     matricula = db.execute(
         matriculas.select().where(
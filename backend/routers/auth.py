@@ -3,24 +3,46 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from database import get_db
-from models import Usuario, Alumno, Docente
-from schemas import Token, UsuarioCreate, Usuario as UsuarioSchema
+from models import Usuario, Alumno, Docente, RefreshToken
+from schemas import Token, RefreshRequest, UsuarioCreate, Usuario as UsuarioSchema
 from auth import (
-    verify_password, 
-    get_password_hash, 
     create_access_token, 
+    create_refresh_token,
+    rotate_refresh_token,
+    revoke_refresh_tokens,
+    token_claims,
     get_current_user,
-    ACCESS_TOKEN_EXPIRE_MINUTES
+    require_role,
+    invalidate_identity,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    SECRET_KEY,
+    ALGORITHM
 )
+from hashing import hashing_stats, verify_password_async, get_password_hash_async
+from cache import TTLCache
+from jose import JWTError, jwt
 
 router = APIRouter()
 
+# Métricas de sesión del proceso: cuántos accesos se resolvieron con bcrypt (login)
+# y cuántos con refresh token (sin verificar contraseña)
+_session_stats = {"logins": 0, "refreshes": 0}
+# Usuarios con sesión renovable: cada uno vence con la vida del refresh token y el total está acotado
+_active_users = TTLCache(maxsize=10000, ttl=REFRESH_TOKEN_EXPIRE_DAYS * 86400)
+
+def _issue_access_token(user: Usuario) -> str:
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return create_access_token(
+        data=token_claims(user), expires_delta=access_token_expires
+    )
+
 @router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Iniciar sesión"""
     user = db.query(Usuario).filter(Usuario.email == form_data.username).first()
     
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos",
@@ -33,12 +55,56 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             detail="Usuario inactivo"
         )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    access_token = _issue_access_token(user)
+    refresh_token = create_refresh_token(db, user)
+    db.commit()
+
+    _session_stats["logins"] += 1
+    _active_users.set(user.id, True)
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/refresh", response_model=Token)
+async def refresh(data: RefreshRequest, db: Session = Depends(get_db)):
+    """Renovar la sesión con un refresh token (rotación: el token usado queda revocado)"""
+    user, refresh_token = rotate_refresh_token(db, data.refresh_token)
+
+    _session_stats["refreshes"] += 1
+    _active_users.set(user.id, True)
+
+    return {
+        "access_token": _issue_access_token(user),
+        "token_type": "bearer",
+        "refresh_token": refresh_token
+    }
+
+@router.post("/logout")
+async def logout(data: RefreshRequest, db: Session = Depends(get_db)):
+    """Cerrar sesión revocando la familia del refresh token"""
+    try:
+        payload = jwt.decode(data.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return {"message": "Sesión cerrada"}
+    if payload.get("type") == "refresh":
+        record = db.query(RefreshToken).filter(RefreshToken.jti == payload.get("jti")).first()
+        if record:
+            revoke_refresh_tokens(db, record.usuario_id, family=record.family)
+            db.commit()
+    return {"message": "Sesión cerrada"}
+
+@router.get("/metricas-sesion")
+async def metricas_sesion(current_user: Usuario = Depends(require_role("admin"))):
+    """Verificaciones bcrypt frente a renovaciones por refresh token (desde el arranque del proceso)"""
+    stats = hashing_stats()
+    usuarios = _active_users.prune()
+    return {
+        "usuarios_activos": usuarios,
+        "logins": _session_stats["logins"],
+        "refreshes": _session_stats["refreshes"],
+        "bcrypt_verificaciones": stats["verify_calls"],
+        "bcrypt_por_usuario_activo": round(stats["verify_calls"] / usuarios, 2) if usuarios else 0.0,
+        "bcrypt_evitados_por_refresh": _session_stats["refreshes"],
+    }
 
 @router.post("/register", response_model=UsuarioSchema)
 async def register(user_data: UsuarioCreate, db: Session = Depends(get_db)):
@@ -52,7 +118,7 @@ async def register(user_data: UsuarioCreate, db: Session = Depends(get_db)):
         )
     
     # Crear nuevo usuario
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     db_user = Usuario(
         nombre=user_data.nombre,
         email=user_data.email,
@@ -103,8 +169,10 @@ async def recuperar_contrasena(
     temp_password = ''.join(secrets.choice(password_chars) for _ in range(8))
     
     # Actualizar la contraseña en la base de datos
-    user.password_hash = get_password_hash(temp_password)
+    user.password_hash = await get_password_hash_async(temp_password)
+    revoke_refresh_tokens(db, user.id)
     db.commit()
+    invalidate_identity(user.id)
     
     # Intentar enviar email
     try:
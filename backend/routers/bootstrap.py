@@ -0,0 +1,93 @@
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, joinedload
+from typing import List
+import asyncio
+
+from database import SessionLocal
+from models import Usuario, Alumno, Asignatura, Docente
+from schemas import (
+    Usuario as UsuarioSchema,
+    Alumno as AlumnoSchema,
+    Docente as DocenteSchema,
+    Asignatura as AsignaturaSchema,
+    Nota as NotaSchema
+)
+from auth import require_role
+from analytics import get_totals
+from routers.alumno import listar_mis_asignaturas, listar_mis_notas, calcular_mi_promedio
+from routers.configuracion import get_config
+
+router = APIRouter()
+
+_asignaturas_adapter = TypeAdapter(List[AsignaturaSchema])
+_notas_adapter = TypeAdapter(List[NotaSchema])
+
+
+def _en_sesion(seccion, *args):
+    """Ejecutar una sección con su propia sesión: las sesiones no se comparten entre hilos"""
+    db = SessionLocal()
+    try:
+        return seccion(db, *args)
+    finally:
+        db.close()
+
+
+async def _reunir(secciones: dict) -> dict:
+    """Ejecutar las secciones a la vez (cada una en el threadpool) y devolver {nombre: resultado}"""
+    resultados = await asyncio.gather(*(
+        run_in_threadpool(_en_sesion, seccion, *args) for seccion, *args in secciones.values()
+    ))
+    return dict(zip(secciones, resultados))
+
+
+# Cada sección devuelve datos ya serializados: los objetos del ORM no salen de su sesión
+def _asignaturas(asignaturas: List[Asignatura]) -> list:
+    return _asignaturas_adapter.dump_python(
+        _asignaturas_adapter.validate_python(asignaturas, from_attributes=True), mode="json"
+    )
+
+
+def _asignaturas_docente(db: Session, docente_id: int) -> list:
+    # Sesión nueva: el docente y su usuario se cargan con la misma consulta
+    consulta = db.query(Asignatura).options(joinedload(Asignatura.docente).joinedload(Docente.usuario))
+    return _asignaturas(consulta.filter(Asignatura.docente_id == docente_id).all())
+
+
+def _asignaturas_alumno(db: Session, alumno: Alumno) -> list:
+    return _asignaturas(listar_mis_asignaturas(db, alumno))
+
+
+def _notas_alumno(db: Session, alumno: Alumno) -> list:
+    return _notas_adapter.dump_python(
+        _notas_adapter.validate_python(listar_mis_notas(db, alumno), from_attributes=True), mode="json"
+    )
+
+
+@router.get("/bootstrap")
+async def bootstrap(current_user: Usuario = Depends(require_role(["admin", "docente", "alumno"]))):
+    """Todo lo que necesita la primera pantalla del rol en una sola petición.
+
+    Reemplaza a /auth/me, /configuracion y las consultas iniciales del dashboard; las secciones
+    se consultan en paralelo. Las claves coinciden con las respuestas de los endpoints individuales.
+    Un usuario desactivado recibe 400, igual que en los endpoints de cada rol.
+    """
+    secciones = {"configuracion": (get_config,)}
+    datos = {"rol": current_user.rol, "usuario": jsonable_encoder(UsuarioSchema.model_validate(current_user))}
+
+    if current_user.rol == "admin":
+        secciones["dashboard"] = (get_totals,)
+    elif current_user.rol == "docente" and current_user.docente is not None:
+        datos["perfil"] = jsonable_encoder(DocenteSchema.model_validate(current_user.docente))
+        secciones["asignaturas"] = (_asignaturas_docente, current_user.docente.id)
+    elif current_user.rol == "alumno" and current_user.alumno is not None:
+        alumno = current_user.alumno
+        datos["perfil"] = jsonable_encoder(AlumnoSchema.model_validate(alumno))
+        secciones["asignaturas"] = (_asignaturas_alumno, alumno)
+        secciones["notas"] = (_notas_alumno, alumno)
+        secciones["promedio"] = (calcular_mi_promedio, alumno)
+
+    datos.update(await _reunir(secciones))
+    return datos
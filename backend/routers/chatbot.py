@@ -1,20 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-from auth import require_role
+from auth import require_role, get_current_alumno, get_current_docente
+from database import get_db
+from models import Alumno, Docente
+from sqlalchemy.orm import Session
+from academic_summary import get_alumno_summary, get_docente_summary, academic_summary_stats
+from groq_client import StreamFragments, chat_completion, open_stream, groq_stats
+from chat_context import cache_key, get_cached_reply, store_reply, trim_history, chat_cache_stats
+import json
 import os
 from dotenv import load_dotenv
 
 # Asegurar carga de variables de entorno desde backend/.env
 load_dotenv()
 
-try:
-    from groq import Groq
-except Exception:
-    Groq = None
-
 router = APIRouter()
 
+
+class _ChatStreamResponse(StreamingResponse):
+    """StreamingResponse que cierra los fragmentos del proveedor al terminar la respuesta.
+
+    Si el cliente se desconecta antes del primer fragmento, el generador del cuerpo nunca
+    empieza y su `finally` no corre: el cierre se hace aquí para no perder el turno.
+    """
+
+    def __init__(self, content, fragments: StreamFragments, **kwargs):
+        super().__init__(content, **kwargs)
+        self.fragments = fragments
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.fragments.aclose()
+
 class ChatMessage(BaseModel):
     role: str  # "user" | "assistant"
     content: str
@@ -44,56 +65,121 @@ ROLE_SYSTEM_PROMPTS: Dict[str, str] = {
 }
 
 
-def _chat_with_groq(system_prompt: str, req: ChatRequest) -> str:
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="GROQ_API_KEY no configurado en backend/.env")
-    if Groq is None:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="SDK de Groq no disponible. Ejecute 'pip install -r requirements.txt' y reinicie el servidor.")
-
-    try:
-        client = Groq(api_key=api_key)
-
-        # Construir mensajes para el modelo
-        groq_messages = [{"role": "system", "content": system_prompt}]
-        for m in req.messages:
-            role = m.role if m.role in ("user", "assistant") else "user"
-            groq_messages.append({"role": role, "content": m.content})
-
-        completion = client.chat.completions.create(
-            model=req.model,
-            messages=groq_messages,
-            temperature=req.temperature,
-        )
-
-        return completion.choices[0].message.content
-    except HTTPException:
-        raise
-    except Exception as e:
-        # Registrar error para depuración y retornar HTTP 502 legible
-        print(f"[Chatbot] Error al invocar Groq: {e}")
-        raise HTTPException(status_code=502, detail=f"Error al consultar el proveedor de IA: {str(e)}")
+def _grounded_prompt(role: str, resumen: str) -> str:
+    """Prompt de sistema del rol con los datos académicos propios del usuario"""
+    return (
+        ROLE_SYSTEM_PROMPTS[role]
+        + "\n\nDatos actuales del usuario (úsalos para responder; si algo no aparece aquí, indica dónde consultarlo en el panel):\n"
+        + resumen
+    )
+
+
+def _build_messages(system_prompt: str, req: ChatRequest) -> List[Dict[str, str]]:
+    # Construir mensajes para el modelo
+    groq_messages = [{"role": "system", "content": system_prompt}]
+    for m in req.messages:
+        role = m.role if m.role in ("user", "assistant") else "user"
+        groq_messages.append({"role": role, "content": m.content})
+    return groq_messages
+
+
+async def _chat_with_groq(role: str, system_prompt: str, req: ChatRequest) -> str:
+    messages = _build_messages(system_prompt, req)
+    key = cache_key(role, system_prompt, messages, req.model, req.temperature)
+    reply = get_cached_reply(key, messages)
+    if reply is None:
+        reply = await chat_completion(trim_history(messages), req.model, req.temperature)
+        store_reply(key, reply)
+    return reply
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_with_groq(role: str, system_prompt: str, req: ChatRequest, request: Request) -> StreamingResponse:
+    """Respuesta SSE: un evento por fragmento ({"delta": ...}) y un evento final `done`"""
+    messages = _build_messages(system_prompt, req)
+    key = cache_key(role, system_prompt, messages, req.model, req.temperature)
+    cached = get_cached_reply(key, messages)
+
+    async def desde_cache():
+        yield _sse({"delta": cached})
+        yield _sse({"cached": True}, event="done")
+
+    if cached is not None:
+        return StreamingResponse(desde_cache(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    fragments = await open_stream(trim_history(messages), req.model, req.temperature)
+
+    async def eventos():
+        partes = []
+        try:
+            async for delta in fragments:
+                if await request.is_disconnected():
+                    break
+                partes.append(delta)
+                yield _sse({"delta": delta})
+            else:
+                store_reply(key, "".join(partes))
+                yield _sse({}, event="done")
+        except Exception as e:
+            yield _sse({"detail": f"Error al consultar el proveedor de IA: {str(e)}"}, event="error")
+        finally:
+            await fragments.aclose()
+
+    return _ChatStreamResponse(
+        eventos(),
+        fragments,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/chat/admin")
 async def chat_admin(req: ChatRequest, current_user=Depends(require_role("admin"))):
     """Chat para panel de administrador."""
     system_prompt = ROLE_SYSTEM_PROMPTS["admin"]
-    reply = _chat_with_groq(system_prompt, req)
+    reply = await _chat_with_groq("admin", system_prompt, req)
     return {"reply": reply}
 
 
 @router.post("/chat/docente")
-async def chat_docente(req: ChatRequest, current_user=Depends(require_role("docente"))):
+async def chat_docente(req: ChatRequest, db: Session = Depends(get_db), docente: Docente = Depends(get_current_docente)):
     """Chat para panel de docente."""
-    system_prompt = ROLE_SYSTEM_PROMPTS["docente"]
-    reply = _chat_with_groq(system_prompt, req)
+    system_prompt = _grounded_prompt("docente", get_docente_summary(db, docente))
+    reply = await _chat_with_groq("docente", system_prompt, req)
     return {"reply": reply}
 
 
 @router.post("/chat/alumno")
-async def chat_alumno(req: ChatRequest, current_user=Depends(require_role("alumno"))):
+async def chat_alumno(req: ChatRequest, db: Session = Depends(get_db), alumno: Alumno = Depends(get_current_alumno)):
     """Chat para panel de alumno."""
-    system_prompt = ROLE_SYSTEM_PROMPTS["alumno"]
-    reply = _chat_with_groq(system_prompt, req)
-    return {"reply": reply}
\ No newline at end of file
+    system_prompt = _grounded_prompt("alumno", get_alumno_summary(db, alumno))
+    reply = await _chat_with_groq("alumno", system_prompt, req)
+    return {"reply": reply}
+
+
+@router.post("/chat/admin/stream")
+async def chat_admin_stream(req: ChatRequest, request: Request, current_user=Depends(require_role("admin"))):
+    """Chat para panel de administrador con respuesta en streaming (SSE)."""
+    return await _stream_with_groq("admin", ROLE_SYSTEM_PROMPTS["admin"], req, request)
+
+
+@router.post("/chat/docente/stream")
+async def chat_docente_stream(req: ChatRequest, request: Request, db: Session = Depends(get_db), docente: Docente = Depends(get_current_docente)):
+    """Chat para panel de docente con respuesta en streaming (SSE)."""
+    return await _stream_with_groq("docente", _grounded_prompt("docente", get_docente_summary(db, docente)), req, request)
+
+
+@router.post("/chat/alumno/stream")
+async def chat_alumno_stream(req: ChatRequest, request: Request, db: Session = Depends(get_db), alumno: Alumno = Depends(get_current_alumno)):
+    """Chat para panel de alumno con respuesta en streaming (SSE)."""
+    return await _stream_with_groq("alumno", _grounded_prompt("alumno", get_alumno_summary(db, alumno)), req, request)
+
+
+@router.get("/chat/metricas")
+async def chat_metricas(current_user=Depends(require_role("admin"))):
+    """Aciertos de la caché de respuestas y tokens ahorrados por caché y recorte de historial"""
+    return {**chat_cache_stats(), "resumenes": academic_summary_stats(), "proveedor": groq_stats()}
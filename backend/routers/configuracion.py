@@ -1,31 +1,101 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, SessionLocal
 from models import ConfiguracionSistema, Usuario
 from schemas import ConfiguracionSistema as ConfigSchema, ConfiguracionSistemaBase
 from auth import require_role
+from media import save_upload_limited, process_logo, upload_remote, record_local_fallback, LOGOS_DIR
+import asyncio
 import os
-import uuid
 
-# Cloudinary
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
 
 load_dotenv()
 
 router = APIRouter()
 
-@router.get("/configuracion", response_model=ConfigSchema)
-async def obtener_configuracion(db: Session = Depends(get_db)):
-    """Devuelve la configuración del sistema (pública). Crea una por defecto si no existe."""
+# Configuración pública cacheada en el proceso. Cada worker compara periódicamente
+# `version` con la tabla (en segundo plano), así las lecturas nunca tocan la base de datos.
+CONFIG_VERSION_POLL_SECONDS = float(os.getenv("CONFIG_VERSION_POLL_SECONDS", "5"))
+
+_config_cache = {"version": None, "data": None, "etag": None}
+_watcher = {"task": None}
+
+
+def _store_config(config: ConfiguracionSistema) -> dict:
+    data = jsonable_encoder(ConfigSchema.model_validate(config))
+    _config_cache.update(
+        version=config.version,
+        data=data,
+        etag=f'W/"config-{config.id}-v{config.version}"',
+    )
+    return data
+
+
+def load_config(db: Session) -> dict:
+    """Leer la configuración de la base de datos (creándola si no existe) y cachearla"""
     config = db.query(ConfiguracionSistema).first()
     if not config:
-        config = ConfiguracionSistema(nombre_sistema="Sistema de Gestión de Notas", logo_url=None)
+        config = ConfiguracionSistema(nombre_sistema="Sistema de Gestión de Notas", logo_url=None, version=1)
         db.add(config)
         db.commit()
         db.refresh(config)
-    return config
+    return _store_config(config)
+
+
+def _sync_config_version() -> None:
+    db = SessionLocal()
+    try:
+        version = db.query(ConfiguracionSistema.version).order_by(ConfiguracionSistema.id).limit(1).scalar()
+        if version is None or version != _config_cache["version"]:
+            load_config(db)
+    finally:
+        db.close()
+
+
+async def _watch_config_version():
+    while True:
+        await asyncio.sleep(CONFIG_VERSION_POLL_SECONDS)
+        try:
+            await run_in_threadpool(_sync_config_version)
+        except Exception as e:
+            print(f"[Configuración] No se pudo verificar la versión: {e}")
+
+
+async def start_config_cache():
+    """Cargar la configuración y vigilar cambios hechos por otros workers"""
+    await run_in_threadpool(_sync_config_version)
+    if _watcher["task"] is None:
+        _watcher["task"] = asyncio.create_task(_watch_config_version())
+
+
+async def stop_config_cache():
+    task = _watcher["task"]
+    _watcher["task"] = None
+    if task is not None:
+        task.cancel()
+
+
+def get_config(db: Session) -> dict:
+    """Configuración pública desde la caché (también usada por /bootstrap)"""
+    data = _config_cache["data"]
+    if data is None:
+        # Solo ocurre si el servidor arrancó sin el evento de startup
+        data = load_config(db)
+    return data
+
+
+@router.get("/configuracion", response_model=ConfigSchema)
+async def obtener_configuracion(request: Request, db: Session = Depends(get_db)):
+    """Devuelve la configuración del sistema (pública) desde la caché, con ETag."""
+    data = get_config(db)
+    headers = {"ETag": _config_cache["etag"], "Cache-Control": "public, no-cache"}
+    if request.headers.get("if-none-match") == _config_cache["etag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=data, headers=headers)
 
 @router.put("/admin/configuracion", response_model=ConfigSchema)
 async def actualizar_configuracion(
@@ -36,58 +106,49 @@ async def actualizar_configuracion(
     """Actualiza la configuración del sistema (solo admin). Crea si no existe."""
     config = db.query(ConfiguracionSistema).first()
     if not config:
-        config = ConfiguracionSistema(nombre_sistema=data.nombre_sistema, logo_url=data.logo_url)
+        config = ConfiguracionSistema(nombre_sistema=data.nombre_sistema, logo_url=data.logo_url, version=1)
         db.add(config)
     else:
         config.nombre_sistema = data.nombre_sistema
         config.logo_url = data.logo_url
+        # Incremento atómico: los demás workers detectan el cambio en su próxima verificación
+        config.version = ConfiguracionSistema.version + 1
     db.commit()
     db.refresh(config)
+    _store_config(config)
     return config
 
 @router.post("/admin/configuracion/logo/cloudinary")
 async def subir_logo_cloudinary(
+    request: Request,
     archivo: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(require_role("admin"))
 ):
-    """Sube el logo a Cloudinary y devuelve la URL pública sin guardar en disco local."""
-    # Validar credenciales
-    cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
-    api_key = os.getenv("CLOUDINARY_API_KEY")
-    api_secret = os.getenv("CLOUDINARY_API_SECRET")
-    if not (cloud_name and api_key and api_secret):
-        raise HTTPException(status_code=500, detail="Faltan credenciales de Cloudinary en el backend.")
-
+    """Sube el logo optimizado a Cloudinary y devuelve la URL pública.
+    Si Cloudinary no está configurado o no responde, se sirve desde el almacenamiento local."""
     # Validar tipo de archivo
     allowed_content_types = {"image/png", "image/jpeg", "image/jpg", "image/webp", "image/gif"}
     if archivo.content_type not in allowed_content_types:
         raise HTTPException(status_code=400, detail="Formato no soportado. Use PNG/JPEG/WEBP/GIF.")
 
-    # Configurar Cloudinary
-    cloudinary.config(
-        cloud_name=cloud_name,
-        api_key=api_key,
-        api_secret=api_secret
-    )
+    tmp_path = await save_upload_limited(archivo)
+    archivos = await run_in_threadpool(process_logo, tmp_path)
 
-    # Crear un public_id único
-    public_id = f"logos/{uuid.uuid4().hex}"
+    # El public_id deriva del hash del contenido: subir el mismo logo no crea otro recurso
+    header = archivos["header"]
+    public_id = f"logos/{os.path.splitext(header)[0]}"
+    url = await upload_remote(os.path.join(LOGOS_DIR, header), public_id)
+    if url:
+        return {"url": url, "almacenamiento": "cloudinary"}
 
-    try:
-        # Subir a Cloudinary sin guardar en disco
-        result = cloudinary.uploader.upload(
-            archivo.file,
-            public_id=public_id,
-            resource_type="image",
-            overwrite=True
-        )
-        url = result.get("secure_url") or result.get("url")
-        if not url:
-            raise HTTPException(status_code=500, detail="No se obtuvo URL desde Cloudinary.")
-        return {"url": url}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error subiendo a Cloudinary: {str(e)}")
+    record_local_fallback()
+    base_url = str(request.base_url).rstrip("/")
+    return {
+        "url": f"{base_url}/uploads/logos/{header}",
+        "almacenamiento": "local",
+        "aviso": "Cloudinary no disponible; el logo se guardó en el servidor."
+    }
 
 @router.post("/admin/configuracion/logo")
 async def subir_logo(
@@ -96,28 +157,16 @@ async def subir_logo(
     current_user: Usuario = Depends(require_role("admin")),
     request: Request = None
 ):
-    """Sube un archivo de imagen de logo al servidor y devuelve su URL pública."""
+    """Sube un logo, genera sus variantes optimizadas (favicon, cabecera, WebP) y devuelve sus URLs públicas."""
     if not archivo.content_type or not archivo.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="El archivo debe ser una imagen.")
 
-    # Construir rutas de almacenamiento en backend/uploads/logos
-    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    uploads_dir = os.path.join(backend_dir, "uploads", "logos")
-    os.makedirs(uploads_dir, exist_ok=True)
-
-    # Generar nombre único
-    _, ext = os.path.splitext(archivo.filename or "logo")
-    ext = ext.lower() if ext else ".png"
-    unique_name = f"{uuid.uuid4().hex}{ext}"
-    file_path = os.path.join(uploads_dir, unique_name)
-
-    # Guardar archivo
-    content = await archivo.read()
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Guardar por bloques con límite de tamaño y procesar fuera del event loop
+    tmp_path = await save_upload_limited(archivo)
+    archivos = await run_in_threadpool(process_logo, tmp_path)
 
-    # Construir URL absoluta
+    # Construir URLs absolutas
     base_url = str(request.base_url).rstrip("/") if request else ""
-    url = f"{base_url}/uploads/logos/{unique_name}" if base_url else f"/uploads/logos/{unique_name}"
+    variantes = {nombre: f"{base_url}/uploads/logos/{filename}" for nombre, filename in archivos.items()}
 
-    return {"url": url}
\ No newline at end of file
+    return {"url": variantes["header"], "variantes": variantes}
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List, Dict
 from database import get_db
@@ -10,12 +12,20 @@ from schemas import (
 )
 from pydantic import BaseModel, EmailStr
 from typing import Optional, Any
-from auth import require_role, verify_password, get_password_hash
+from auth import require_role, get_current_docente, invalidate_identity, revoke_refresh_tokens
+from hashing import verify_password_async, get_password_hash_async
+from academic_summary import invalidate_summaries, invalidate_asignatura_summaries
+from analytics import refresh_subject_stats
+from change_log import changes_since
+from events import publish_grades_event
+from versioning import not_modified
+from grade_stats import cycle_subject_ids, subject_statistics
+from grading import get_scheme, is_default_scheme, recompute_subject_grades, set_scheme
 from datetime import datetime
-import os
 import csv
 import io
-from models import ReporteDocente, ReporteArchivoDocente
+from models import ReporteDocente
+from report_store import store_report_file
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
@@ -93,141 +103,71 @@ async def obtener_tipos_evaluacion(
 async def guardar_promedios(
     promedios: List[PromedioCreate],
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
-    """Guardar los promedios de los alumnos para una asignatura"""
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
-    resultados = []
-    for promedio_data in promedios:
+    """Recalcular los promedios de las asignaturas indicadas según su esquema de calificación.
+
+    Los valores enviados se ignoran: los promedios se derivan siempre de las notas registradas.
+    """
+    asignatura_ids = {p.asignatura_id for p in promedios}
+    for asignatura_id in asignatura_ids:
         # Verificar que la asignatura pertenece al docente
         asignatura = db.query(Asignatura).filter(
-            Asignatura.id == promedio_data.asignatura_id,
+            Asignatura.id == asignatura_id,
             Asignatura.docente_id == docente.id
         ).first()
         
         if not asignatura:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"No tiene permiso para esta asignatura: {promedio_data.asignatura_id}"
-            )
-        
-        # Verificar si ya existe un promedio para este alumno y asignatura
-        promedio_existente = db.query(Promedio).filter(
-            Promedio.alumno_id == promedio_data.alumno_id,
-            Promedio.asignatura_id == promedio_data.asignatura_id
-        ).first()
-        
-        if promedio_existente:
-            # Actualizar el promedio existente
-            promedio_existente.actividades = promedio_data.actividades
-            promedio_existente.practicas = promedio_data.practicas
-            promedio_existente.parciales = promedio_data.parciales
-            promedio_existente.examen_final = promedio_data.examen_final
-            promedio_existente.promedio_final = promedio_data.promedio_final
-            db.commit()
-            db.refresh(promedio_existente)
-            resultados.append({"id": promedio_existente.id, "actualizado": True})
-        else:
-            # Crear un nuevo promedio
-            nuevo_promedio = Promedio(
-                alumno_id=promedio_data.alumno_id,
-                asignatura_id=promedio_data.asignatura_id,
-                actividades=promedio_data.actividades,
-                practicas=promedio_data.practicas,
-                parciales=promedio_data.parciales,
-                examen_final=promedio_data.examen_final,
-                promedio_final=promedio_data.promedio_final
+                detail=f"No tiene permiso para esta asignatura: {asignatura_id}"
             )
-            db.add(nuevo_promedio)
-            db.commit()
-            db.refresh(nuevo_promedio)
-            resultados.append({"id": nuevo_promedio.id, "actualizado": False})
-    
-    return {"message": "Promedios guardados correctamente", "resultados": resultados}
-
-@router.delete("/eliminar-promedios/{alumno_id}/{asignatura_id}")
-async def eliminar_promedios(
-    alumno_id: int,
-    asignatura_id: int,
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
-):
-    """Eliminar los promedios de un alumno para una asignatura cuando no hay notas para calcular"""
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
-    # Verificar que la asignatura pertenece al docente
-    asignatura = db.query(Asignatura).filter(
-        Asignatura.id == asignatura_id,
-        Asignatura.docente_id == docente.id
-    ).first()
-    
-    if not asignatura:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tiene permiso para esta asignatura"
-        )
-    
-    # Buscar el promedio a eliminar
-    promedio = db.query(Promedio).filter(
-        Promedio.alumno_id == alumno_id,
-        Promedio.asignatura_id == asignatura_id
-    ).first()
-    
-    if not promedio:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Promedio no encontrado"
-        )
     
-    # Eliminar el promedio
-    db.delete(promedio)
+    recompute_subject_grades(db, asignatura_ids)
     db.commit()
     
-    return {"message": "Promedio eliminado correctamente"}
+    solicitados = {(p.alumno_id, p.asignatura_id) for p in promedios}
+    resultados = [
+        {"id": promedio_id, "alumno_id": alumno_id, "asignatura_id": asignatura_id, "actualizado": True}
+        for promedio_id, alumno_id, asignatura_id in db.query(Promedio.id, Promedio.alumno_id, Promedio.asignatura_id)
+        .filter(Promedio.asignatura_id.in_(asignatura_ids))
+        if (alumno_id, asignatura_id) in solicitados
+    ]
+    invalidate_summaries({p.alumno_id for p in promedios}, [docente.id])
+    return {"message": "Promedios recalculados según el esquema de la asignatura", "resultados": resultados}
 
 @router.get("/mis-asignaturas", response_model=List[AsignaturaSchema])
 async def mis_asignaturas(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Obtener asignaturas del docente actual"""
-    # Buscar el docente asociado al usuario
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
+    claves = ["asignaturas", f"docentes:{docente.id}", f"usuarios:{docente.usuario_id}"]
+    sin_cambios = not_modified(request, response, db, "mis-asignaturas", claves, docente.id)
+    if sin_cambios:
+        return sin_cambios
     asignaturas = db.query(Asignatura).filter(Asignatura.docente_id == docente.id).all()
     return asignaturas
 
+@router.get("/changes")
+async def mis_cambios(
+    since: Optional[int] = None,
+    db: Session = Depends(get_db),
+    docente: Docente = Depends(get_current_docente)
+):
+    """Notas (publicadas o no), promedios y matrículas de mis asignaturas modificados después del cursor `since`"""
+    asignatura_ids = [a for (a,) in db.query(Asignatura.id).filter(Asignatura.docente_id == docente.id)]
+    return changes_since(db, since, asignatura_ids=asignatura_ids)
+
 @router.get("/asignaturas/{asignatura_id}/alumnos", response_model=List[AlumnoSchema])
 async def alumnos_por_asignatura(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Obtener alumnos matriculados en una asignatura específica"""
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == asignatura_id,
         Asignatura.docente_id == docente.id
@@ -237,17 +177,9 @@ async def alumnos_por_asignatura(
 async def alumnos_por_asignatura_nuevo(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Obtener alumnos matriculados en una asignatura específica (nuevo endpoint)"""
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == asignatura_id,
         Asignatura.docente_id == docente.id
@@ -279,17 +211,9 @@ async def alumnos_por_asignatura_nuevo(
 async def get_notas_por_asignatura_nuevo(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Obtener todas las notas de una asignatura específica (nuevo endpoint)"""
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == asignatura_id,
         Asignatura.docente_id == docente.id
@@ -322,17 +246,9 @@ async def get_notas_por_asignatura_nuevo(
 async def get_notas_por_asignatura(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Obtener todas las notas de una asignatura específica"""
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == asignatura_id,
         Asignatura.docente_id == docente.id
@@ -352,17 +268,9 @@ async def get_notas_por_asignatura(
 async def registrar_nota(
     nota_data: NotaCreate,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Registrar nueva nota"""
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == nota_data.asignatura_id,
         Asignatura.docente_id == docente.id
@@ -404,8 +312,11 @@ async def registrar_nota(
     )
     
     db.add(db_nota)
+    recompute_subject_grades(db, [db_nota.asignatura_id])
     db.commit()
     db.refresh(db_nota)
+    invalidate_summaries([db_nota.alumno_id], [docente.id])
+    refresh_subject_stats(db, [db_nota.asignatura_id])
     
     return db_nota
 
@@ -414,17 +325,9 @@ async def actualizar_nota(
     nota_id: int,
     nota_data: NotaUpdate,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Actualizar nota existente"""
-    # Verificar que el docente tiene acceso a esta nota
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     nota = db.query(Nota).filter(Nota.id == nota_id).first()
     if not nota:
         raise HTTPException(
@@ -454,8 +357,11 @@ async def actualizar_nota(
     # Actualizar nota
     nota.calificacion = nota_data.calificacion
     nota.tipo_nota = nota_data.tipo_nota
+    recompute_subject_grades(db, [nota.asignatura_id])
     db.commit()
     db.refresh(nota)
+    invalidate_summaries([nota.alumno_id], [docente.id])
+    refresh_subject_stats(db, [nota.asignatura_id])
     
     return nota
 
@@ -463,17 +369,9 @@ async def actualizar_nota(
 async def notas_por_asignatura(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Obtener todas las notas de una asignatura"""
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == asignatura_id,
         Asignatura.docente_id == docente.id
@@ -492,17 +390,9 @@ async def notas_por_asignatura(
 async def eliminar_nota(
     nota_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Eliminar nota"""
-    # Verificar que el docente tiene acceso a esta nota
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     nota = db.query(Nota).filter(Nota.id == nota_id).first()
     if not nota:
         raise HTTPException(
@@ -522,25 +412,22 @@ async def eliminar_nota(
             detail="No tienes permisos para eliminar esta nota"
         )
     
+    alumno_id = nota.alumno_id
+    asignatura_id = nota.asignatura_id
     db.delete(nota)
+    recompute_subject_grades(db, [asignatura_id])
     db.commit()
+    invalidate_summaries([alumno_id], [docente.id])
+    refresh_subject_stats(db, [asignatura_id])
     
     return {"message": "Nota eliminada correctamente"}
 
 @router.get("/alumnos-por-ciclo")
 async def obtener_alumnos_por_ciclo(
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Obtener alumnos organizados por ciclo para el docente actual"""
-    # Buscar el docente asociado al usuario
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     # Obtener asignaturas del docente
     asignaturas = db.query(Asignatura).filter(Asignatura.docente_id == docente.id).all()
     asignatura_ids = [asignatura.id for asignatura in asignaturas]
@@ -604,7 +491,7 @@ async def obtener_alumnos_por_ciclo(
 async def publicar_nota(
     nota_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Publicar una nota para que el alumno pueda verla"""
     # Buscar la nota
@@ -615,14 +502,6 @@ async def publicar_nota(
             detail="Nota no encontrada"
         )
     
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     # Verificar que la asignatura pertenece al docente
     asignatura = db.query(Asignatura).filter(Asignatura.id == nota.asignatura_id).first()
     if not asignatura or asignatura.docente_id != docente.id:
@@ -642,6 +521,9 @@ async def publicar_nota(
     nota.publicada = True
     db.commit()
     db.refresh(nota)
+    invalidate_summaries([nota.alumno_id], [docente.id])
+    refresh_subject_stats(db, [nota.asignatura_id])
+    publish_grades_event("notas_publicadas", asignatura.id, asignatura.nombre, [nota.alumno_id], 1)
     
     # Obtener información del alumno
     alumno = db.query(Alumno).filter(Alumno.id == nota.alumno_id).first()
@@ -670,7 +552,7 @@ async def publicar_nota(
 async def despublicar_nota(
     nota_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Despublicar una nota para que el alumno no pueda verla"""
     # Buscar la nota
@@ -681,14 +563,6 @@ async def despublicar_nota(
             detail="Nota no encontrada"
         )
     
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     # Verificar que la asignatura pertenece al docente
     asignatura = db.query(Asignatura).filter(Asignatura.id == nota.asignatura_id).first()
     if not asignatura or asignatura.docente_id != docente.id:
@@ -708,6 +582,9 @@ async def despublicar_nota(
     nota.publicada = False
     db.commit()
     db.refresh(nota)
+    invalidate_summaries([nota.alumno_id], [docente.id])
+    refresh_subject_stats(db, [nota.asignatura_id])
+    publish_grades_event("notas_despublicadas", asignatura.id, asignatura.nombre, [nota.alumno_id], 1)
     
     # Obtener información del alumno
     alumno = db.query(Alumno).filter(Alumno.id == nota.alumno_id).first()
@@ -736,17 +613,9 @@ async def despublicar_nota(
 async def publicar_todas_notas(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Publicar todas las notas de una asignatura específica"""
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     # Verificar que la asignatura pertenece al docente
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == asignatura_id,
@@ -774,8 +643,13 @@ async def publicar_todas_notas(
     # Publicar todas las notas
     for nota in notas_no_publicadas:
         nota.publicada = True
+    # Leídos antes del commit: después las notas quedan expiradas y cada acceso sería una consulta
+    alumno_ids = {nota.alumno_id for nota in notas_no_publicadas}
     
     db.commit()
+    invalidate_summaries(alumno_ids, [docente.id])
+    refresh_subject_stats(db, [asignatura_id])
+    publish_grades_event("notas_publicadas", asignatura_id, asignatura.nombre, alumno_ids, len(notas_no_publicadas))
     
     return {
         "message": "Todas las notas han sido publicadas exitosamente",
@@ -788,18 +662,10 @@ async def enviar_todas_las_notas(
     asignatura_id: int,
     alumno_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Enviar todas las notas de un alumno en una asignatura específica por email"""
     
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     # Verificar que la asignatura pertenece al docente
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == asignatura_id,
@@ -907,115 +773,173 @@ async def enviar_todas_las_notas(
             "instructions": "Verifica la configuración de email en el sistema."
         }
 
-@router.get("/reportes/{asignatura_id}/{tipo_evaluacion}")
-async def obtener_reporte(
-    asignatura_id: int,
-    tipo_evaluacion: str,
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
-):
-    """Obtener reporte de notas por asignatura y tipo de evaluación"""
-    # Verificar que el docente tiene acceso a esta asignatura
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
-    # Verificar que la asignatura pertenece al docente
+# Columna de Promedio y tipos de nota que respaldan cada categoría de reporte
+_REPORTE_PROMEDIO_COLS = {
+    "actividades": Promedio.actividades,
+    "practicas": Promedio.practicas,
+    "parciales": Promedio.parciales,
+    "examen_final": Promedio.examen_final,
+    "promedio_final": Promedio.promedio_final,
+}
+# Filas traídas por lote al recorrer el cursor del reporte
+_REPORTE_BATCH = 500
+
+
+class ReporteExportRequest(BaseModel):
+    asignatura_id: int
+    tipo_evaluacion: str
+
+
+class ReporteEmailRequest(ReporteExportRequest):
+    email: str
+
+
+def _asignatura_del_docente(db: Session, asignatura_id: int, docente: Docente) -> Asignatura:
     asignatura = db.query(Asignatura).filter(
         Asignatura.id == asignatura_id,
         Asignatura.docente_id == docente.id
     ).first()
-    
     if not asignatura:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Asignatura no encontrada o no tienes acceso a ella"
         )
-    
-    # Obtener alumnos matriculados en la asignatura
-    from sqlalchemy import text
-    matriculas_data = db.execute(
-        text("SELECT alumno_id FROM matriculas WHERE asignatura_id = :asignatura_id"),
-        {"asignatura_id": asignatura_id}
-    ).fetchall()
-    
-    alumno_ids = [matricula[0] for matricula in matriculas_data]
+    return asignatura
 
-    # Normalizar tipo de evaluación recibido y preparar mapeos
-    tipo_norm = _normalize_tipo_evaluacion(tipo_evaluacion)
-    promedio_cols = {
-        "actividades": "actividades",
-        "practicas": "practicas",
-        "parciales": "parciales",
-        "examen_final": "examen_final",
-        "promedio_final": "promedio_final",
-    }
-    # Tipos de notas en la tabla "notas" que respaldan cada categoría
-    nota_tipos_map = {
-        "actividades": [
-            "participacion", "tarea", "quiz", "laboratorio",
-            "proyecto", "trabajo_grupal", "exposicion"
-        ],
-        "practicas": ["practica"],
-        "parciales": ["examen_parcial", "parcial"],
-        "examen_final": ["examen_final"],
-        "promedio_final": [],
-    }
 
-    # Obtener notas del tipo especificado para estos alumnos
-    reporte_data = []
-    for alumno_id in alumno_ids:
-        alumno = db.query(Alumno).filter(Alumno.id == alumno_id).first()
-        if not alumno:
-            continue
-        # Calcular calificación según promedio o, en su defecto, por notas registradas
-        calificacion = 0  # Valor predeterminado
-        promedio = db.query(Promedio).filter(
-            Promedio.alumno_id == alumno_id,
-            Promedio.asignatura_id == asignatura_id
-        ).first()
+def _iter_reporte_filas(db: Session, asignatura: Asignatura, tipo_evaluacion: str):
+    """Recorrer las filas del reporte con una sola consulta leída por lotes desde el cursor.
 
-        # 1) Intentar obtener desde la tabla de promedios
-        col = promedio_cols.get(tipo_norm)
-        if promedio and col and getattr(promedio, col) is not None:
-            calificacion = getattr(promedio, col)
-        else:
-            # 2) Si no hay promedio, intentar respaldarse en notas registradas
-            tipos_nota = nota_tipos_map.get(tipo_norm, [])
-            if tipos_nota:
-                if tipo_norm == "actividades":
-                    # Promedio de todas las actividades registradas
-                    notas_act = db.query(Nota).filter(
-                        Nota.alumno_id == alumno_id,
-                        Nota.asignatura_id == asignatura_id,
-                        Nota.tipo_nota.in_(tipos_nota)
-                    ).all()
-                    if notas_act:
-                        valores = [n.calificacion for n in notas_act if n.calificacion is not None]
-                        if valores:
-                            calificacion = sum(valores) / len(valores)
-                else:
-                    # Tomar la última nota registrada del tipo correspondiente
-                    nota = db.query(Nota).filter(
-                        Nota.alumno_id == alumno_id,
-                        Nota.asignatura_id == asignatura_id,
-                        Nota.tipo_nota.in_(tipos_nota)
-                    ).order_by(Nota.fecha_registro.desc()).first()
-                    if nota and nota.calificacion is not None:
-                        calificacion = nota.calificacion
+    La calificación sale del promedio registrado; si no existe, de las notas de la categoría
+    según el esquema de la asignatura y, en su defecto, 0.
+    """
+    tipo_norm = _normalize_tipo_evaluacion(tipo_evaluacion)
+    columnas = [Alumno.id, Alumno.nombre_completo, Alumno.ciclo]
 
-        # Agregar al reporte
-        reporte_data.append({
-            "alumno": alumno.nombre_completo,
+    col = _REPORTE_PROMEDIO_COLS.get(tipo_norm)
+    if col is not None:
+        columnas.append(
+            db.query(col)
+            .filter(Promedio.alumno_id == Alumno.id, Promedio.asignatura_id == asignatura.id)
+            .order_by(Promedio.id)
+            .limit(1)
+            .correlate(Alumno)
+            .scalar_subquery()
+        )
+    categoria = get_scheme(db, asignatura.id).get(tipo_norm)
+    if categoria and categoria["tipos"]:
+        agregados = {"promedio": func.avg(Nota.calificacion), "maxima": func.max(Nota.calificacion)}
+        notas = db.query(agregados.get(categoria["agregacion"], Nota.calificacion)).filter(
+            Nota.alumno_id == Alumno.id,
+            Nota.asignatura_id == asignatura.id,
+            Nota.tipo_nota.in_(categoria["tipos"])
+        )
+        if categoria["agregacion"] == "ultima":
+            notas = notas.order_by(Nota.fecha_registro.desc(), Nota.id.desc()).limit(1)
+        columnas.append(notas.correlate(Alumno).scalar_subquery())
+
+    query = (
+        db.query(*columnas)
+        .join(matriculas, matriculas.c.alumno_id == Alumno.id)
+        .filter(matriculas.c.asignatura_id == asignatura.id)
+        .order_by(Alumno.id)
+        .yield_per(_REPORTE_BATCH)
+    )
+    for _alumno_id, nombre, ciclo, *respaldos in query:
+        calificacion = next((v for v in respaldos if v is not None), 0)
+        yield {
+            "alumno": nombre,
             "asignatura": asignatura.nombre,
-            "ciclo": alumno.ciclo,
+            "ciclo": ciclo,
             "tipo_evaluacion": tipo_evaluacion,
             "calificacion": calificacion
-        })
-    
+        }
+
+
+def _reporte_csv_chunks(filas):
+    """Serializar las filas a CSV en bloques de bytes"""
+    columnas = ["alumno", "ciclo", "asignatura", "tipo_evaluacion", "calificacion"]
+    buffer = io.StringIO(newline="")
+    writer = csv.DictWriter(buffer, fieldnames=columnas)
+    writer.writeheader()
+    for i, fila in enumerate(filas, start=1):
+        writer.writerow(fila)
+        if i % _REPORTE_BATCH == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _reporte_pdf_bytes(filas, asignatura_nombre: str, tipo_evaluacion: str, docente_nombre: str) -> bytes:
+    """Generar el PDF del reporte en memoria (CPU intensivo: llamar desde un hilo)"""
+    styles = getSampleStyleSheet()
+    story = []
+
+    titulo = f"Reporte de Notas - {asignatura_nombre} ({tipo_evaluacion})"
+    story.append(Paragraph(titulo, styles["Title"]))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph(f"Docente: {docente_nombre}", styles["Normal"]))
+    story.append(Paragraph(f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles["Normal"]))
+    story.append(Spacer(1, 12))
+
+    # Encabezados y filas
+    encabezados = ["Alumno", "Ciclo", "Asignatura", "Tipo Evaluación", "Calificación"]
+    data = [encabezados] + (filas if filas else [["-","-","-","-","-"]])
+    table = Table(data, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#f0f0f0')),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.black),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0,0), (-1,0), 10),
+        ('BOTTOMPADDING', (0,0), (-1,0), 8),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+        ('FONTSIZE', (0,1), (-1,-1), 9),
+    ]))
+    story.append(table)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def _reporte_filename(docente: Docente, asignatura_nombre: str, tipo_evaluacion: str, ext: str) -> str:
+    asignatura = asignatura_nombre.replace(" ", "_")
+    tipo_eval = tipo_evaluacion.replace(" ", "_")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"reporte_{docente.id}_{asignatura}_{tipo_eval}_{timestamp}.{ext}"
+
+
+def _registrar_reporte(db: Session, docente: Docente, asignatura_nombre: str, tipo_evaluacion: str,
+                       filename: str, mime_type: str, content) -> ReporteDocente:
+    """Guardar el registro del reporte y su archivo en el almacén de reportes"""
+    reporte_record = ReporteDocente(
+        docente_id=docente.id,
+        nombre_docente=docente.nombre_completo,
+        asignatura=asignatura_nombre,
+        tipo_evaluacion=tipo_evaluacion,
+        archivo_path=f"db:{filename}"
+    )
+    db.add(reporte_record)
+    db.flush()
+    store_report_file(db, reporte_record.id, filename, mime_type, content)
+    db.commit()
+    return reporte_record
+
+
+@router.get("/reportes/{asignatura_id}/{tipo_evaluacion}")
+async def obtener_reporte(
+    asignatura_id: int,
+    tipo_evaluacion: str,
+    db: Session = Depends(get_db),
+    docente: Docente = Depends(get_current_docente)
+):
+    """Obtener reporte de notas por asignatura y tipo de evaluación"""
+    asignatura = _asignatura_del_docente(db, asignatura_id, docente)
+    reporte_data = list(_iter_reporte_filas(db, asignatura, tipo_evaluacion))
+
     return {
         "reporte": reporte_data,
         "total_alumnos": len(reporte_data),
@@ -1025,75 +949,24 @@ async def obtener_reporte(
 
 @router.post("/reportes/enviar-admin")
 async def enviar_reporte_admin(
-    reporte_data: dict,
+    payload: ReporteExportRequest,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
-    """Enviar reporte de notas al administrador"""
-    # Verificar que el docente existe
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
-    # Preparar carpeta de reportes
-    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    reports_dir = os.path.join(backend_dir, "reports")
-    try:
-        os.makedirs(reports_dir, exist_ok=True)
-    except Exception:
-        # Si falla usar directorio actual
-        reports_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
-        os.makedirs(reports_dir, exist_ok=True)
-
-    # Construir nombre de archivo
-    asignatura = str(reporte_data.get("asignatura", "asignatura")).replace(" ", "_")
-    tipo_eval = str(reporte_data.get("tipo_evaluacion", "evaluacion")).replace(" ", "_")
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"reporte_{docente.id}_{asignatura}_{tipo_eval}_{timestamp}.csv"
+    """Generar en el servidor el CSV del reporte y enviarlo al administrador"""
+    asignatura = _asignatura_del_docente(db, payload.asignatura_id, docente)
+    filename = _reporte_filename(docente, asignatura.nombre, payload.tipo_evaluacion, "csv")
 
-    # Generar CSV en memoria
-    columnas = ["alumno", "ciclo", "asignatura", "tipo_evaluacion", "calificacion"]
     try:
-        buffer = io.StringIO(newline="")
-        writer = csv.DictWriter(buffer, fieldnames=columnas)
-        writer.writeheader()
-        for fila in reporte_data.get("reporte", []):
-            writer.writerow({
-                "alumno": fila.get("alumno", ""),
-                "ciclo": fila.get("ciclo", ""),
-                "asignatura": fila.get("asignatura", asignatura),
-                "tipo_evaluacion": fila.get("tipo_evaluacion", tipo_eval),
-                "calificacion": fila.get("calificacion", "")
-            })
-        csv_bytes = buffer.getvalue().encode("utf-8")
+        # El CSV se escribe al almacén a medida que se leen las filas del cursor
+        filas = _iter_reporte_filas(db, asignatura, payload.tipo_evaluacion)
+        reporte_record = _registrar_reporte(
+            db, docente, asignatura.nombre, payload.tipo_evaluacion,
+            filename, "text/csv", _reporte_csv_chunks(filas)
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"No se pudo generar el archivo de reporte en memoria: {e}")
-
-    # Guardar registro del reporte (indicando que el archivo está en BD)
-    reporte_record = ReporteDocente(
-        docente_id=docente.id,
-        nombre_docente=docente.nombre_completo,
-        asignatura=reporte_data.get("asignatura", ""),
-        tipo_evaluacion=reporte_data.get("tipo_evaluacion", ""),
-        archivo_path=f"db:{filename}"
-    )
-    db.add(reporte_record)
-    db.commit()
-    db.refresh(reporte_record)
-
-    # Guardar contenido del archivo en la tabla de archivos
-    archivo_record = ReporteArchivoDocente(
-        reporte_id=reporte_record.id,
-        filename=filename,
-        mime_type="text/csv",
-        content=csv_bytes
-    )
-    db.add(archivo_record)
-    db.commit()
-    db.refresh(archivo_record)
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"No se pudo generar el archivo de reporte: {e}")
 
     return {
         "message": "Reporte enviado al administrador exitosamente",
@@ -1105,88 +978,28 @@ async def enviar_reporte_admin(
 
 @router.post("/reportes/enviar-email")
 async def enviar_reporte_email(
-    payload: dict,
+    payload: ReporteEmailRequest,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
-    """Generar el PDF del reporte y enviarlo por correo a la dirección indicada.
-
-    Espera un payload con:
-    - email/correo: str (se acepta cualquiera de las dos claves)
-    - asignatura: str
-    - tipo_evaluacion: str
-    - reporte: lista de filas con keys: alumno, ciclo, asignatura, tipo_evaluacion, calificacion
-    """
-    # Verificar que el docente existe
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-
-    # Aceptar distintas claves desde el frontend: "email" o "correo"
-    email = payload.get("email") or payload.get("correo") or payload.get("destinatario")
-    # Normalizar y validar de forma tolerante
-    if not email:
-        raise HTTPException(status_code=400, detail="Email requerido")
-    email = str(email).strip()
-    # Evitar validación estricta que puede fallar por espacios u otros caracteres
-    # Usar una validación sencilla para permitir correos válidos típicos
+    """Generar en el servidor el PDF del reporte y enviarlo por correo a la dirección indicada."""
+    email = payload.email.strip()
+    # Validación sencilla para permitir correos válidos típicos
     import re
     if not re.match(r"^[^\s@]+@[^\s@]+\.[^\s@]+$", email):
         raise HTTPException(status_code=400, detail="Email inválido")
 
-    # Construir nombre de archivo (PDF)
-    asignatura = str(payload.get("asignatura", "asignatura")).replace(" ", "_")
-    tipo_eval = str(payload.get("tipo_evaluacion", "evaluacion")).replace(" ", "_")
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"reporte_{docente.id}_{asignatura}_{tipo_eval}_{timestamp}.pdf"
+    asignatura = _asignatura_del_docente(db, payload.asignatura_id, docente)
+    filename = _reporte_filename(docente, asignatura.nombre, payload.tipo_evaluacion, "pdf")
 
-    # Generar PDF con los datos del reporte en memoria
+    filas = [
+        [str(f["alumno"]), str(f["ciclo"]), str(f["asignatura"]), str(f["tipo_evaluacion"]), str(f["calificacion"])]
+        for f in _iter_reporte_filas(db, asignatura, payload.tipo_evaluacion)
+    ]
     try:
-        styles = getSampleStyleSheet()
-        story = []
-
-        titulo = f"Reporte de Notas - {payload.get('asignatura', asignatura)} ({payload.get('tipo_evaluacion', tipo_eval)})"
-        story.append(Paragraph(titulo, styles["Title"]))
-        story.append(Spacer(1, 12))
-        story.append(Paragraph(f"Docente: {docente.nombre_completo}", styles["Normal"]))
-        story.append(Paragraph(f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles["Normal"]))
-        story.append(Spacer(1, 12))
-
-        # Encabezados y filas
-        encabezados = ["Alumno", "Ciclo", "Asignatura", "Tipo Evaluación", "Calificación"]
-        filas = []
-        for fila in payload.get("reporte", []):
-            filas.append([
-                str(fila.get("alumno", "")),
-                str(fila.get("ciclo", "")),
-                str(fila.get("asignatura", payload.get("asignatura", asignatura))),
-                str(fila.get("tipo_evaluacion", payload.get("tipo_evaluacion", tipo_eval))),
-                str(fila.get("calificacion", "")),
-            ])
-
-        data = [encabezados] + (filas if filas else [["-","-","-","-","-"]])
-        table = Table(data, repeatRows=1)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#f0f0f0')),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.black),
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,0), 10),
-            ('BOTTOMPADDING', (0,0), (-1,0), 8),
-            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-            ('FONTSIZE', (0,1), (-1,-1), 9),
-        ]))
-        story.append(table)
-
-        # Construir el PDF en memoria
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        doc.build(story)
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
+        pdf_bytes = await run_in_threadpool(
+            _reporte_pdf_bytes, filas, asignatura.nombre, payload.tipo_evaluacion, docente.nombre_completo
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo generar el PDF del reporte: {e}")
 
@@ -1196,8 +1009,8 @@ async def enviar_reporte_email(
         email_result = await send_report_with_attachment_bytes(
             email=email,
             nombre_docente=docente.nombre_completo,
-            asignatura=payload.get("asignatura", asignatura),
-            tipo_evaluacion=payload.get("tipo_evaluacion", tipo_eval),
+            asignatura=asignatura.nombre,
+            tipo_evaluacion=payload.tipo_evaluacion,
             filename=filename,
             file_bytes=pdf_bytes,
             mime_type="application/pdf",
@@ -1205,26 +1018,10 @@ async def enviar_reporte_email(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo enviar el correo: {e}")
 
-    # Persistir registro en DB y archivo del reporte en BD
-    reporte_record = ReporteDocente(
-        docente_id=docente.id,
-        nombre_docente=docente.nombre_completo,
-        asignatura=payload.get("asignatura", ""),
-        tipo_evaluacion=payload.get("tipo_evaluacion", ""),
-        archivo_path=f"db:{filename}",
+    reporte_record = _registrar_reporte(
+        db, docente, asignatura.nombre, payload.tipo_evaluacion,
+        filename, "application/pdf", pdf_bytes
     )
-    db.add(reporte_record)
-    db.commit()
-    db.refresh(reporte_record)
-
-    archivo_record = ReporteArchivoDocente(
-        reporte_id=reporte_record.id,
-        filename=filename,
-        mime_type="application/pdf",
-        content=pdf_bytes,
-    )
-    db.add(archivo_record)
-    db.commit()
 
     return {
         "message": email_result.get("message", "Reporte enviado"),
@@ -1240,18 +1037,10 @@ async def enviar_reporte_email(
 async def obtener_promedios_asignatura(
     asignatura_id: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    docente: Docente = Depends(get_current_docente)
 ):
     """Obtener todos los promedios de una asignatura"""
     try:
-        # Verificar que el docente tiene acceso a esta asignatura
-        docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-        if not docente:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Docente no encontrado"
-            )
-        
         # Verificar que la asignatura pertenece al docente
         asignatura = db.query(Asignatura).filter(
             Asignatura.id == asignatura_id,
@@ -1323,21 +1112,94 @@ async def obtener_promedios_asignatura(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al obtener promedios: {str(e)}"
         )
+
+class CategoriaEsquema(BaseModel):
+    peso: float
+    tipos: List[str] = []
+    agregacion: str = "ultima"  # promedio, ultima o maxima
+
+class EsquemaCalificacionRequest(BaseModel):
+    categorias: Dict[str, CategoriaEsquema]
+
+@router.get("/asignatura/{asignatura_id}/esquema")
+async def obtener_esquema_calificacion(
+    asignatura_id: int,
+    db: Session = Depends(get_db),
+    docente: Docente = Depends(get_current_docente)
+):
+    """Pesos, tipos de nota y agregación de cada categoría con que se calculan los promedios"""
+    _asignatura_del_docente(db, asignatura_id, docente)
+    return {
+        "asignatura_id": asignatura_id,
+        "por_defecto": is_default_scheme(db, asignatura_id),
+        "categorias": get_scheme(db, asignatura_id),
+    }
+
+@router.put("/asignatura/{asignatura_id}/esquema")
+async def guardar_esquema_calificacion(
+    asignatura_id: int,
+    esquema: EsquemaCalificacionRequest,
+    db: Session = Depends(get_db),
+    docente: Docente = Depends(get_current_docente)
+):
+    """Definir el esquema de la asignatura y recalcular los promedios de todos sus alumnos"""
+    _asignatura_del_docente(db, asignatura_id, docente)
+    try:
+        categorias = set_scheme(db, asignatura_id, {k: v.model_dump() for k, v in esquema.categorias.items()})
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    cambios = recompute_subject_grades(db, [asignatura_id])
+    db.commit()
+    invalidate_asignatura_summaries(db, asignatura_id)
+    return {"asignatura_id": asignatura_id, "por_defecto": False, "categorias": categorias, "promedios_actualizados": cambios}
+
+@router.post("/asignatura/{asignatura_id}/recalcular-promedios")
+async def recalcular_promedios(
+    asignatura_id: int,
+    db: Session = Depends(get_db),
+    docente: Docente = Depends(get_current_docente)
+):
+    """Recalcular los promedios de toda la asignatura con su esquema actual"""
+    _asignatura_del_docente(db, asignatura_id, docente)
+    cambios = recompute_subject_grades(db, [asignatura_id])
+    db.commit()
+    invalidate_asignatura_summaries(db, asignatura_id)
+    return {"asignatura_id": asignatura_id, "promedios_actualizados": cambios}
+
+@router.get("/asignatura/{asignatura_id}/estadisticas")
+async def estadisticas_asignatura(
+    asignatura_id: int,
+    solo_publicadas: bool = False,
+    db: Session = Depends(get_db),
+    docente: Docente = Depends(get_current_docente)
+):
+    """Ranking, percentiles, desviación estándar e histograma de las notas de una asignatura"""
+    _asignatura_del_docente(db, asignatura_id, docente)
+    return {"asignatura_id": asignatura_id, **subject_statistics(db, [asignatura_id], solo_publicadas)}
+
+@router.get("/ciclo/{ciclo}/estadisticas")
+async def estadisticas_ciclo(
+    ciclo: str,
+    solo_publicadas: bool = False,
+    db: Session = Depends(get_db),
+    docente: Docente = Depends(get_current_docente)
+):
+    """Las mismas estadísticas sobre todas las asignaturas del docente en un ciclo (ranking por promedio general)"""
+    asignatura_ids = cycle_subject_ids(db, ciclo, docente.id)
+    if not asignatura_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No tienes asignaturas en este ciclo"
+        )
+    return {"ciclo": ciclo, "asignaturas": asignatura_ids, **subject_statistics(db, asignatura_ids, solo_publicadas)}
 @router.put("/mi-perfil")
 async def actualizar_mi_perfil(
     perfil_data: dict,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(require_role("docente"))
+    current_user: Usuario = Depends(require_role("docente")),
+    docente: Docente = Depends(get_current_docente)
 ):
     """Actualizar el perfil del docente (contraseña)"""
-    # Obtener el docente
-    docente = db.query(Docente).filter(Docente.usuario_id == current_user.id).first()
-    if not docente:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Docente no encontrado"
-        )
-    
     # Verificar que se proporcionó la contraseña actual
     password_actual = perfil_data.get("password_actual")
     if not password_actual:
@@ -1347,7 +1209,7 @@ async def actualizar_mi_perfil(
         )
     
     # Verificar la contraseña actual
-    if not verify_password(password_actual, current_user.password_hash):
+    if not await verify_password_async(password_actual, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="La contraseña actual es incorrecta"
@@ -1369,8 +1231,11 @@ async def actualizar_mi_perfil(
         )
     
     # Actualizar la contraseña
-    current_user.password_hash = get_password_hash(nueva_password)
+    current_user.password_hash = await get_password_hash_async(nueva_password)
+    # Cerrar las demás sesiones: un refresh token filtrado deja de servir
+    revoke_refresh_tokens(db, current_user.id)
     db.commit()
+    invalidate_identity(current_user.id)
     db.refresh(current_user)
     
     return {
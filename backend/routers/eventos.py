@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+import json
+
+from database import SessionLocal
+from auth import get_token_claims, _resolve_user
+from events import EVENTOS_HEARTBEAT, Suscripcion, get_broker
+
+router = APIRouter()
+
+_ROLES = {"alumno", "admin"}
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _alumno_suscrito(claims: dict) -> Optional[int]:
+    """Validar al usuario y devolver su alumno_id (None para el administrador).
+
+    La sesión se cierra enseguida: la conexión queda abierta mucho tiempo y no debe retener la BD.
+    """
+    if "rol" in claims and claims["rol"] not in _ROLES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permisos suficientes")
+    db = SessionLocal()
+    try:
+        user = _resolve_user(db, claims)
+        if not user.activo:
+            raise HTTPException(status_code=400, detail="Usuario inactivo")
+        if user.rol not in _ROLES:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permisos suficientes")
+        if user.rol == "admin":
+            return None
+        if user.alumno is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alumno no encontrado")
+        return user.alumno.id
+    finally:
+        db.close()
+
+
+@router.get("/stream")
+async def stream_eventos(request: Request, claims: dict = Depends(get_token_claims)):
+    """Eventos de publicación de notas (SSE) para alumnos (las suyas) y administradores (todas).
+
+    Una conexión por cliente en lugar de consultar las notas periódicamente. Eventos:
+    `notas_publicadas`, `notas_despublicadas` y `reiniciar` (se perdieron eventos: recargar todo).
+    """
+    suscripcion = Suscripcion(_alumno_suscrito(claims))
+    broker = get_broker()
+
+    async def eventos():
+        broker.subscribe(suscripcion)
+        try:
+            # retry: espera sugerida al navegador antes de reconectar (ms)
+            yield "retry: 5000\n" + _sse({"alumno_id": suscripcion.alumno_id}, event="conectado")
+            while True:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), EVENTOS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                if suscripcion.desbordada:
+                    suscripcion.desbordada = False
+                    yield _sse({}, event="reiniciar")
+                yield _sse(evento, event=evento["tipo"])
+        finally:
+            broker.unsubscribe(suscripcion)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
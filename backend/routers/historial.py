@@ -1,18 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 from database import get_db
-from models import Alumno, Asignatura, Nota, HistorialAcademico, AsignaturaHistorial, NotaHistorial, matriculas
-from schemas import (
-    HistorialAcademico as HistorialAcademicoSchema,
-    HistorialAcademicoCreate,
-    AsignaturaHistorial as AsignaturaHistorialSchema,
-    AsignaturaHistorialCreate,
-    NotaHistorial as NotaHistorialSchema,
-    NotaHistorialCreate
-)
-from auth import require_role, get_current_user
-from sqlalchemy import func, and_
+from models import Alumno, HistorialAcademico, AsignaturaHistorial
+from schemas import HistorialAcademico as HistorialAcademicoSchema
+from auth import require_role, get_current_user, get_current_alumno
+from history_snapshot import CicloSnapshot, snapshot_cycles, get_history_json, invalidate_history
+from versioning import not_modified
 import re
 
 router = APIRouter()
@@ -31,33 +25,15 @@ def get_base_ciclo(ciclo: str) -> str:
 # Obtener historial académico del alumno actual
 @router.get("/alumnos/me/historial", response_model=List[HistorialAcademicoSchema])
 def get_mi_historial_academico(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user = Depends(require_role("alumno")),
+    alumno: Alumno = Depends(get_current_alumno),
     auto_generar: bool = False
 ):
-    # Buscar el alumno asociado al usuario
-    alumno = db.query(Alumno).filter(Alumno.usuario_id == current_user.id).first()
-    if not alumno:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Alumno no encontrado"
-        )
-    
-    # Obtener el historial académico del alumno
-    historiales = db.query(HistorialAcademico).filter(HistorialAcademico.alumno_id == alumno.id).all()
-    
     # Si no hay historiales y se solicita explícitamente, generar uno automáticamente
-    if not historiales and auto_generar:
-        # Obtener todas las asignaturas del alumno (incluyendo ciclos anteriores)
-        asignaturas = db.query(Asignatura).join(
-            matriculas, 
-            and_(
-                matriculas.c.asignatura_id == Asignatura.id,
-                matriculas.c.alumno_id == alumno.id
-            )
-        ).all()
-        
-        # Filtrar asignaturas que no son del ciclo actual
+    if auto_generar and not db.query(HistorialAcademico.id).filter(HistorialAcademico.alumno_id == alumno.id).first():
+        # Tomar las asignaturas del ciclo anterior al actual
         ciclo_actual = alumno.ciclo
         ciclo_actual_base = get_base_ciclo(ciclo_actual)
         
@@ -80,76 +56,20 @@ def get_mi_historial_academico(
         if ciclo_actual_base == "II":
             ciclo_anterior = "I"
         
-        # Crear un historial para el ciclo anterior
-        historial = HistorialAcademico(
+        # Copiar el ciclo anterior al historial (más la asignatura "Cultura" con promedio predeterminado)
+        snapshot_cycles(db, [CicloSnapshot(
             alumno_id=alumno.id,
-            ciclo=ciclo_anterior
-        )
-        db.add(historial)
-        db.flush()
-        
-        # Agregar asignaturas al historial (las del ciclo anterior)
-        for asignatura in asignaturas:
-            # Incluir asignaturas del ciclo anterior
-            if asignatura.ciclo == ciclo_anterior or (ciclo_actual_base == "II" and asignatura.ciclo == "I"):
-                # Calcular promedio de notas para esta asignatura
-                promedio_query = db.query(func.avg(Nota.calificacion)).filter(
-                    Nota.alumno_id == alumno.id,
-                    Nota.asignatura_id == asignatura.id
-                ).scalar()
-                
-                promedio = promedio_query if promedio_query else 0.0
-                
-                # Crear asignatura en historial
-                asignatura_historial = AsignaturaHistorial(
-                    historial_id=historial.id,
-                    nombre=asignatura.nombre,
-                    promedio=promedio
-                )
-                db.add(asignatura_historial)
-                db.flush()
-                
-                # Obtener notas de esta asignatura
-                notas = db.query(Nota).filter(
-                    Nota.alumno_id == alumno.id,
-                    Nota.asignatura_id == asignatura.id
-                ).all()
-                
-                # Guardar notas en historial
-                for nota in notas:
-                    nota_historial = NotaHistorial(
-                        asignatura_id=asignatura_historial.id,
-                        calificacion=nota.calificacion,
-                        tipo_nota=nota.tipo_nota,
-                        fecha_registro=nota.fecha_registro
-                    )
-                    db.add(nota_historial)
-        
-        # Agregar la asignatura "Cultura" al historial
-        asignatura_cultura = AsignaturaHistorial(
-            historial_id=historial.id,
-            nombre="Cultura",
-            promedio=15.0  # Promedio predeterminado
-        )
-        db.add(asignatura_cultura)
-        db.flush()
-        
-        # Agregar una nota para la asignatura Cultura
-        nota_cultura = NotaHistorial(
-            asignatura_id=asignatura_cultura.id,
-            calificacion=15.0,
-            tipo_nota="Promedio Final",
-            fecha_registro=func.now()
-        )
-        db.add(nota_cultura)
-        
+            ciclo=ciclo_anterior,
+            ciclo_asignaturas=ciclo_anterior,
+            extras=(("Cultura", 15.0, "Promedio Final"),),
+        )])
         db.commit()
-        db.refresh(historial)
-        
-        # Actualizar la lista de historiales
-        historiales = [historial]
+        invalidate_history([alumno.id])
     
-    return historiales
+    sin_cambios = not_modified(request, response, db, "historial", [f"historial:{alumno.id}"], alumno.id)
+    if sin_cambios:
+        return sin_cambios
+    return Response(content=get_history_json(db, alumno.id), media_type="application/json", headers=dict(response.headers))
 
 # Obtener historial académico de un alumno (para administradores)
 @router.get("/alumnos/{alumno_id}/historial", response_model=List[HistorialAcademicoSchema])
@@ -165,10 +85,7 @@ def get_historial_academico(
             detail="No tienes permiso para ver este historial académico"
         )
     
-    # Obtener el historial académico del alumno
-    historiales = db.query(HistorialAcademico).filter(HistorialAcademico.alumno_id == alumno_id).all()
-    
-    return historiales
+    return Response(content=get_history_json(db, alumno_id), media_type="application/json")
 
 # Crear historial académico para un alumno (cuando pasa de ciclo)
 @router.post("/alumnos/{alumno_id}/historial", response_model=HistorialAcademicoSchema)
@@ -185,64 +102,18 @@ def create_historial_academico(
             detail="Alumno no encontrado"
         )
     
-    # Obtener el ciclo actual del alumno
+    # Copiar las asignaturas del ciclo actual y sus notas al historial
     ciclo_actual_full = alumno.ciclo
-    ciclo_actual_base = get_base_ciclo(ciclo_actual_full)
-    
-    # Crear el historial académico
-    historial = HistorialAcademico(
+    ids = snapshot_cycles(db, [CicloSnapshot(
         alumno_id=alumno_id,
-        ciclo=ciclo_actual_full
-    )
-    db.add(historial)
-    db.flush()  # Para obtener el ID del historial
-    
-    # Obtener las asignaturas del alumno en el ciclo actual
-    asignaturas = db.query(Asignatura).filter(
-        Asignatura.id.in_(
-            db.query(matriculas.c.asignatura_id)
-            .filter(matriculas.c.alumno_id == alumno_id)
-        ),
-        Asignatura.ciclo == ciclo_actual_base
-    ).all()
-    
-    # Para cada asignatura, calcular el promedio y guardar en el historial
-    for asignatura in asignaturas:
-        # Calcular el promedio de notas para esta asignatura
-        promedio_query = db.query(func.avg(Nota.calificacion)).filter(
-            Nota.alumno_id == alumno_id,
-            Nota.asignatura_id == asignatura.id
-        ).scalar()
-        
-        promedio = promedio_query if promedio_query else 0.0
-        
-        # Crear la asignatura en el historial
-        asignatura_historial = AsignaturaHistorial(
-            historial_id=historial.id,
-            nombre=asignatura.nombre,
-            promedio=promedio
-        )
-        db.add(asignatura_historial)
-        db.flush()  # Para obtener el ID de la asignatura historial
-        
-        # Obtener todas las notas de esta asignatura para el alumno
-        notas = db.query(Nota).filter(
-            Nota.alumno_id == alumno_id,
-            Nota.asignatura_id == asignatura.id
-        ).all()
-        
-        # Guardar cada nota en el historial
-        for nota in notas:
-            nota_historial = NotaHistorial(
-                asignatura_id=asignatura_historial.id,
-                calificacion=nota.calificacion,
-                tipo_nota=nota.tipo_nota,
-                fecha_registro=nota.fecha_registro
-            )
-            db.add(nota_historial)
-    
+        ciclo=ciclo_actual_full,
+        ciclo_asignaturas=get_base_ciclo(ciclo_actual_full),
+    )])
     db.commit()
-    db.refresh(historial)
+    invalidate_history([alumno_id])
+    historial = db.query(HistorialAcademico).options(
+        selectinload(HistorialAcademico.asignaturas).selectinload(AsignaturaHistorial.notas)
+    ).filter(HistorialAcademico.id == ids[(alumno_id, ciclo_actual_full)]).one()
     
     return historial
 
@@ -263,29 +134,24 @@ def delete_historial_academico(
             detail="Alumno no encontrado"
         )
 
-    # Seleccionar historiales a eliminar
+    # Asignaturas y notas del historial se eliminan por ON DELETE CASCADE
     query = db.query(HistorialAcademico).filter(HistorialAcademico.alumno_id == alumno_id)
     if ciclo:
         query = query.filter(HistorialAcademico.ciclo == ciclo)
-    historiales = query.all()
-
-    if not historiales:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No hay historial académico para eliminar"
-        )
 
     try:
-        for historial in historiales:
-            # Eliminar notas y asignaturas del historial
-            asignaturas_historial = db.query(AsignaturaHistorial).filter(AsignaturaHistorial.historial_id == historial.id).all()
-            for asignatura in asignaturas_historial:
-                db.query(NotaHistorial).filter(NotaHistorial.asignatura_id == asignatura.id).delete()
-            db.query(AsignaturaHistorial).filter(AsignaturaHistorial.historial_id == historial.id).delete()
-            db.delete(historial)
-
+        eliminados = query.delete(synchronize_session=False)
+        if not eliminados:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No hay historial académico para eliminar"
+            )
         db.commit()
+        invalidate_history([alumno_id])
         return {"message": "Historial académico eliminado", "alumno_id": alumno_id, "ciclo": ciclo}
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -125,6 +125,10 @@ class Nota(NotaBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -208,7 +212,7 @@ class AsignaturaConNotas(Asignatura):
 
 # Schemas para Reportes enviados por Docentes
 class ReporteDocenteBase(BaseModel):
-    docente_id: int
+    docente_id: Optional[int] = None
     nombre_docente: str
     asignatura: str
     tipo_evaluacion: str
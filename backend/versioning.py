@@ -0,0 +1,115 @@
+import hashlib
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request, Response, status
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import VersionEntidad
+
+# (tabla, entidad, id de la fila para la clave "entidad:id", columnas vigiladas en UPDATE).
+# Las tablas de notas, promedios, matrículas e historial se cuentan por alumno: es el alcance de sus lecturas.
+_CONTADORES = (
+    # La contraseña no aparece en ninguna respuesta: cambiarla no invalida los ETag
+    ("usuarios", "usuarios", "{r}.id", "nombre, email, rol, activo"),
+    ("docentes", "docentes", "{r}.id", None),
+    ("asignaturas", "asignaturas", "{r}.id", None),
+    ("alumnos", "alumnos", "{r}.id", None),
+    ("notas", "notas", "{r}.alumno_id", None),
+    ("promedios", "promedios", "{r}.alumno_id", None),
+    ("matriculas", "matriculas", "{r}.alumno_id", None),
+    ("historiales_academicos", "historial", "{r}.alumno_id", None),
+    ("asignaturas_historial", "historial",
+     "(SELECT alumno_id FROM historiales_academicos WHERE id = {r}.historial_id)", None),
+    ("notas_historial", "historial",
+     "(SELECT h.alumno_id FROM asignaturas_historial a JOIN historiales_academicos h ON h.id = a.historial_id "
+     "WHERE a.id = {r}.asignatura_id)", None),
+)
+# Cambia si cambia la forma de las respuestas: los ETag emitidos por la versión anterior dejan de coincidir
+_FORMATO = "1"
+
+
+def _incrementar(clave: str) -> str:
+    # En cascadas la fila padre puede no existir ya: sin clave no se cuenta nada
+    return (
+        f"INSERT INTO versiones (clave, version) SELECT {clave}, 1 WHERE {clave} IS NOT NULL "
+        "ON CONFLICT(clave) DO UPDATE SET version = version + 1;"
+    )
+
+
+def _cuerpo(entidad: str, fila_id: Optional[str], *refs: str) -> str:
+    # En UPDATE se cuentan la fila anterior y la nueva (p. ej. una nota que cambia de alumno)
+    sentencias = [_incrementar(f"'{entidad}'")]
+    if fila_id:
+        sentencias.extend(_incrementar(f"'{entidad}:' || {fila_id.format(r=ref)}") for ref in refs)
+    return " ".join(sentencias)
+
+
+def ensure_version_counters() -> None:
+    """Crear los triggers que mantienen los contadores de versión.
+
+    Se ejecuta en cada arranque: ensure_foreign_keys reconstruye tablas y con ellas se pierden sus triggers.
+    """
+    from database import engine
+
+    with engine.begin() as conn:
+        for tabla, entidad, fila_id, columnas in _CONTADORES:
+            actualizacion = f"UPDATE OF {columnas}" if columnas else "UPDATE"
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS versiones_{tabla}_insert AFTER INSERT ON {tabla} "
+                f"BEGIN {_cuerpo(entidad, fila_id, 'NEW')} END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS versiones_{tabla}_update AFTER {actualizacion} ON {tabla} "
+                f"BEGIN {_cuerpo(entidad, fila_id, 'OLD', 'NEW')} END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS versiones_{tabla}_delete AFTER DELETE ON {tabla} "
+                f"BEGIN {_cuerpo(entidad, fila_id, 'OLD')} END"
+            ))
+
+
+def get_versions(db: Session, claves: Iterable[str]) -> Dict[str, int]:
+    """Versión actual de cada clave (0 si nunca cambió) en una sola consulta"""
+    claves = sorted(set(claves))
+    versiones = dict(
+        db.query(VersionEntidad.clave, VersionEntidad.version).filter(VersionEntidad.clave.in_(claves))
+    )
+    return {clave: versiones.get(clave, 0) for clave in claves}
+
+
+def build_etag(nombre: str, versiones: Dict[str, int], *alcance) -> str:
+    """ETag débil a partir de las versiones de las que depende la respuesta y de su alcance
+    (usuario, parámetros de la consulta): dos respuestas distintas nunca comparten ETag."""
+    firma = repr((_FORMATO, sorted(versiones.items()), alcance)).encode("utf-8")
+    return f'W/"{nombre}-{hashlib.sha1(firma).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparación débil: W/"x" y "x" son equivalentes
+    propio = etag[2:] if etag.startswith("W/") else etag
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if (candidato[2:] if candidato.startswith("W/") else candidato) == propio:
+            return True
+    return False
+
+
+def not_modified(request: Request, response: Response, db: Session, nombre: str,
+                 claves: Iterable[str], *alcance) -> Optional[Response]:
+    """Poner ETag y Cache-Control en `response` y devolver un 304 si el cliente ya tiene esta versión.
+
+    Se llama al principio del endpoint, antes de las consultas costosas: solo cuesta leer los contadores.
+    Si el endpoint devuelve su propio Response, copiar `response.headers` en él.
+    """
+    etag = build_etag(nombre, get_versions(db, claves), *alcance)
+    # private: la respuesta depende del usuario; no-cache: el navegador revalida con If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
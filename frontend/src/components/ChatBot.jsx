@@ -25,8 +25,11 @@ export default function ChatBot() {
     setInput('');
     setLoading(true);
     try {
-      const { reply } = await chatService.send(role, newMessages);
-      setMessages([...newMessages, { role: 'assistant', content: reply }]);
+      let reply = '';
+      await chatService.stream(role, newMessages, (delta) => {
+        reply += delta;
+        setMessages([...newMessages, { role: 'assistant', content: reply }]);
+      });
     } catch (e) {
       // Mostrar detalle del backend si está disponible
       const detail = e?.response?.data?.detail || e?.message || 'Error desconocido';
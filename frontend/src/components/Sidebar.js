@@ -17,12 +17,17 @@ import { useAuth } from '../contexts/AuthContext';
 import { adminService } from '../services/adminService';
 
 const Sidebar = ({ isOpen, onClose }) => {
-  const { user } = useAuth();
+  const { user, takeBootstrap } = useAuth();
   const [config, setConfig] = useState(null);
 
   useEffect(() => {
+    const inicial = takeBootstrap('configuracion');
+    if (inicial) {
+      setConfig(inicial);
+      return;
+    }
     adminService.getConfiguracionPublica().then(setConfig).catch(() => {});
-  }, []);
+  }, [takeBootstrap]);
 
   const getNavigationItems = () => {
     const baseItems = [
@@ -1,4 +1,4 @@
-import React, { createContext, useContext, useState, useEffect } from 'react';
+import React, { createContext, useContext, useState, useEffect, useRef, useCallback } from 'react';
 import { authService } from '../services/authService';
 
 const AuthContext = createContext();
@@ -15,16 +15,34 @@ export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
   const [token, setToken] = useState(localStorage.getItem('token'));
+  // Datos de /bootstrap pendientes de usar por la primera pantalla (cada sección se usa una sola vez)
+  const bootstrapRef = useRef({});
+  // Token con el que ya se cargó /bootstrap: login lo carga antes de guardar el token y initAuth no lo repite
+  const tokenCargadoRef = useRef(null);
+
+  const cargarBootstrap = async (accessToken) => {
+    const { usuario, ...secciones } = await authService.getBootstrap();
+    bootstrapRef.current = secciones;
+    tokenCargadoRef.current = accessToken;
+    setUser(usuario);
+  };
+
+  // Devuelve la sección y la descarta: al volver a la página se consulta al servidor como siempre
+  const takeBootstrap = useCallback((seccion) => {
+    const datos = bootstrapRef.current[seccion];
+    delete bootstrapRef.current[seccion];
+    return datos;
+  }, []);
 
   useEffect(() => {
     const initAuth = async () => {
-      if (token) {
+      if (token && tokenCargadoRef.current !== token) {
         try {
-          const userData = await authService.getCurrentUser();
-          setUser(userData);
+          await cargarBootstrap(token);
         } catch (error) {
           console.error('Error al obtener usuario:', error);
           localStorage.removeItem('token');
+          localStorage.removeItem('refresh_token');
           setToken(null);
         }
       }
@@ -37,14 +55,15 @@ export const AuthProvider = ({ children }) => {
   const login = async (email, password) => {
     try {
       const response = await authService.login(email, password);
-      const { access_token } = response;
+      const { access_token, refresh_token } = response;
       
       localStorage.setItem('token', access_token);
+      if (refresh_token) {
+        localStorage.setItem('refresh_token', refresh_token);
+      }
+      await cargarBootstrap(access_token);
       setToken(access_token);
       
-      const userData = await authService.getCurrentUser();
-      setUser(userData);
-      
       return { success: true };
     } catch (error) {
       return { 
@@ -55,9 +74,16 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      authService.logout(refreshToken).catch(() => {});
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     setToken(null);
     setUser(null);
+    bootstrapRef.current = {};
+    tokenCargadoRef.current = null;
   };
 
   const isAuthenticated = () => {
@@ -80,7 +106,8 @@ export const AuthProvider = ({ children }) => {
     logout,
     isAuthenticated,
     hasRole,
-    hasAnyRole
+    hasAnyRole,
+    takeBootstrap
   };
 
   return (
@@ -13,7 +13,7 @@ import {
 } from 'lucide-react';
 
 const Dashboard = () => {
-  const { user } = useAuth();
+  const { user, takeBootstrap } = useAuth();
   const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
 
@@ -23,18 +23,21 @@ const Dashboard = () => {
         let data = null;
         
         if (user?.rol === 'admin') {
-          data = await adminService.getDashboard();
+          data = takeBootstrap('dashboard') || await adminService.getDashboard();
         } else if (user?.rol === 'docente') {
-          const asignaturas = await docenteService.getMisAsignaturas();
+          const asignaturas = takeBootstrap('asignaturas') || await docenteService.getMisAsignaturas();
           data = {
             total_asignaturas: asignaturas.length,
             total_alumnos: 0, // Se puede calcular sumando alumnos de todas las asignaturas
             total_notas: 0 // Se puede calcular sumando notas de todas las asignaturas
           };
         } else if (user?.rol === 'alumno') {
-          const asignaturas = await alumnoService.getMisAsignaturas();
-          const notas = await alumnoService.getMisNotas();
-          const promedio = await alumnoService.getMiPromedio();
+          // Con /bootstrap ya cargado no hace falta ninguna petición; si no, las tres van en paralelo
+          const [asignaturas, notas, promedio] = await Promise.all([
+            takeBootstrap('asignaturas') || alumnoService.getMisAsignaturas(),
+            takeBootstrap('notas') || alumnoService.getMisNotas(),
+            takeBootstrap('promedio') || alumnoService.getMiPromedio()
+          ]);
           data = {
             total_asignaturas: asignaturas.length,
             total_notas: notas.length,
@@ -51,7 +54,7 @@ const Dashboard = () => {
     };
 
     loadDashboardData();
-  }, [user]);
+  }, [user, takeBootstrap]);
 
   const getRoleDisplayName = (role) => {
     switch (role) {
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { adminService } from '../../services/adminService';
+import { eventosService } from '../../services/eventosService';
 import { BookOpen, User, GraduationCap, Calendar, Search, Eye, ChevronDown, ChevronRight } from 'lucide-react';
 
 const AdminNotas = () => {
@@ -23,18 +24,20 @@ const AdminNotas = () => {
 
   useEffect(() => {
     loadNotas();
+    // Publicaciones en vivo: recargar sin mostrar el indicador de carga
+    return eventosService.suscribir(() => loadNotas(false));
   }, []);
 
-  const loadNotas = async () => {
+  const loadNotas = async (mostrarCarga = true) => {
     try {
-      setLoading(true);
+      if (mostrarCarga) setLoading(true);
       const data = await adminService.getNotas();
       setNotas(data);
     } catch (error) {
       console.error('Error al cargar notas:', error);
-      alert('Error al cargar las notas');
+      if (mostrarCarga) alert('Error al cargar las notas');
     } finally {
-      setLoading(false);
+      if (mostrarCarga) setLoading(false);
     }
   };
 
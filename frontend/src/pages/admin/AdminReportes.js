@@ -5,27 +5,34 @@ import api from '../../services/api';
 import { jsPDF } from 'jspdf';
 import autoTable from 'jspdf-autotable';
 
+const PAGE_SIZE = 50;
+
 const AdminReportes = () => {
   const navigate = useNavigate();
   const [reportes, setReportes] = useState([]);
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
+  // El backend pagina el listado y devuelve el total en X-Total-Count
+  const fetchReportes = async (skip = 0) => {
+    setLoading(true);
+    setError(null);
+    try {
+      const resp = await api.get('/admin/reportes', { params: { skip, limit: PAGE_SIZE } });
+      const pagina = resp.data || [];
+      setReportes((prev) => (skip === 0 ? pagina : [...prev, ...pagina]));
+      setTotal(parseInt(resp.headers['x-total-count'], 10) || 0);
+    } catch (err) {
+      console.error('Error al cargar reportes:', err);
+      setError('No se pudieron cargar los reportes.');
+    } finally {
+      setLoading(false);
+    }
+  };
+
   useEffect(() => {
-    const fetchReportes = async () => {
-      setLoading(true);
-      setError(null);
-      try {
-        const resp = await api.get('/admin/reportes');
-        setReportes(resp.data || []);
-      } catch (err) {
-        console.error('Error al cargar reportes:', err);
-        setError('No se pudieron cargar los reportes.');
-      } finally {
-        setLoading(false);
-      }
-    };
-    fetchReportes();
+    fetchReportes(0);
   }, []);
 
   const handleDescargar = async (reporte) => {
@@ -147,6 +154,7 @@ const AdminReportes = () => {
     try {
       await api.delete(`/admin/reportes/${reporte.id}`);
       setReportes((prev) => prev.filter((x) => x.id !== reporte.id));
+      setTotal((prev) => Math.max(prev - 1, 0));
     } catch (err) {
       console.error('Error al eliminar reporte:', err);
       alert('No fue posible eliminar el reporte.');
@@ -229,6 +237,17 @@ const AdminReportes = () => {
             </tbody>
           </table>
         </div>
+        {reportes.length < total && (
+          <div className="flex justify-center mt-4">
+            <button
+              className="px-4 py-2 rounded bg-blue-600 text-white hover:bg-blue-700 disabled:opacity-50"
+              onClick={() => fetchReportes(reportes.length)}
+              disabled={loading}
+            >
+              Cargar más ({reportes.length} de {total})
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
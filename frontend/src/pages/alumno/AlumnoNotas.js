@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { FileText, TrendingUp, Award, BookOpen, Search, ArrowLeft, ChevronDown, ChevronRight } from 'lucide-react';
 import { alumnoService } from '../../services/alumnoService';
+import { eventosService } from '../../services/eventosService';
 
 const AlumnoNotas = () => {
   const { asignaturaId } = useParams();
@@ -17,6 +18,8 @@ const AlumnoNotas = () => {
 
   useEffect(() => {
     loadData();
+    // Recargar cuando el docente publique o despublique notas, en lugar de consultar periódicamente
+    return eventosService.suscribir(() => loadData());
   }, []);
 
   const loadData = async () => {
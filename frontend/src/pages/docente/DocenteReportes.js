@@ -109,12 +109,11 @@ const DocenteReportes = () => {
       // Encontrar el tipo de evaluación seleccionado
       const tipoEvaluacionInfo = tiposEvaluacion.find(t => t.id === selectedTipoEvaluacion);
       
-      // Obtener el reporte actual
-      const reporteResponse = await api.get(`/docente/reportes/${selectedAsignatura}/${tipoEvaluacionInfo?.nombre || ''}`);
-      const reporteData = reporteResponse.data || {};
-      
-      // Enviar el reporte al administrador
-      await api.post('/docente/reportes/enviar-admin', reporteData);
+      // El servidor genera el archivo a partir de la asignatura y el tipo de evaluación
+      await api.post('/docente/reportes/enviar-admin', {
+        asignatura_id: Number(selectedAsignatura),
+        tipo_evaluacion: tipoEvaluacionInfo?.nombre || '',
+      });
       alert('Reporte enviado correctamente al administrador.');
     } catch (error) {
       console.error('Error al enviar reporte:', error);
@@ -145,17 +144,11 @@ const DocenteReportes = () => {
     }
     setSendingEmail(true);
     try {
+      const tipoEvaluacionInfo = tiposEvaluacion.find(t => t.id === selectedTipoEvaluacion);
       const payload = {
         email: emailToSend,
-        asignatura: reporteData.asignatura,
-        tipo_evaluacion: reporteData.tipoEvaluacion,
-        reporte: (reporteData.alumnos || []).map((al) => ({
-          alumno: al.nombre_alumno,
-          ciclo: al.ciclo,
-          asignatura: al.asignatura,
-          tipo_evaluacion: reporteData.tipoEvaluacion,
-          calificacion: al.calificacion === '-' ? '' : al.calificacion,
-        })),
+        asignatura_id: Number(selectedAsignatura),
+        tipo_evaluacion: tipoEvaluacionInfo?.nombre || reporteData.tipoEvaluacion,
       };
       await api.post('/docente/reportes/enviar-email', payload);
       alert(`Reporte enviado correctamente a ${emailToSend}.`);
@@ -33,12 +33,50 @@ api.interceptors.request.use(
   }
 );
 
+// Renovación de sesión: una sola petición de refresh en vuelo, compartida por
+// todas las peticiones que reciban 401 al mismo tiempo (el backend rota el token
+// y revoca la sesión si el mismo refresh token se usa dos veces).
+let refreshPromise = null;
+
+const refreshSession = () => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) {
+      return Promise.reject(new Error('Sin refresh token'));
+    }
+    refreshPromise = axios
+      .post(`${API_BASE_URL}/auth/refresh`, { refresh_token: refreshToken })
+      .then(({ data }) => {
+        localStorage.setItem('token', data.access_token);
+        localStorage.setItem('refresh_token', data.refresh_token);
+        return data.access_token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Interceptor para manejar respuestas de error
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
-    if (error.response?.status === 401) {
+  async (error) => {
+    const original = error.config;
+    const isAuthCall = original?.url?.startsWith('/auth/login') || original?.url?.startsWith('/auth/refresh');
+    if (error.response?.status === 401 && original && !original._retry && !isAuthCall) {
+      original._retry = true;
+      try {
+        const token = await refreshSession();
+        original.headers.Authorization = `Bearer ${token}`;
+        return api(original);
+      } catch (_) {
+        // sin sesión renovable: continuar con el cierre de sesión
+      }
+    }
+    if (error.response?.status === 401 && !isAuthCall) {
       localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
       window.location.href = '/login';
     }
     return Promise.reject(error);
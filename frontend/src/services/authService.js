@@ -15,11 +15,22 @@ export const authService = {
     return response.data;
   },
 
+  async logout(refreshToken) {
+    const response = await api.post('/auth/logout', { refresh_token: refreshToken });
+    return response.data;
+  },
+
   async getCurrentUser() {
     const response = await api.get('/auth/me');
     return response.data;
   },
 
+  // Usuario, configuración y datos iniciales del dashboard de su rol en una sola petición
+  async getBootstrap() {
+    const response = await api.get('/bootstrap');
+    return response.data;
+  },
+
   async register(userData) {
     const response = await api.post('/auth/register', userData);
     return response.data;
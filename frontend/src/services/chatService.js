@@ -1,13 +1,64 @@
 import api from './api';
 
+const buildPayload = (messages, options) => ({
+  messages,
+  temperature: options.temperature ?? 0.2,
+  model: options.model,
+});
+
 export const chatService = {
   send: async (role, messages, options = {}) => {
-    const payload = {
-      messages,
-      temperature: options.temperature ?? 0.2,
-      model: options.model,
-    };
+    const payload = buildPayload(messages, options);
     const { data } = await api.post(`/chat/${role}`, payload);
     return data; // { reply }
   },
-};
\ No newline at end of file
+
+  // Respuesta en streaming (SSE): llama a onDelta con cada fragmento y devuelve el texto completo.
+  // Si el streaming no está disponible (o la sesión expiró), se usa la ruta normal.
+  stream: async (role, messages, onDelta, options = {}) => {
+    const token = localStorage.getItem('token');
+    let response;
+    try {
+      response = await fetch(`${api.defaults.baseURL}/chat/${role}/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          ...(token ? { Authorization: `Bearer ${token}` } : {}),
+        },
+        body: JSON.stringify(buildPayload(messages, options)),
+        signal: options.signal,
+      });
+    } catch (e) {
+      if (e.name === 'AbortError') throw e;
+      response = null;
+    }
+    if (!response || !response.ok || !response.body) {
+      const { reply } = await chatService.send(role, messages, options);
+      onDelta(reply);
+      return reply;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      for (const raw of events) {
+        const lines = raw.split('\n');
+        const event = lines.find((l) => l.startsWith('event: '))?.slice(7);
+        const data = JSON.parse(lines.find((l) => l.startsWith('data: '))?.slice(6) || '{}');
+        if (event === 'error') throw new Error(data.detail);
+        if (data.delta) {
+          reply += data.delta;
+          onDelta(data.delta);
+        }
+      }
+    }
+    return reply;
+  },
+};
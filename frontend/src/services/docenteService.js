@@ -56,12 +56,6 @@ export const docenteService = {
     return response.data;
   },
   
-  // Eliminar promedios cuando no hay notas
-  async eliminarPromedios(alumnoId, asignaturaId) {
-    const response = await api.delete(`/docente/eliminar-promedios/${alumnoId}/${asignaturaId}`);
-    return response.data;
-  },
-
   async despublicarNota(notaId) {
     const response = await api.put(`/docente/notas/${notaId}/despublicar`);
     return response.data;
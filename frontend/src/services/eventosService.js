@@ -0,0 +1,86 @@
+import api from './api';
+
+// Eventos en vivo de publicación de notas (SSE). Una sola conexión por pestaña,
+// compartida por todas las páginas suscritas; se abre con el primer suscriptor y
+// se cierra con el último. Se usa fetch (y no EventSource) para enviar el token.
+const listeners = new Set();
+let controller = null;
+
+const RECONEXION_MIN_MS = 1000;
+const RECONEXION_MAX_MS = 30000;
+
+const emitir = (evento, data) => {
+  listeners.forEach((listener) => {
+    try {
+      listener(evento, data);
+    } catch (e) {
+      console.error('Error al procesar evento:', e);
+    }
+  });
+};
+
+const conectar = async (signal) => {
+  let espera = RECONEXION_MIN_MS;
+  let reconexion = false;
+  while (!signal.aborted) {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(`${api.defaults.baseURL}/eventos/stream`, {
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+        signal,
+      });
+      // 403/404: el rol no recibe eventos, no tiene sentido reintentar
+      if (response.status === 403 || response.status === 404) return;
+      if (response.ok && response.body) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const eventos = buffer.split('\n\n');
+          buffer = eventos.pop();
+          for (const raw of eventos) {
+            const lines = raw.split('\n');
+            const evento = lines.find((l) => l.startsWith('event: '))?.slice(7);
+            if (!evento) continue;
+            const data = JSON.parse(lines.find((l) => l.startsWith('data: '))?.slice(6) || '{}');
+            espera = RECONEXION_MIN_MS;
+            if (evento === 'conectado') {
+              // Tras una reconexión pudieron perderse eventos: las páginas recargan igual que con `reiniciar`
+              if (reconexion) emitir('reiniciar', data);
+              reconexion = true;
+              continue;
+            }
+            emitir(evento, data);
+          }
+        }
+      }
+    } catch (e) {
+      if (signal.aborted) return;
+    }
+    // Conexión caída o token vencido (lo renueva la próxima petición de api): reintentar con espera creciente
+    await new Promise((resolve) => setTimeout(resolve, espera));
+    espera = Math.min(espera * 2, RECONEXION_MAX_MS);
+  }
+};
+
+export const eventosService = {
+  // Suscribirse a los eventos; devuelve la función para cancelar la suscripción.
+  // `listener(evento, data)` recibe notas_publicadas, notas_despublicadas y reiniciar.
+  suscribir(listener) {
+    listeners.add(listener);
+    if (!controller) {
+      controller = new AbortController();
+      conectar(controller.signal);
+    }
+    return () => {
+      listeners.delete(listener);
+      if (listeners.size === 0 && controller) {
+        controller.abort();
+        controller = null;
+      }
+    };
+  },
+};